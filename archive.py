@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from debug import get_app_dir, log
+
+# yt-dlp writes "<extractor> <id>" lines; every video we handle comes from YouTube
+YTDLP_EXTRACTOR = 'youtube'
+
+_lock = threading.Lock()
+_entries = None
+
+def get_archive_dir():
+    archive_dir = os.path.join(get_app_dir(), 'archive')
+    os.makedirs(archive_dir, exist_ok=True)
+    return archive_dir
+
+def get_index_path():
+    """Our own index: one JSON line per finished download, with its output file"""
+    return os.path.join(get_archive_dir(), 'downloads.jsonl')
+
+def get_ytdlp_archive_path(mode, resolution=None):
+    """yt-dlp --download-archive file for one mode/resolution combination"""
+    name = f"archive-{mode}-{resolution}.txt" if resolution else f"archive-{mode}.txt"
+    return os.path.join(get_archive_dir(), name)
+
+def _read_ytdlp_archive(path):
+    ids = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[0] == YTDLP_EXTRACTOR:
+                    ids.append(parts[1])
+    except FileNotFoundError:
+        pass
+    return ids
+
+def load():
+    """Load the archive into memory (done once; later lookups are O(1))"""
+    global _entries
+    with _lock:
+        if _entries is not None:
+            return
+        entries = {}
+        # Entries from yt-dlp's own archive files (batch runs) have no known path
+        for name in os.listdir(get_archive_dir()):
+            if name.startswith('archive-') and name.endswith('.txt'):
+                key = name[len('archive-'):-len('.txt')].split('-', 1)
+                mode, resolution = key[0], (key[1] if len(key) > 1 else None)
+                for video_id in _read_ytdlp_archive(os.path.join(get_archive_dir(), name)):
+                    entries[(video_id, mode, resolution)] = None
+        try:
+            with open(get_index_path(), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[(record['id'], record['mode'], record.get('resolution'))] = record.get('path')
+        except FileNotFoundError:
+            pass
+        _entries = entries
+    log(f"Download archive loaded: {len(entries)} entries")
+
+def lookup(video_id, mode, resolution=None):
+    """Return (True, path) if this video was already downloaded in this mode.
+
+    path is None when only yt-dlp's archive knows about it. Entries whose
+    file has since been deleted are treated as not downloaded, and dropped
+    from yt-dlp's archive too so that yt-dlp downloads the video again.
+    """
+    load()
+    key = (video_id, mode, resolution)
+    with _lock:
+        if key not in _entries:
+            return False, None
+        path = _entries[key]
+        if path is not None and not os.path.exists(path):
+            del _entries[key]
+            _forget_ytdlp(video_id, mode, resolution)
+            return False, None
+    return True, path
+
+def _forget_ytdlp(video_id, mode, resolution=None):
+    """Remove a video from yt-dlp's archive file (called with _lock held)"""
+    path = get_ytdlp_archive_path(mode, resolution)
+    entry = [YTDLP_EXTRACTOR, video_id]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        kept = [line for line in lines if line.split() != entry]
+        if len(kept) == len(lines):
+            return
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+        os.replace(temp_path, path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log(f"Could not update yt-dlp archive: {e}")
+
+def record(video_id, mode, resolution, path):
+    """Remember a finished download"""
+    load()
+    line = json.dumps({
+        "id": video_id, "mode": mode, "resolution": resolution,
+        "path": path, "time": time.time()
+    })
+    with _lock:
+        _entries[(video_id, mode, resolution)] = path
+        try:
+            with open(get_index_path(), 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            log(f"Could not write download archive: {e}")
+
+def record_ytdlp(video_id, mode, resolution=None):
+    """Add a video to yt-dlp's archive file for downloads finished outside yt-dlp"""
+    with _lock:
+        try:
+            with open(get_ytdlp_archive_path(mode, resolution), 'a', encoding='utf-8') as f:
+                f.write(f"{YTDLP_EXTRACTOR} {video_id}\n")
+        except Exception as e:
+            log(f"Could not write yt-dlp archive: {e}")
@@ -0,0 +1,135 @@
+from debug import log
+
+# Audio outputs offered by the audio mode. 'mp3' always re-encodes; the
+# others keep the source stream and only remux it when its codec fits the
+# container, so no ffmpeg encode runs at all.
+MP3 = 'mp3'
+BEST = 'best'
+M4A = 'm4a'
+OPUS = 'opus'
+OGG = 'ogg'
+AUDIO_FORMATS = (MP3, BEST, M4A, OPUS, OGG)
+DEFAULT_AUDIO_FORMAT = MP3
+
+# Source codecs each container takes without transcoding
+COPY_CODECS = {
+    M4A: ('aac',),
+    OPUS: ('opus',),
+    OGG: ('opus', 'vorbis'),
+}
+# yt-dlp --audio-format used when the source has to be transcoded
+TRANSCODE_TARGETS = {MP3: 'mp3', BEST: 'mp3', M4A: 'm4a', OPUS: 'opus', OGG: 'vorbis'}
+# What 'best' turns each source codec into (yt-dlp copies these)
+BEST_EXTENSIONS = {'aac': 'm4a', 'opus': 'opus', 'vorbis': 'ogg', 'mp3': 'mp3', 'flac': 'flac'}
+
+def normalize_codec(acodec):
+    """'mp4a.40.2' -> 'aac', 'opus' -> 'opus'; None for unknown or no audio"""
+    if not acodec or acodec == 'none':
+        return None
+    acodec = acodec.lower()
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+    return acodec.split('.')[0]
+
+def best_audio_format(info, codecs=None):
+    """Highest bitrate audio-only format in info, optionally limited to some codecs"""
+    best = None
+    for f in (info or {}).get('formats') or []:
+        if f.get('vcodec') not in (None, 'none'):
+            continue
+        codec = normalize_codec(f.get('acodec'))
+        if codec is None or (codecs and codec not in codecs):
+            continue
+        if best is None or (f.get('abr') or f.get('tbr') or 0) > (best.get('abr') or best.get('tbr') or 0):
+            best = f
+    return best
+
+class AudioPlan:
+    """How to produce one audio output.
+
+    format_spec and args are for a yt-dlp run that does everything itself.
+    When the source format is known, ext and ffmpeg_args describe the same
+    conversion as a separate ffmpeg run on the downloaded raw stream.
+    """
+
+    def __init__(self, audio_format, format_spec, args, transcode, source_codec=None,
+                 ext=None, ffmpeg_args=None):
+        self.audio_format = audio_format
+        self.format_spec = format_spec
+        self.args = args
+        self.transcode = transcode
+        self.source_codec = source_codec
+        self.ext = ext
+        self.ffmpeg_args = ffmpeg_args
+
+    def __repr__(self):
+        action = 'transcode' if self.transcode else 'copy'
+        return f"<AudioPlan {self.audio_format} {action} from {self.source_codec} ({self.format_spec})>"
+
+# ffmpeg arguments matching yt-dlp's FFmpegExtractAudio at --audio-quality 0
+COPY_ARGS = {
+    'aac': ['-vn', '-acodec', 'copy', '-bsf:a', 'aac_adtstoasc'],
+}
+ENCODE_ARGS = {
+    'mp3': ('mp3', ['-vn', '-acodec', 'libmp3lame', '-q:a', '0']),
+    'm4a': ('m4a', ['-vn', '-acodec', 'aac', '-q:a', '4']),
+    'opus': ('opus', ['-vn', '-acodec', 'libopus']),
+    'vorbis': ('ogg', ['-vn', '-acodec', 'libvorbis', '-q:a', '10']),
+}
+
+def _copy_plan(audio_format, source, ext, args):
+    codec = normalize_codec(source['acodec'])
+    return AudioPlan(audio_format, source['format_id'], args, False, codec,
+                     ext, COPY_ARGS.get(codec, ['-vn', '-acodec', 'copy']))
+
+def _transcode_plan(audio_format, source, args):
+    ext, ffmpeg_args = ENCODE_ARGS[TRANSCODE_TARGETS[audio_format]]
+    if source is None:
+        return AudioPlan(audio_format, 'bestaudio/best', args, True)
+    return AudioPlan(audio_format, source['format_id'], args, True, normalize_codec(source['acodec']),
+                     ext, ffmpeg_args)
+
+def plan(info, audio_format=DEFAULT_AUDIO_FORMAT):
+    """Choose copy or transcode for audio_format from the source codecs in info.
+
+    info may be None (metadata not fetched yet); the plan then relies on
+    yt-dlp's own format selection and copies whenever it can.
+    """
+    if audio_format not in AUDIO_FORMATS:
+        log(f"Unknown audio format {audio_format!r}, using {DEFAULT_AUDIO_FORMAT}")
+        audio_format = DEFAULT_AUDIO_FORMAT
+    transcode_args = ['--extract-audio', '--audio-format', TRANSCODE_TARGETS[audio_format],
+                      '--audio-quality', '0']
+
+    if audio_format == MP3:
+        source = best_audio_format(info)
+        if source is not None and normalize_codec(source['acodec']) == 'mp3':
+            return _copy_plan(MP3, source, 'mp3', ['--extract-audio', '--audio-format', 'mp3'])
+        return _transcode_plan(MP3, source, transcode_args)
+
+    if audio_format == BEST:
+        source = best_audio_format(info, BEST_EXTENSIONS)
+        if source is not None:
+            # yt-dlp's 'best' keeps the stream and picks the matching container
+            return _copy_plan(BEST, source, BEST_EXTENSIONS[normalize_codec(source['acodec'])],
+                              ['--extract-audio', '--audio-format', 'best'])
+        if info is None:
+            return AudioPlan(BEST, 'bestaudio/best', ['--extract-audio', '--audio-format', 'best'], False)
+        return _transcode_plan(BEST, best_audio_format(info), transcode_args)
+
+    if audio_format == OGG:
+        # Opus/Vorbis in an .ogg file: a plain remux, yt-dlp's extractor would re-encode to Vorbis
+        copy_args = ['--remux-video', 'ogg']
+    else:
+        copy_args = ['--extract-audio', '--audio-format', audio_format]
+    source = best_audio_format(info, COPY_CODECS[audio_format])
+    if source is not None:
+        return _copy_plan(audio_format, source, audio_format, copy_args)
+    if info is None:
+        format_spec = '/'.join(f"bestaudio[acodec^={c if c != 'aac' else 'mp4a'}]"
+                               for c in COPY_CODECS[audio_format])
+        if audio_format != OGG:
+            # yt-dlp transcodes other codecs into m4a/opus itself; .ogg is a plain remux
+            format_spec += '/bestaudio/best'
+        return AudioPlan(audio_format, format_spec, copy_args, False)
+    return _transcode_plan(audio_format, best_audio_format(info), transcode_args)
@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from debug import get_app_dir, log
+
+# Total download budget in bytes/s shared by all jobs (None = unlimited)
+DEFAULT_LIMIT = None
+# Never give a job less than this, however many are running
+MIN_JOB_RATE = 64 * 1024
+# A running job is restarted with its new rate only if the rate changed by
+# more than this fraction, and not more often than REBALANCE_MIN_INTERVAL
+REBALANCE_THRESHOLD = 0.5
+REBALANCE_MIN_INTERVAL = 30.0
+# How often shares and the time-of-day schedule are re-checked while jobs run
+CHECK_INTERVAL = 15.0
+
+RATE_UNITS = {'': 1, 'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+UNLIMITED = ('', 'none', 'unlimited', 'off', '0')
+
+def get_settings_path():
+    return os.path.join(get_app_dir(), 'bandwidth.json')
+
+def parse_rate(text):
+    """'512K', '2M', '1.5MB/s' or '300000' -> bytes/s; 'unlimited' or '0' -> None.
+
+    Raises ValueError for anything else.
+    """
+    text = str(text).strip()
+    if text.lower() in UNLIMITED:
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?', text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"not a rate: {text!r}")
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+
+def parse_schedule(text):
+    """'0-7:unlimited,18-23:512K' -> [(0, 7, None), (18, 23, 524288)]; raises ValueError"""
+    schedule = []
+    for entry in filter(None, (part.strip() for part in str(text).split(','))):
+        match = re.fullmatch(r'(\d{1,2})-(\d{1,2}):(.*)', entry)
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 24:
+            raise ValueError(f"not a schedule entry (START-END:RATE): {entry!r}")
+        schedule.append((int(match.group(1)), int(match.group(2)), parse_rate(match.group(3))))
+    return schedule
+
+def format_rate(rate):
+    if rate is None:
+        return 'unlimited'
+    for unit in ('G', 'M', 'K'):
+        if rate >= RATE_UNITS[unit] and rate % RATE_UNITS[unit] == 0:
+            return f"{rate // RATE_UNITS[unit]}{unit}"
+    return str(int(rate))
+
+class _Share:
+    def __init__(self, weight, on_change):
+        self.weight = weight
+        self.on_change = on_change
+        # Target rate, and the rate the job's process was started with
+        self.rate = None
+        self.applied_rate = None
+        self.applied_at = time.monotonic()
+        self.started = False
+
+class BandwidthGovernor:
+    """Splits a global bandwidth budget between running downloads.
+
+    Each job gets a weighted fair share of the current limit, which is
+    applied to its yt-dlp process with --limit-rate. yt-dlp cannot change
+    the rate of a running download, so when shares move a lot the job's
+    on_change callback is called and it is expected to restart (yt-dlp
+    continues from the .part file).
+
+    The limit can follow a time-of-day schedule: a list of
+    (start_hour, end_hour, limit) entries; hours wrap around midnight and
+    limit None means unthrottled. Outside every entry the base limit is used.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, schedule=None, path=None):
+        self.limit = limit
+        self.schedule = list(schedule or [])
+        self.path = path or get_settings_path()
+        self._shares = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def load(self):
+        """Apply the limit and schedule saved by save(), if any"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log(f"Could not read bandwidth settings: {e}")
+            return
+        self.set_limit(settings.get('limit'))
+        self.set_schedule([tuple(entry) for entry in settings.get('schedule') or []])
+        log(f"Bandwidth limit: {format_rate(self.limit)}, schedule: {self.schedule}")
+
+    def save(self):
+        """Keep the current limit and schedule for the next start"""
+        with self._lock:
+            settings = {'limit': self.limit, 'schedule': [list(entry) for entry in self.schedule]}
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(settings, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log(f"Could not save bandwidth settings: {e}")
+
+    def settings(self):
+        """The base limit and the schedule, as JSON-friendly values"""
+        with self._lock:
+            return {'limit': self.limit, 'current_limit': self.current_limit(),
+                    'schedule': [list(entry) for entry in self.schedule]}
+
+    def set_limit(self, limit):
+        """Change the base limit (bytes/s, None = unlimited)"""
+        with self._lock:
+            self.limit = limit
+        self.rebalance()
+
+    def set_schedule(self, schedule):
+        with self._lock:
+            self.schedule = list(schedule or [])
+            if self._shares:
+                self._ensure_timer()
+        self.rebalance()
+
+    def current_limit(self, now=None):
+        """Limit in effect at the given time (default: now)"""
+        hour = (now or datetime.now()).hour
+        for start, end, limit in self.schedule:
+            in_window = start <= hour < end if start <= end else (hour >= start or hour < end)
+            if in_window:
+                return limit
+        return self.limit
+
+    def register(self, job_id, weight=1.0, on_change=None):
+        """Add a running job; returns its rate in bytes/s (None = unlimited)"""
+        with self._lock:
+            self._shares[job_id] = _Share(weight, on_change)
+            self._ensure_timer()
+        self.rebalance()
+        with self._lock:
+            share = self._shares[job_id]
+            share.applied_rate = share.rate
+            share.applied_at = time.monotonic()
+            share.started = True
+            return share.rate
+
+    def unregister(self, job_id):
+        with self._lock:
+            self._shares.pop(job_id, None)
+        self.rebalance()
+
+    def rate_for(self, job_id):
+        """Current rate of a job; jobs that are not registered may use the whole limit"""
+        with self._lock:
+            share = self._shares.get(job_id)
+            if share is None:
+                return self.current_limit()
+            return share.rate
+
+    def rate_args(self, job_id=None):
+        """yt-dlp arguments that apply the job's share"""
+        rate = self.rate_for(job_id)
+        if rate is None:
+            return []
+        return ["--limit-rate", str(int(rate))]
+
+    def rebalance(self):
+        """Recompute all shares and notify jobs whose rate changed a lot"""
+        now = time.monotonic()
+        notify = []
+        with self._lock:
+            limit = self.current_limit()
+            total_weight = sum(s.weight for s in self._shares.values()) or 1.0
+            for job_id, share in self._shares.items():
+                if limit is None:
+                    share.rate = None
+                else:
+                    share.rate = max(MIN_JOB_RATE, limit * share.weight / total_weight)
+                if not share.started or share.on_change is None or share.rate == share.applied_rate:
+                    continue
+                old, rate = share.applied_rate, share.rate
+                if old is None or rate is None or abs(rate - old) / old > REBALANCE_THRESHOLD:
+                    if now - share.applied_at >= REBALANCE_MIN_INTERVAL:
+                        share.applied_rate = rate
+                        share.applied_at = now
+                        notify.append((job_id, share.on_change, rate))
+
+        for job_id, callback, rate in notify:
+            log(f"Bandwidth share of job {job_id} is now {rate or 'unlimited'} B/s")
+            try:
+                callback(rate)
+            except Exception as e:
+                log(f"Bandwidth change callback failed: {e}")
+
+    def _ensure_timer(self):
+        # Called with self._lock held
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._watch, daemon=True)
+            self._timer.start()
+
+    def _watch(self):
+        """Apply schedule changes and rate changes that were held back by REBALANCE_MIN_INTERVAL"""
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            with self._lock:
+                if not self._shares:
+                    self._timer = None
+                    return
+            self.rebalance()
+
+# Shared governor for all downloads
+governor = BandwidthGovernor()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Audio post-processing benchmark: MP3 re-encode vs. stream copy.
+
+Runs the ffmpeg commands the app runs for the audio mode (built by
+audio.plan) on an AAC (m4a) and an Opus (webm) source and reports wall time
+and the CPU time (user + system) of ffmpeg for each. Sources are synthesised with
+ffmpeg unless given with --m4a / --webm. Results are written to
+benchmarks/results/audio.json.
+
+Usage: python benchmarks/bench_audio.py [--runs N] [--seconds S] [--m4a FILE] [--webm FILE]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(ROOT, 'benchmarks', 'results', 'audio.json')
+
+# Source kind -> (its codec as yt-dlp reports it, the audio.AUDIO_FORMATS to measure)
+SOURCES = {
+    'm4a': ('mp4a.40.2', ('mp3', 'm4a')),
+    'webm': ('opus', ('mp3', 'opus', 'ogg')),
+}
+
+def outputs(kind):
+    """(name, output extension, ffmpeg arguments) of each measured output, as audio.plan builds them"""
+    import audio
+    codec, audio_formats = SOURCES[kind]
+    info = {'formats': [{'format_id': 'source', 'vcodec': 'none', 'acodec': codec, 'abr': 128}]}
+    result = []
+    for audio_format in audio_formats:
+        plan = audio.plan(info, audio_format)
+        result.append((f"{audio_format} {'transcode' if plan.transcode else 'copy'}", plan.ext, plan.ffmpeg_args))
+    return result
+
+def make_source(ffmpeg, path, seconds):
+    """Synthesise a stereo music-like test track"""
+    codec = ['-c:a', 'aac', '-b:a', '128k'] if path.endswith('.m4a') else ['-c:a', 'libopus', '-b:a', '128k']
+    subprocess.run(
+        [ffmpeg, '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+         '-f', 'lavfi', '-i', f'anoisesrc=duration={seconds}:amplitude=0.05',
+         '-filter_complex', 'amix=inputs=2,aformat=channel_layouts=stereo', *codec, path],
+        check=True
+    )
+
+def run_sample(ffmpeg, source, ext, args, workdir):
+    """Run one conversion; return (wall seconds, ffmpeg CPU seconds)"""
+    output = os.path.join(workdir, 'out.' + ext)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-i', source, *args, output], check=True)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    os.remove(output)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 2),
+        'min_ms': round(min(values) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seconds', type=int, default=240, help='length of synthesised sources')
+    parser.add_argument('--m4a', help='AAC source file to use instead of a synthesised one')
+    parser.add_argument('--webm', help='Opus source file to use instead of a synthesised one')
+    args = parser.parse_args()
+    sys.path.insert(0, ROOT)
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        print('ffmpeg not found on PATH, nothing to measure')
+        return 1
+
+    results = {'python': sys.version.split()[0], 'runs': args.runs, 'sources': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        sources = {'m4a': args.m4a, 'webm': args.webm}
+        for kind in sources:
+            if not sources[kind]:
+                sources[kind] = os.path.join(workdir, 'source.' + kind)
+                make_source(ffmpeg, sources[kind], args.seconds)
+
+        for kind, source in sources.items():
+            entry = results['sources'][kind] = {'size_bytes': os.path.getsize(source), 'outputs': {}}
+            for name, ext, ffmpeg_args in outputs(kind):
+                samples = [run_sample(ffmpeg, source, ext, ffmpeg_args, workdir) for _ in range(args.runs)]
+                entry['outputs'][name] = {
+                    'wall': summarize([s[0] for s in samples]),
+                    'cpu': summarize([s[1] for s in samples]),
+                }
+                print(f"{kind:<5} {name:<14} wall {entry['outputs'][name]['wall']['median_ms']:>9.2f} ms"
+                      f"   cpu {entry['outputs'][name]['cpu']['median_ms']:>9.2f} ms")
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {RESULTS_FILE}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
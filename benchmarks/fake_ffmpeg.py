@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Stand-in for ffmpeg, for offline benchmarks of the post-processing pipeline.
+
+Takes ffmpeg's command line (-i inputs ... output), spends CPU time in
+proportion to the input size like a real merge or transcode would, and
+writes the concatenated inputs to the output. The files the fake yt-dlp
+produces are not real media, so this is what lets the merge/convert stage
+run end to end; ffmpeg's own speed is measured by benchmarks/bench_audio.py.
+
+  BENCH_FFMPEG_MS_PER_MB  CPU milliseconds per MiB of input (default 5,
+                          about a stream copy; a transcode is 100 and more)
+"""
+
+import os
+import sys
+import time
+
+def burn(seconds):
+    """Keep one core busy for `seconds` of CPU time"""
+    end = time.process_time() + seconds
+    n = 0
+    while time.process_time() < end:
+        for i in range(10000):
+            n += i * i
+    return n
+
+def main():
+    args = sys.argv[1:]
+    if '-version' in args:
+        print('ffmpeg version 6.1-bench Copyright (c) 2000-2023 the FFmpeg developers')
+        return 0
+    inputs = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == '-i']
+    if not inputs or len(args) < 2:
+        print('No input or output given', file=sys.stderr)
+        return 1
+    output = args[-1]
+
+    size = sum(os.path.getsize(path) for path in inputs)
+    burn(size / (1024 * 1024) * float(os.environ.get('BENCH_FFMPEG_MS_PER_MB') or 5) / 1000)
+    with open(output, 'wb') as out:
+        for path in inputs:
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    out.write(block)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
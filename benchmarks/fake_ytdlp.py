@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the yt-dlp executable, for offline benchmarks.
+
+Understands the subset of the command line the app uses:
+
+  -j URL                       print YouTube-like metadata (info JSON)
+  -f A,B / -f A+B -o TEMPLATE  "download" the formats, printing --newline
+                               progress in the --progress-template format
+  --print-to-file after_move:filepath FILE, --load-info-json FILE,
+  --merge-output-format EXT, -x / --extract-audio, --audio-format EXT,
+  --remux-video EXT,
+  -P home:DIR / -P temp:DIR    (for a relative -o template)
+
+Everything else is accepted and ignored. The behaviour is set through the
+environment, so the app's own command lines can be used unchanged:
+
+  BENCH_YTDLP_STARTUP   seconds to sleep before doing anything (yt-dlp's own
+                        start-up is several hundred ms on a phone)
+  BENCH_YTDLP_PROBE     extra seconds -j takes (extraction round trips)
+  BENCH_YTDLP_DURATION  video length in seconds; sets the format sizes
+  BENCH_YTDLP_LINES     progress records per format (default 100)
+  BENCH_YTDLP_RATE      progress records per second (0 = as fast as possible)
+  BENCH_YTDLP_STAMP     if set, every record carries its emit time (time.time())
+                        in the eta field, for latency measurements
+  BENCH_YTDLP_FETCH     if set, formats are really fetched from their URL
+                        (see media_server.py) with one record per block read
+  BENCH_MEDIA_URL       base URL of the media server used in format URLs
+"""
+
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import urllib.request
+
+DEFAULT_DURATION = 212
+DEFAULT_MEDIA_URL = 'http://127.0.0.1:8000'
+READ_SIZE = 64 * 1024
+TEMPLATE_FIELD_RE = re.compile(r'%\(progress\.(\w+)(?:\|[^)]*)?\)j')
+# File extension yt-dlp gives an extracted audio stream, by --audio-format
+# (and for 'best', by the codec it keeps)
+AUDIO_EXTENSIONS = {'aac': 'm4a', 'vorbis': 'ogg', 'mp4a': 'm4a'}
+
+# (format_id, ext, vcodec, acodec, width, height, fps, tbr) roughly as YouTube offers them
+VIDEO_FORMATS = [
+    ('160', 'mp4', 'avc1.4d400c', 'none', 256, 144, 30, 110),
+    ('278', 'webm', 'vp9', 'none', 256, 144, 30, 95),
+    ('394', 'mp4', 'av01.0.00M.08', 'none', 256, 144, 30, 85),
+    ('133', 'mp4', 'avc1.4d4015', 'none', 426, 240, 30, 250),
+    ('242', 'webm', 'vp9', 'none', 426, 240, 30, 220),
+    ('395', 'mp4', 'av01.0.00M.08', 'none', 426, 240, 30, 180),
+    ('134', 'mp4', 'avc1.4d401e', 'none', 640, 360, 30, 550),
+    ('243', 'webm', 'vp9', 'none', 640, 360, 30, 420),
+    ('396', 'mp4', 'av01.0.01M.08', 'none', 640, 360, 30, 350),
+    ('135', 'mp4', 'avc1.4d401f', 'none', 854, 480, 30, 1100),
+    ('244', 'webm', 'vp9', 'none', 854, 480, 30, 780),
+    ('397', 'mp4', 'av01.0.04M.08', 'none', 854, 480, 30, 640),
+    ('136', 'mp4', 'avc1.4d401f', 'none', 1280, 720, 30, 2300),
+    ('247', 'webm', 'vp9', 'none', 1280, 720, 30, 1500),
+    ('398', 'mp4', 'av01.0.05M.08', 'none', 1280, 720, 30, 1200),
+    ('298', 'mp4', 'avc1.4d4020', 'none', 1280, 720, 60, 3400),
+    ('302', 'webm', 'vp9', 'none', 1280, 720, 60, 2600),
+    ('137', 'mp4', 'avc1.640028', 'none', 1920, 1080, 30, 4400),
+    ('248', 'webm', 'vp9', 'none', 1920, 1080, 30, 2700),
+    ('399', 'mp4', 'av01.0.08M.08', 'none', 1920, 1080, 30, 2200),
+    ('299', 'mp4', 'avc1.64002a', 'none', 1920, 1080, 60, 6200),
+    ('303', 'webm', 'vp9', 'none', 1920, 1080, 60, 4400),
+    ('271', 'webm', 'vp9', 'none', 2560, 1440, 30, 9000),
+    ('400', 'mp4', 'av01.0.12M.08', 'none', 2560, 1440, 30, 7000),
+    ('313', 'webm', 'vp9', 'none', 3840, 2160, 30, 18000),
+    ('401', 'mp4', 'av01.0.12M.08', 'none', 3840, 2160, 30, 14000),
+]
+AUDIO_FORMATS = [
+    ('139', 'm4a', 'none', 'mp4a.40.5', 48),
+    ('140', 'm4a', 'none', 'mp4a.40.2', 129),
+    ('249', 'webm', 'none', 'opus', 50),
+    ('250', 'webm', 'none', 'opus', 70),
+    ('251', 'webm', 'none', 'opus', 135),
+]
+CAPTION_LANGUAGES = 120
+CAPTION_EXTS = ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt')
+
+def _signed_url(base, path, size, expire):
+    # Real format URLs carry a long signed query; the size is what the media server serves
+    signature = 'AOq0QJ8wRQIg' + 'x' * 180
+    return (f"{base}/{path}?size={size}&expire={expire}&ei=abcdefghijklmnop&ip=127.0.0.1"
+            f"&id=o-AExampleStreamIdentifier&itag={path.rsplit('/', 1)[-1]}&source=youtube"
+            f"&requiressl=yes&mime=video%2Fmp4&gir=yes&clen={size}&dur=212.000&lmt=1700000000000000"
+            f"&sparams=expire%2Cei%2Cip%2Cid%2Citag%2Csource%2Crequiressl%2Cmime%2Cgir%2Cclen%2Cdur%2Clmt"
+            f"&sig={signature}")
+
+def make_info(video_id, duration=DEFAULT_DURATION, media_url=DEFAULT_MEDIA_URL):
+    """Info JSON shaped (and sized, a few hundred KB) like yt-dlp's for a YouTube video"""
+    expire = int(time.time()) + 6 * 3600
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'Accept-Language': 'en-us,en;q=0.5',
+        'Sec-Fetch-Mode': 'navigate',
+    }
+    formats = []
+    for i in range(4):
+        formats.append({
+            'format_id': f'sb{i}', 'format_note': 'storyboard', 'ext': 'mhtml', 'protocol': 'mhtml',
+            'vcodec': 'none', 'acodec': 'none', 'width': 48 * (i + 1), 'height': 27 * (i + 1),
+            'fps': 0.5, 'url': f"{media_url}/sb/{video_id}/{i}?size=1024",
+            'fragments': [{'url': f"{media_url}/sb/{video_id}/{i}/M{n}.jpg", 'duration': 10.0} for n in range(20)],
+        })
+    for format_id, ext, vcodec, acodec, abr in AUDIO_FORMATS:
+        size = int(abr * 1000 / 8 * duration)
+        formats.append({
+            'format_id': format_id, 'format_note': 'medium' if abr > 100 else 'low', 'ext': ext,
+            'protocol': 'https', 'vcodec': vcodec, 'acodec': acodec, 'abr': abr, 'tbr': abr, 'asr': 48000,
+            'audio_channels': 2, 'filesize': size, 'container': f'{ext}_dash',
+            'url': _signed_url(media_url, f'{video_id}/{format_id}', size, expire),
+            'http_headers': headers, 'downloader_options': {'http_chunk_size': 10485760},
+        })
+    for format_id, ext, vcodec, acodec, width, height, fps, tbr in VIDEO_FORMATS:
+        size = int(tbr * 1000 / 8 * duration)
+        formats.append({
+            'format_id': format_id, 'format_note': f'{height}p{fps if fps > 30 else ""}', 'ext': ext,
+            'protocol': 'https', 'vcodec': vcodec, 'acodec': acodec, 'width': width, 'height': height,
+            'fps': fps, 'tbr': tbr, 'vbr': tbr, 'filesize': size, 'container': f'{ext}_dash',
+            'dynamic_range': 'SDR', 'resolution': f'{width}x{height}',
+            'url': _signed_url(media_url, f'{video_id}/{format_id}', size, expire),
+            'http_headers': headers, 'downloader_options': {'http_chunk_size': 10485760},
+        })
+    # The one format carrying both, as on YouTube
+    size = int(650 * 1000 / 8 * duration)
+    formats.append({
+        'format_id': '18', 'format_note': '360p', 'ext': 'mp4', 'protocol': 'https',
+        'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'width': 640, 'height': 360, 'fps': 30,
+        'tbr': 650, 'filesize_approx': size, 'url': _signed_url(media_url, f'{video_id}/18', size, expire),
+        'http_headers': headers,
+    })
+
+    captions = {}
+    for n in range(CAPTION_LANGUAGES):
+        lang = f'l{n:03d}'
+        captions[lang] = [{
+            'ext': ext, 'name': f'Language {n} (auto-generated)',
+            'url': f"https://www.youtube.com/api/timedtext?v={video_id}&ei=abcdefghijklmnop&caps=asr"
+                   f"&opi=112496729&xoaf=5&hl=en&ip=0.0.0.0&ipbits=0&expire={expire}"
+                   f"&sparams=ip%2Cipbits%2Cexpire%2Cv%2Cei%2Ccaps%2Copi%2Cxoaf&signature={'F' * 80}"
+                   f"&key=yt8&kind=asr&lang=en&tlang={lang}&fmt={ext}",
+        } for ext in CAPTION_EXTS]
+
+    return {
+        'id': video_id,
+        'title': f'Benchmark video {video_id}',
+        'fulltitle': f'Benchmark video {video_id}',
+        'description': 'Generated metadata for offline benchmarks. ' * 40,
+        'duration': duration,
+        'duration_string': f'{duration // 60}:{duration % 60:02d}',
+        'channel': 'Benchmarks', 'channel_id': 'UC' + 'b' * 22, 'uploader': 'Benchmarks',
+        'upload_date': '20240101', 'view_count': 123456789, 'like_count': 1234567,
+        'tags': [f'tag{n}' for n in range(30)],
+        'categories': ['Music'],
+        'thumbnails': [{'url': f'https://i.ytimg.com/vi/{video_id}/{n}.jpg', 'preference': -n,
+                        'id': str(n), 'height': 90 * (n % 8 + 1), 'width': 120 * (n % 8 + 1)} for n in range(42)],
+        'formats': formats,
+        'automatic_captions': captions,
+        'subtitles': {},
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'original_url': f'https://www.youtube.com/watch?v={video_id}',
+        'extractor': 'youtube', 'extractor_key': 'Youtube',
+        'epoch': int(time.time()),
+        '_type': 'video',
+    }
+
+def video_id_of(url):
+    match = re.search(r'(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})', url)
+    return match.group(1) if match else 'BenchVideo0'
+
+def option(args, name, count=1):
+    """Value(s) of a command line option, or None"""
+    if name not in args:
+        return None
+    i = args.index(name)
+    values = args[i + 1:i + 1 + count]
+    return values[0] if count == 1 else values
+
+def render(template, record):
+    """Fill in a --progress-template the way yt-dlp does (only the |null)j fields the app uses)"""
+    if template.startswith('download:'):
+        template = template[len('download:'):]
+    return TEMPLATE_FIELD_RE.sub(lambda m: json.dumps(record.get(m.group(1))), template)
+
+def paths_option(args):
+    """-P values as {'home': dir, 'temp': dir}; a value without a type is the home dir"""
+    paths = {}
+    for i, arg in enumerate(args[:-1]):
+        if arg in ('-P', '--paths'):
+            kind, sep, path = args[i + 1].partition(':')
+            if sep and kind in ('home', 'temp'):
+                paths[kind] = path
+            else:
+                paths['home'] = args[i + 1]
+    return paths
+
+def output_path(template, info, f, ext=None):
+    values = {'id': info['id'], 'title': info['title'], 'format_id': f['format_id'], 'ext': ext or f['ext']}
+    return re.sub(r'%\((\w+)\)s', lambda m: str(values.get(m.group(1), m.group(1))), template)
+
+class Emitter:
+    """Prints progress records at the configured rate"""
+
+    def __init__(self, template):
+        self.template = template or 'download:[download] %(progress.downloaded_bytes|null)j'
+        self.rate = float(os.environ.get('BENCH_YTDLP_RATE') or 0)
+        self.stamp = bool(os.environ.get('BENCH_YTDLP_STAMP'))
+        self.started = time.monotonic()
+        self.count = 0
+
+    def emit(self, status, downloaded, total, speed):
+        if self.rate:
+            delay = self.started + self.count / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.count += 1
+        remaining = (total - downloaded) / speed if speed else None
+        record = {
+            'status': status, 'downloaded_bytes': downloaded, 'total_bytes': total,
+            'total_bytes_estimate': None, 'speed': speed,
+            'eta': time.time() if self.stamp else (int(remaining) if remaining is not None else None),
+            'fragment_index': None, 'fragment_count': None,
+        }
+        sys.stdout.write(render(self.template, record) + '\n')
+        sys.stdout.flush()
+
+def fetch(f, path, emitter):
+    """Download a format from the media server, one record per block"""
+    started = time.monotonic()
+    downloaded = 0
+    with urllib.request.urlopen(f['url'], timeout=30) as response, open(path, 'wb') as out:
+        total = int(response.headers.get('Content-Length') or 0) or None
+        while True:
+            block = response.read(READ_SIZE)
+            if not block:
+                break
+            out.write(block)
+            downloaded += len(block)
+            elapsed = time.monotonic() - started
+            emitter.emit('downloading', downloaded, total, downloaded / elapsed if elapsed else None)
+    return downloaded
+
+def synthesize(f, path, emitter, lines):
+    """Create a (sparse) file of the format's size, reporting progress in `lines` steps"""
+    total = f.get('filesize') or f.get('filesize_approx') or 1024 * 1024
+    started = time.monotonic()
+    for n in range(1, lines + 1):
+        elapsed = time.monotonic() - started
+        downloaded = total * n // lines
+        emitter.emit('downloading', downloaded, total, downloaded / elapsed if elapsed else None)
+    with open(path, 'wb') as out:
+        out.truncate(total)
+    return total
+
+def download(args, info):
+    template = option(args, '-o') or '%(title)s [%(id)s].%(ext)s'
+    # Work in the temp path and move finished files home, like yt-dlp
+    paths = {} if os.path.isabs(template) else paths_option(args)
+    home = paths.get('home', '')
+    template = os.path.join(paths.get('temp', home), template)
+    spec = option(args, '-f') or 'best'
+    print_to = option(args, '--print-to-file', 2)
+    merge_ext = option(args, '--merge-output-format')
+    extract_audio = '-x' in args or '--extract-audio' in args
+    audio_format = (option(args, '--audio-format') or 'best') if extract_audio else None
+    remux_ext = option(args, '--remux-video')
+    lines = int(os.environ.get('BENCH_YTDLP_LINES') or 100)
+    emitter = Emitter(option(args, '--progress-template'))
+    by_id = {f['format_id']: f for f in info['formats']}
+
+    print(f"[youtube] Extracting URL: {info['webpage_url']}")
+    print(f"[youtube] {info['id']}: Downloading webpage")
+    finals = []
+    # "-f a,b" downloads separate files; "a+b" downloads both and merges them
+    for choice in spec.split(','):
+        wanted = [by_id.get(i) for i in choice.split('+')]
+        if None in wanted:
+            # A selector expression; take the biggest video and audio
+            videos = [f for f in info['formats'] if f['vcodec'] != 'none' and f['acodec'] == 'none']
+            audios = [f for f in info['formats'] if f['vcodec'] == 'none' and f['acodec'] != 'none']
+            wanted = [max(videos, key=lambda f: f['tbr'])] if not audio_format else []
+            wanted.append(max(audios, key=lambda f: f['tbr']))
+        print(f"[info] {info['id']}: Downloading 1 format(s): {'+'.join(f['format_id'] for f in wanted)}")
+        paths = []
+        for f in wanted:
+            path = output_path(template, info, f)
+            if len(wanted) > 1:
+                path = os.path.splitext(path)[0] + f".f{f['format_id']}.{f['ext']}"
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            print(f"[download] Destination: {path}")
+            sys.stdout.flush()
+            if os.environ.get('BENCH_YTDLP_FETCH'):
+                size = fetch(f, path, emitter)
+            else:
+                size = synthesize(f, path, emitter, lines)
+            emitter.emit('finished', size, size, None)
+            paths.append(path)
+
+        final = paths[0]
+        if len(paths) > 1:
+            final = output_path(template, info, wanted[0], merge_ext or 'mkv')
+            print(f'[Merger] Merging formats into "{final}"')
+            sys.stdout.flush()
+            with open(final, 'wb') as out:
+                for path in paths:
+                    with open(path, 'rb') as part:
+                        while True:
+                            block = part.read(1024 * 1024)
+                            if not block:
+                                break
+                            out.write(block)
+                    os.remove(path)
+        elif audio_format:
+            if audio_format == 'best':
+                codec = wanted[0]['acodec'].split('.')[0]
+                audio_ext = AUDIO_EXTENSIONS.get(codec, codec)
+            else:
+                audio_ext = AUDIO_EXTENSIONS.get(audio_format, audio_format)
+            converted = os.path.splitext(final)[0] + '.' + audio_ext
+            print(f"[ExtractAudio] Destination: {converted}")
+            sys.stdout.flush()
+            os.replace(final, converted)
+            final = converted
+        elif remux_ext:
+            remuxed = os.path.splitext(final)[0] + '.' + remux_ext
+            print(f'[VideoRemuxer] Remuxing video from {wanted[0]["ext"]} to {remux_ext}; Destination: {remuxed}')
+            sys.stdout.flush()
+            os.replace(final, remuxed)
+            final = remuxed
+        if home and os.path.dirname(final) != home:
+            moved = os.path.join(home, os.path.basename(final))
+            os.makedirs(home, exist_ok=True)
+            shutil.move(final, moved)
+            final = moved
+        finals.append(final)
+
+    if print_to and print_to[0] == 'after_move:filepath':
+        with open(print_to[1], 'a', encoding='utf-8') as out:
+            out.writelines(path + '\n' for path in finals)
+    return 0
+
+def main():
+    args = sys.argv[1:]
+    time.sleep(float(os.environ.get('BENCH_YTDLP_STARTUP') or 0))
+    if '--version' in args:
+        print('2024.01.01')
+        return 0
+    duration = int(os.environ.get('BENCH_YTDLP_DURATION') or DEFAULT_DURATION)
+    media_url = os.environ.get('BENCH_MEDIA_URL') or DEFAULT_MEDIA_URL
+
+    info_file = option(args, '--load-info-json')
+    if info_file:
+        with open(info_file, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    else:
+        url = next((a for a in reversed(args) if not a.startswith('-')), '')
+        info = make_info(video_id_of(url), duration, media_url)
+
+    if '-j' in args or '--dump-json' in args:
+        time.sleep(float(os.environ.get('BENCH_YTDLP_PROBE') or 0))
+        print(json.dumps(info))
+        return 0
+    try:
+        return download(args, info)
+    except Exception as e:
+        print(f"ERROR: {e}")
+        sys.stdout.flush()
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
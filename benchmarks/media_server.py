@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local HTTP server for offline download benchmarks.
+
+Serves generated bytes at any path: /<anything>?size=N returns N bytes
+(default 8 MiB), the same bytes for the same size and offset every time.
+Single byte ranges and keep-alive are supported like on a real CDN, and
+--rate caps every connection at that many bytes/s to mimic a throttled
+media server (the case the segmented engine is for).
+
+Usage: python benchmarks/media_server.py [--port P] [--rate BYTES_PER_S]
+"""
+
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# One pseudo-random block repeated; incompressible enough for a transfer test
+BLOCK = bytes((i * 2654435761 >> 13) & 0xFF for i in range(CHUNK_SIZE))
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+def content(offset, length):
+    """length bytes of the served data starting at offset"""
+    start = offset % CHUNK_SIZE
+    return (BLOCK[start:] + BLOCK * (length // CHUNK_SIZE + 1))[:length]
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body):
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            size = int(query.get('size', [DEFAULT_SIZE])[0])
+        except ValueError:
+            self.send_error(400, 'bad size')
+            return
+        start, end = 0, size - 1
+        status = 200
+        header = self.headers.get('Range')
+        if header:
+            match = RANGE_RE.match(header.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                self.send_error(416)
+                return
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if body:
+            self._send_body(start, end + 1)
+
+    def _send_body(self, start, stop):
+        rate = self.server.rate
+        began = time.monotonic()
+        sent = 0
+        offset = start
+        try:
+            while offset < stop:
+                length = min(CHUNK_SIZE, stop - offset)
+                self.wfile.write(content(offset, length))
+                offset += length
+                sent += length
+                if rate:
+                    # Sleep until this connection is back under its rate
+                    ahead = sent / rate - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, rate=None):
+        super().__init__(address, MediaHandler)
+        self.rate = rate
+
+def start(port=0, rate=None):
+    """Serve in a background thread; returns (server, base URL). Stop with server.shutdown()"""
+    server = MediaServer(('127.0.0.1', port), rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--rate', type=int, help='bytes/s per connection (default unlimited)')
+    args = parser.parse_args()
+    server = MediaServer(('127.0.0.1', args.port), args.rate)
+    print(f"Serving test media on http://127.0.0.1:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
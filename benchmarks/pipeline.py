@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the download pipeline.
+
+The app runs unchanged against benchmarks/fake_ytdlp.py and
+benchmarks/fake_ffmpeg.py (put first on PATH as yt-dlp and ffmpeg) and a
+local media server (benchmarks/media_server.py), in an empty HOME, so the
+numbers do not depend on the network or on YouTube. Cases:
+
+  probe        get_available_formats on a cache miss and a cache hit,
+               next to the bare cost of the yt-dlp process
+  lines        run_with_progress throughput in progress lines/s, next to
+               reading the same output without parsing it
+  latency      delay from yt-dlp printing a progress record to a bus
+               subscriber receiving it, and the age of the progress the UI
+               shows when its next frame applies it
+  jobs         wall time of N video jobs through the JobQueue (probe,
+               download from a throttled server, merge) with 1, 2 and 4 workers
+  postprocess  post-processing pool throughput with 1, 2 and 4 workers
+  segmented    segmented engine vs. one connection on a throttled server
+
+Results are written to benchmarks/results/pipeline.json and compared with
+the previous run if one exists.
+
+Usage: python benchmarks/pipeline.py [--runs N] [--only CASE[,CASE...]]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'benchmarks')
+RESULTS_FILE = os.path.join(ROOT, 'benchmarks', 'results', 'pipeline.json')
+CASES = ('probe', 'lines', 'latency', 'jobs', 'postprocess', 'segmented')
+
+MiB = 1024 * 1024
+# Per-connection rate of the throttled media server, and the video length
+# used for the download cases (1080p avc1 + m4a of 6 s is about 3.4 MB)
+THROTTLED_RATE = 4 * MiB
+JOB_DURATION = 6
+JOB_WORKERS = (1, 2, 4)
+# Frame interval of the Kivy UI, which applies bus updates on the next frame (main.py)
+UI_FRAME_INTERVAL = 1 / 60
+
+def install_stubs(bin_dir):
+    """Put the fake yt-dlp and ffmpeg on PATH under their real names"""
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, script in (('yt-dlp', 'fake_ytdlp.py'), ('ffmpeg', 'fake_ffmpeg.py')):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(BENCH_DIR, script)}" "$@"\n')
+        os.chmod(path, 0o755)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+
+def set_stub_env(**values):
+    """Set BENCH_* variables for the stubs, dropping the ones set to None"""
+    for name, value in values.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = str(value)
+
+def video_url(tag, n):
+    """A YouTube URL with a unique 11 character video id"""
+    return f"https://www.youtube.com/watch?v={tag[:5]:_<5}{n:06d}"
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 2),
+        'min_ms': round(min(values) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+def percentiles(values):
+    values = sorted(values)
+    return {
+        'p50_ms': round(values[len(values) // 2] * 1000, 2),
+        'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+        'samples': len(values),
+    }
+
+def clear_dir(path):
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            target = os.path.join(path, name)
+            if os.path.isdir(target):
+                shutil.rmtree(target, ignore_errors=True)
+            else:
+                os.remove(target)
+
+def bench_probe(runs, media_url):
+    import downloader
+    set_stub_env(BENCH_YTDLP_DURATION=None, BENCH_MEDIA_URL=media_url)
+    stub, cold, warm = [], [], []
+    for n in range(runs):
+        url = video_url('probe', n)
+        start = time.perf_counter()
+        subprocess.run([downloader.ytdlp_path(), '-j', url], stdout=subprocess.DEVNULL, check=True)
+        stub.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        options = downloader.get_available_formats(url)
+        cold.append(time.perf_counter() - start)
+        if not options:
+            raise RuntimeError('no formats found')
+
+        start = time.perf_counter()
+        downloader.get_available_formats(url)
+        warm.append(time.perf_counter() - start)
+
+    info_bytes = len(subprocess.run([downloader.ytdlp_path(), '-j', video_url('probe', 0)],
+                                    capture_output=True, check=True).stdout)
+    results = {'info_json_bytes': info_bytes, 'ytdlp_process': summarize(stub),
+               'cache_miss': summarize(cold), 'cache_hit': summarize(warm)}
+    print(f"probe        miss {results['cache_miss']['median_ms']:>8.2f} ms"
+          f"   hit {results['cache_hit']['median_ms']:>7.2f} ms"
+          f"   (yt-dlp process {results['ytdlp_process']['median_ms']:.2f} ms, {info_bytes // 1024} KiB JSON)")
+    return results
+
+def progress_command(workdir, url, template):
+    import downloader
+    return [downloader.ytdlp_path(), '-f', '140', '-o', os.path.join(workdir, '.%(id)s.f%(format_id)s.%(ext)s'),
+            '--newline', '--progress-template', template, url]
+
+def bench_lines(runs, lines, workdir):
+    import downloader
+    import progress
+    set_stub_env(BENCH_YTDLP_LINES=lines, BENCH_YTDLP_RATE=None, BENCH_YTDLP_STAMP=None, BENCH_YTDLP_FETCH=None)
+    raw, app = [], []
+    for n in range(runs):
+        cmd = progress_command(workdir, video_url('lines', n), progress.PROGRESS_TEMPLATE)
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   universal_newlines=True, bufsize=1)
+        for _ in process.stdout:
+            pass
+        process.wait()
+        raw.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if downloader.run_with_progress(cmd, "AUDIO") != 0:
+            raise RuntimeError('run_with_progress failed')
+        app.append(time.perf_counter() - start)
+        clear_dir(workdir)
+
+    raw_rate = lines / statistics.median(raw)
+    app_rate = lines / statistics.median(app)
+    results = {
+        'lines': lines,
+        'read_only': summarize(raw), 'run_with_progress': summarize(app),
+        'read_only_lines_per_s': round(raw_rate), 'lines_per_s': round(app_rate),
+        'overhead_us_per_line': round((statistics.median(app) - statistics.median(raw)) / lines * 1e6, 2),
+    }
+    print(f"lines        {results['lines_per_s']:>8} lines/s   (read only {results['read_only_lines_per_s']} lines/s,"
+          f" {results['overhead_us_per_line']:.2f} us/line in the app)")
+    return results
+
+def bench_latency(seconds, rate, workdir):
+    import downloader
+    import progress
+    set_stub_env(BENCH_YTDLP_LINES=int(seconds * rate), BENCH_YTDLP_RATE=rate, BENCH_YTDLP_STAMP=1,
+                 BENCH_YTDLP_FETCH=None)
+    results = {'records_per_s': rate}
+
+    # Every published event, straight from the publishing thread
+    delivered = []
+    def on_event(event):
+        if event.phase == progress.DOWNLOADING and isinstance(event.eta, float):
+            delivered.append(time.time() - event.eta)
+    progress.bus.subscribe(on_event)
+    try:
+        cmd = progress_command(workdir, video_url('lat', 0), progress.PROGRESS_TEMPLATE)
+        downloader.run_with_progress(cmd, "AUDIO", progress_interval=0)
+    finally:
+        progress.bus.unsubscribe(on_event)
+    results['subscriber'] = percentiles(delivered)
+
+    # What the UI shows: a subscriber marks the job changed and the next
+    # frame applies its newest event, like DownloaderApp.flush_updates
+    shown = []
+    stop = threading.Event()
+    triggered = threading.Event()
+    changed = set()
+    lock = threading.Lock()
+    def on_change(event):
+        with lock:
+            changed.add(event.job_id)
+        triggered.set()
+    def frames():
+        while not stop.is_set():
+            if not triggered.wait(0.1):
+                continue
+            time.sleep(UI_FRAME_INTERVAL - time.monotonic() % UI_FRAME_INTERVAL)
+            triggered.clear()
+            with lock:
+                job_ids = list(changed)
+                changed.clear()
+            now = time.time()
+            for job_id in job_ids:
+                e = progress.bus.latest(job_id)
+                if e and e.phase == progress.DOWNLOADING and isinstance(e.eta, float):
+                    shown.append(now - e.eta)
+    frame_thread = threading.Thread(target=frames, daemon=True)
+    frame_thread.start()
+    progress.bus.subscribe(on_change)
+    try:
+        cmd = progress_command(workdir, video_url('lat', 1), progress.PROGRESS_TEMPLATE)
+        downloader.run_with_progress(cmd, "AUDIO")
+    finally:
+        progress.bus.unsubscribe(on_change)
+        stop.set()
+        frame_thread.join()
+    results['ui_frame'] = percentiles(shown)
+    clear_dir(workdir)
+
+    print(f"latency      subscriber p50 {results['subscriber']['p50_ms']:.2f} ms"
+          f" p95 {results['subscriber']['p95_ms']:.2f} ms   UI frame p50 {results['ui_frame']['p50_ms']:.2f} ms"
+          f" p95 {results['ui_frame']['p95_ms']:.2f} ms")
+    return results
+
+def bench_jobs(count, runs, downloads_dir):
+    import jobs
+    import media_server
+    server, media_url = media_server.start(rate=THROTTLED_RATE)
+    set_stub_env(BENCH_YTDLP_DURATION=JOB_DURATION, BENCH_MEDIA_URL=media_url, BENCH_YTDLP_FETCH=1,
+                 BENCH_YTDLP_RATE=None, BENCH_YTDLP_STAMP=None, BENCH_FFMPEG_MS_PER_MB=None)
+    results = {'jobs': count, 'server_rate_bytes_per_s': THROTTLED_RATE}
+    serial = None
+    try:
+        for workers in JOB_WORKERS:
+            samples, failed = [], 0
+            for run in range(runs):
+                finished = threading.Event()
+                def on_update(job):
+                    if all(j.state in jobs.FINISHED_STATES for j in queue.jobs()) and len(queue.jobs()) == count:
+                        finished.set()
+                queue = jobs.JobQueue(workers=workers, on_update=on_update)
+                start = time.perf_counter()
+                for n in range(count):
+                    queue.submit(video_url(f'j{workers}r{run}', n), 'video', '1920x1080', force=True)
+                if not finished.wait(300):
+                    raise RuntimeError('jobs did not finish')
+                samples.append(time.perf_counter() - start)
+                failed += sum(1 for j in queue.jobs() if j.state != jobs.DONE)
+                clear_dir(downloads_dir)
+            entry = results[f'workers_{workers}'] = summarize(samples)
+            entry['failed'] = failed
+            serial = serial or statistics.median(samples)
+            entry['speedup'] = round(serial / statistics.median(samples), 2)
+            print(f"jobs         {count} jobs, {workers} workers {entry['median_ms']:>9.2f} ms"
+                  f"   speedup {entry['speedup']:.2f}x{f'   {failed} failed' if failed else ''}")
+    finally:
+        server.shutdown()
+    return results
+
+def bench_postprocess(tasks, runs, workdir):
+    import postprocess
+    ffmpeg = shutil.which('ffmpeg')
+    # 16 MiB per task at a transcode-like 25 ms/MiB: about 0.4 s of CPU each
+    set_stub_env(BENCH_FFMPEG_MS_PER_MB=25)
+    results = {'tasks': tasks}
+    serial = None
+    for workers in JOB_WORKERS:
+        samples = []
+        for run in range(runs):
+            pool = postprocess.PostProcessPool(workers)
+            done = threading.Semaphore(0)
+            queued = []
+            for n in range(tasks):
+                source = os.path.join(workdir, f'.raw{n}.m4a')
+                with open(source, 'wb') as f:
+                    f.truncate(16 * MiB)
+                queued.append(postprocess.Task(ffmpeg, [source], ['-vn', '-c', 'copy'],
+                                               os.path.join(workdir, f'out{n}.m4a')))
+            start = time.perf_counter()
+            for task in queued:
+                pool.submit(task, on_done=lambda task: done.release())
+            for _ in queued:
+                done.acquire()
+            samples.append(time.perf_counter() - start)
+            if any(task.returncode != 0 for task in queued):
+                raise RuntimeError('post-processing failed')
+            clear_dir(workdir)
+        entry = results[f'workers_{workers}'] = summarize(samples)
+        serial = serial or statistics.median(samples)
+        entry['speedup'] = round(serial / statistics.median(samples), 2)
+        print(f"postprocess  {tasks} tasks, {workers} workers {entry['median_ms']:>8.2f} ms"
+              f"   speedup {entry['speedup']:.2f}x")
+    return results
+
+def bench_segmented(runs, size, workdir):
+    import media_server
+    import segmented
+    server, media_url = media_server.start(rate=THROTTLED_RATE)
+    results = {'size_bytes': size, 'server_rate_bytes_per_s': THROTTLED_RATE}
+    try:
+        for segments in (1, segmented.DEFAULT_SEGMENTS):
+            samples = []
+            for run in range(runs):
+                dest = os.path.join(workdir, f'seg{segments}-{run}.bin')
+                start = time.perf_counter()
+                segmented.download(f"{media_url}/seg/{run}?size={size}", dest, segments=segments)
+                samples.append(time.perf_counter() - start)
+                if os.path.getsize(dest) != size:
+                    raise RuntimeError('segmented download has the wrong size')
+                clear_dir(workdir)
+            entry = results[f'segments_{segments}'] = summarize(samples)
+            entry['mb_per_s'] = round(size / 1e6 / statistics.median(samples), 2)
+            print(f"segmented    {segments} connection(s) {entry['median_ms']:>9.2f} ms   {entry['mb_per_s']:.2f} MB/s")
+    finally:
+        server.shutdown()
+    return results
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numbers only"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--only', help='comma separated cases to run (default all)')
+    parser.add_argument('--lines', type=int, default=20000, help='progress lines for the throughput case')
+    parser.add_argument('--jobs', type=int, default=8, help='jobs for the multi-job case')
+    args = parser.parse_args()
+    cases = args.only.split(',') if args.only else list(CASES)
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix='ytd-bench-')
+    home = os.path.join(workdir, 'home')
+    scratch = os.path.join(workdir, 'scratch')
+    os.makedirs(home)
+    os.makedirs(scratch)
+    # Before the app modules are imported: they resolve their directories from HOME
+    os.environ['HOME'] = home
+    install_stubs(os.path.join(workdir, 'bin'))
+    os.chdir(workdir)
+    sys.path[:0] = [ROOT, BENCH_DIR]
+
+    import debug
+    import media_server
+    # The app's log goes to download.log in the temporary HOME only
+    debug.CONSOLE_LEVEL = debug.ERROR + 1
+    server, media_url = media_server.start()
+    results = {'python': sys.version.split()[0], 'cpu_count': os.cpu_count(), 'runs': args.runs, 'cases': {}}
+    try:
+        if 'probe' in cases:
+            results['cases']['probe'] = bench_probe(args.runs, media_url)
+        if 'lines' in cases:
+            results['cases']['lines'] = bench_lines(args.runs, args.lines, scratch)
+        if 'latency' in cases:
+            results['cases']['latency'] = bench_latency(5.0, 200, scratch)
+        if 'jobs' in cases:
+            results['cases']['jobs'] = bench_jobs(args.jobs, max(1, args.runs // 2),
+                                                  os.path.join(home, 'Downloads'))
+        if 'postprocess' in cases:
+            results['cases']['postprocess'] = bench_postprocess(8, max(1, args.runs // 2), scratch)
+        if 'segmented' in cases:
+            results['cases']['segmented'] = bench_segmented(max(1, args.runs // 2), 16 * MiB, scratch)
+    finally:
+        server.shutdown()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    previous = None
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    if previous:
+        old = flatten(previous.get('cases', {}))
+        for key, value in flatten(results['cases']).items():
+            if key in old and key.endswith(('median_ms', 'p95_ms', 'lines_per_s', 'mb_per_s')):
+                print(f"  {key}: {old[key]:g} -> {value:g}")
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {RESULTS_FILE}")
+
+if __name__ == '__main__':
+    main()
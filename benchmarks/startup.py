@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: module import time and time to first frame.
+
+Every sample runs in a fresh interpreter with an empty HOME so nothing is
+cached between runs. Results are written to benchmarks/results/startup.json
+and compared with the previous run if one exists.
+
+Usage: python benchmarks/startup.py [--runs N] [--no-ui]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(ROOT, 'benchmarks', 'results', 'startup.json')
+
+IMPORT_MODULES = ['debug', 'ffmpeg', 'downloader', 'jobs']
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import {module}
+print('RESULT', time.perf_counter() - t)
+"""
+
+# Headless Kivy run: stop the app on the first frame after on_start
+FIRST_FRAME_SNIPPET = """
+import time
+t = time.perf_counter()
+import main
+from kivy.clock import Clock
+import_s = time.perf_counter() - t
+
+class BenchApp(main.DownloaderApp):
+    def on_start(self):
+        super().on_start()
+        Clock.schedule_once(self.first_frame, 0)
+
+    def first_frame(self, dt):
+        print('RESULT', import_s, time.perf_counter() - t)
+        self.stop()
+
+BenchApp().run()
+"""
+
+HEADLESS_ENV = {
+    'KIVY_NO_ARGS': '1',
+    'KIVY_NO_CONSOLELOG': '1',
+    'KIVY_NO_FILELOG': '1',
+    'SDL_VIDEODRIVER': 'dummy',
+    'SDL_AUDIODRIVER': 'dummy',
+}
+
+def run_sample(code, extra_env=None, timeout=120):
+    """Run code in a fresh interpreter; return (wall time, RESULT values)"""
+    with tempfile.TemporaryDirectory() as home:
+        env = os.environ.copy()
+        env['HOME'] = home
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+        env.update(extra_env or {})
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=ROOT, env=env, capture_output=True, text=True, timeout=timeout
+        )
+        wall = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        if line.startswith('RESULT'):
+            return wall, [float(v) for v in line.split()[1:]]
+    raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'no result')
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 2),
+        'min_ms': round(min(values) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--no-ui', action='store_true', help='skip the Kivy first-frame measurement')
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'runs': args.runs, 'imports': {}}
+
+    for module in IMPORT_MODULES:
+        samples = [run_sample(IMPORT_SNIPPET.format(module=module))[1][0] for _ in range(args.runs)]
+        results['imports'][module] = summarize(samples)
+        print(f"import {module:<12} {results['imports'][module]['median_ms']:>8.2f} ms")
+
+    if not args.no_ui:
+        try:
+            samples = [run_sample(FIRST_FRAME_SNIPPET, HEADLESS_ENV) for _ in range(args.runs)]
+            results['first_frame'] = {
+                'import_main': summarize([s[1][0] for s in samples]),
+                'first_frame': summarize([s[1][1] for s in samples]),
+                'process_wall': summarize([s[0] for s in samples]),
+            }
+            print(f"first frame       {results['first_frame']['first_frame']['median_ms']:>8.2f} ms")
+        except Exception as e:
+            print(f"first frame       skipped ({e})")
+
+    previous = None
+    if os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    if previous:
+        for module, stats in results['imports'].items():
+            old = previous.get('imports', {}).get(module)
+            if old:
+                print(f"  {module}: {old['median_ms']:.2f} -> {stats['median_ms']:.2f} ms")
+
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {RESULTS_FILE}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import stat
+import threading
+from debug import get_app_dir, log
+import procengine
+
+EXEC_MODE = stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH
+
+_lock = threading.Lock()
+_manifest = None
+
+def get_manifest_path():
+    return os.path.join(get_app_dir(), 'binaries.json')
+
+def _load_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(get_manifest_path(), 'r', encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except Exception:
+            _manifest = {}
+    return _manifest
+
+def _save_manifest():
+    path = get_manifest_path()
+    tmp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_manifest, f, indent=1)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        log(f"Could not save binary manifest: {e}")
+
+def _fingerprint(st):
+    return {"mtime_ns": st.st_mtime_ns, "ino": st.st_ino, "size": st.st_size}
+
+def _validate(entry):
+    """Cheap check that a cached binary is unchanged and still executable"""
+    try:
+        st = os.stat(entry["path"])
+    except (OSError, KeyError, TypeError):
+        return False
+    return bool(st.st_mode & stat.S_IXUSR) and _fingerprint(st) == entry.get("stat")
+
+def _make_executable(path):
+    try:
+        if not os.access(path, os.X_OK):
+            os.chmod(path, EXEC_MODE)
+        return True
+    except Exception as e:
+        log(f"Found {path} but couldn't make it executable: {e}")
+        return False
+
+def _search(name, candidates, use_path):
+    for path in candidates:
+        if os.path.exists(path) and _make_executable(path):
+            return os.path.abspath(path)
+    if use_path:
+        return shutil.which(name)
+    return None
+
+def resolve(name, candidates, use_path=True):
+    """Find binary `name`, trying `candidates` in order and then the system PATH.
+
+    Results are remembered in the app dir manifest and revalidated with a
+    single stat() on later calls; the full search only runs when that fails.
+    Returns None if the binary cannot be found.
+    """
+    with _lock:
+        manifest = _load_manifest()
+        entry = manifest.get(name)
+        if entry and _validate(entry):
+            return entry["path"]
+
+        path = _search(name, candidates, use_path)
+        if not path:
+            if name in manifest:
+                del manifest[name]
+                _save_manifest()
+            log(f"{name} not found in any location")
+            return None
+
+        manifest[name] = {"path": path, "stat": _fingerprint(os.stat(path)), "version": None}
+        _save_manifest()
+        log(f"Using {name} from: {path}")
+        return path
+
+def get_version(name, version_args=("--version",)):
+    """Version string of a resolved binary, cached in the manifest.
+
+    Only for display and logging: a cached version says nothing about
+    whether the binary still runs. An entry whose file changed or that
+    fails to report a version is forgotten, so the next resolve() searches
+    again.
+    """
+    with _lock:
+        entry = _load_manifest().get(name)
+        if not entry:
+            return None
+        valid = _validate(entry)
+        if valid and entry.get("version"):
+            return entry["version"]
+        path = entry.get("path")
+    if not valid:
+        forget(name)
+        return None
+
+    try:
+        result = procengine.engine.run([path, *version_args], timeout=10)
+        version = result.stdout.strip().split('\n')[0] if result.returncode == 0 else None
+    except Exception as e:
+        log(f"Could not get {name} version: {e}")
+        version = None
+    if not version:
+        log(f"{name} at {path} did not report a version, forgetting it")
+        forget(name)
+        return None
+
+    with _lock:
+        entry = _load_manifest().get(name)
+        if entry and entry.get("path") == path:
+            entry["version"] = version
+            _save_manifest()
+    return version
+
+def forget(name=None):
+    """Drop cached entries so the next resolve() searches again"""
+    with _lock:
+        manifest = _load_manifest()
+        if name is None:
+            manifest.clear()
+        else:
+            manifest.pop(name, None)
+        _save_manifest()
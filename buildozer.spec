@@ -22,7 +22,7 @@ source.include_exts = py,png,jpg,kv,atlas
 #source.exclude_exts = spec
 
 # (list) List of directory to exclude (let empty to not exclude anything)
-source.exclude_dirs = tests, bin, .buildozer, __pycache__
+source.exclude_dirs = tests, bin, benchmarks, .buildozer, __pycache__
 
 # (list) List of exclusions using pattern matching
 source.exclude_patterns = */test/*,*.pyc,*.pyo
@@ -32,7 +32,7 @@ version = 1.0.0
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3==3.10.8,kivy==2.2.1,android,pyjnius
+requirements = python3==3.10.8,kivy==2.2.1,android,pyjnius,sqlite3
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+from debug import get_app_dir, log
+
+# How long a cached format listing is trusted
+CACHE_TTL = 6 * 60 * 60
+# Maximum number of videos kept on disk (least recently used are evicted)
+CACHE_MAX_ENTRIES = 50
+# Signed stream URLs must stay valid at least this long to be reused
+URL_EXPIRY_MARGIN = 10 * 60
+
+VIDEO_ID_RE = re.compile(
+    r'(?:v=|youtu\.be/|/shorts/|/embed/|/live/|/v/)([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
+_lock = threading.Lock()
+
+def get_cache_dir():
+    """Get the metadata cache directory, creating it if needed"""
+    cache_dir = os.path.join(get_app_dir(), 'cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def video_id_from_url(url):
+    """Extract the YouTube video ID from a URL, or None"""
+    match = VIDEO_ID_RE.search(url or '')
+    return match.group(1) if match else None
+
+def _entry_path(video_id):
+    return os.path.join(get_cache_dir(), f"{video_id}.info.json")
+
+def _stream_expiry(info):
+    """Earliest 'expire' timestamp found in the signed format URLs"""
+    expiries = []
+    for f in info.get("formats") or []:
+        query = parse_qs(urlparse(f.get("url") or '').query)
+        try:
+            expiries.append(int(query["expire"][0]))
+        except (KeyError, ValueError, IndexError):
+            pass
+    return min(expiries) if expiries else None
+
+def _load(video_id, max_age):
+    """Load a cached entry that is younger than max_age, marking it as used"""
+    path = _entry_path(video_id)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+
+    if time.time() - st.st_mtime > max_age:
+        log(f"Metadata cache expired for {video_id}")
+        return None, None
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        # atime records last use for LRU eviction, mtime keeps the fetch time
+        os.utime(path, (time.time(), st.st_mtime))
+        return info, path
+    except Exception as e:
+        log(f"Dropping unreadable cache entry {path}: {e}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None, None
+
+def get_cached_info(url):
+    """Return cached info for a URL if it is still within the TTL"""
+    video_id = video_id_from_url(url)
+    if not video_id:
+        return None
+    info, _ = _load(video_id, CACHE_TTL)
+    if info is not None:
+        log(f"Metadata cache hit for {video_id}")
+    return info
+
+def get_info_path(url):
+    """Return a cached info JSON path usable with --load-info-json.
+
+    Only returned while the signed stream URLs inside it are still valid.
+    """
+    video_id = video_id_from_url(url)
+    if not video_id:
+        return None
+    info, path = _load(video_id, CACHE_TTL)
+    if info is None:
+        return None
+
+    expiry = _stream_expiry(info)
+    if expiry is not None and expiry - time.time() < URL_EXPIRY_MARGIN:
+        log(f"Cached stream URLs for {video_id} are about to expire, re-extracting")
+        return None
+    return path
+
+def store_info(info, raw=None):
+    """Store yt-dlp info for a video. raw is the exact -j output if available"""
+    video_id = info.get("id")
+    if not video_id:
+        return None
+    path = _entry_path(video_id)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with _lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(raw if raw is not None else json.dumps(info))
+            os.replace(tmp_path, path)
+        prune()
+        return path
+    except Exception as e:
+        log(f"Could not write metadata cache: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return None
+
+def prune():
+    """Remove expired entries and evict the least recently used ones"""
+    now = time.time()
+    with _lock:
+        entries = []
+        stale = []
+        cache_dir = get_cache_dir()
+        for name in os.listdir(cache_dir):
+            if not name.endswith('.info.json'):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > CACHE_TTL:
+                stale.append(path)
+            else:
+                entries.append((max(st.st_atime, st.st_mtime), path))
+
+        entries.sort(reverse=True)
+        evicted = [path for _, path in entries[CACHE_MAX_ENTRIES:]]
+        for path in stale + evicted:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def clear_cache():
+    """Remove all cached metadata"""
+    with _lock:
+        cache_dir = get_cache_dir()
+        for name in os.listdir(cache_dir):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+    log("Metadata cache cleared")
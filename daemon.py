@@ -0,0 +1,406 @@
+"""Headless download service: the job engine behind a local HTTP/JSON API.
+
+    python daemon.py [--host 127.0.0.1] [--port 8765] [--workers 3] [--token SECRET]
+                     [--limit 2M] [--schedule 0-7:unlimited,18-23:512K] [--profile[=cpu,memory]]
+
+Endpoints (JSON in and out):
+
+    GET    /jobs                  all jobs
+    POST   /jobs                  {"url", "mode": "video"|"audio", "resolution",
+                                   "audio_format", "max_size", "engine": "yt-dlp"|"segmented",
+                                   "force"} -> the new job
+    GET    /jobs/<id>             one job with its progress and metrics
+    DELETE /jobs/<id>             cancel
+    POST   /jobs/<id>/pause       pause (resume with /resume)
+    GET    /formats?url=...       resolutions on offer, as get_available_formats
+    GET    /bandwidth             global download limit and time-of-day schedule
+    PUT    /bandwidth             {"limit": "2M" | bytes | null,
+                                   "schedule": "0-7:unlimited,18-23:512K"} -> the new settings
+    GET    /events[?job=<id>]     progress and job updates as server-sent events
+    GET    /metrics               Prometheus text format
+    GET    /health
+
+All connections are served by one asyncio loop. Progress reaches SSE
+clients through a single thread waiting on the progress bus; blocking work
+(probing, the journal) runs on a small executor. Kivy is never imported.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from dataclasses import asdict
+from urllib.parse import parse_qs, urlparse
+
+from debug import log
+from bandwidth import governor, parse_rate, parse_schedule
+from jobs import JobQueue, DEFAULT_WORKERS
+from journal import JobJournal, collect_stale_parts
+from metrics import metrics, parse_profile
+from progress import bus
+import archive
+import audio
+import staging
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Request size limits
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+# SSE clients get at most one batch of updates per EVENT_INTERVAL, and a
+# comment line after KEEPALIVE seconds of silence
+EVENT_INTERVAL = 0.1
+KEEPALIVE = 15.0
+
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+    404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def is_integer(value):
+    """True for a JSON integer; JSON true/false arrive as bool, which Python counts as int"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def job_dict(job):
+    """JSON view of a Job and its latest progress"""
+    event = bus.latest(job.id)
+    return {
+        'id': job.id,
+        'url': job.url,
+        'mode': job.mode,
+        'resolution': job.resolution,
+        'max_size': job.max_size,
+        'engine': job.engine,
+        'state': job.state,
+        'status': job.status,
+        'result': job.result,
+        'returncode': job.returncode,
+        'error_class': job.error_class,
+        'format': job.format,
+        'output_path': job.output_path,
+        'created': job.created,
+        'progress': asdict(event) if event else None,
+    }
+
+class EventHub:
+    """Wakes SSE clients on the event loop when progress or a job changes.
+
+    One thread blocks in bus.wait() for all clients; job updates come from
+    the JobQueue's on_update callback. Both only set an asyncio.Event, each
+    client then reads what changed since its own position.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.changed = asyncio.Event()
+        self.job_version = 0
+        # job id -> job_version of its last update
+        self.job_changes = {}
+
+    def start(self):
+        threading.Thread(target=self._watch_bus, name='sse-bus', daemon=True).start()
+
+    def _watch_bus(self):
+        seq = 0
+        while True:
+            _, seq = bus.wait(seq)
+            self.loop.call_soon_threadsafe(self._notify)
+            # Coalesce bursts of progress into one wake-up
+            time.sleep(EVENT_INTERVAL)
+
+    def job_updated(self, job):
+        """JobQueue on_update callback (any thread)"""
+        self.loop.call_soon_threadsafe(self._job_changed, job.id)
+
+    def _job_changed(self, job_id):
+        self.job_version += 1
+        self.job_changes[job_id] = self.job_version
+        self._notify()
+
+    def _notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class Daemon:
+    def __init__(self, workers=DEFAULT_WORKERS, token=None, journal=True):
+        self.token = token
+        self.hub = None
+        self.queue = JobQueue(workers=workers, on_update=self._on_update,
+                              journal=JobJournal if journal else None)
+
+    def _on_update(self, job):
+        if self.hub:
+            self.hub.job_updated(job)
+
+    def start_up(self):
+        """Same start-up work as the app: binaries, archive, unfinished jobs, stale parts"""
+        import downloader
+        try:
+            downloader.warm_up()
+            archive.load()
+            self.queue.restore()
+            if self.queue.journal:
+                self.queue.journal.prune()
+                collect_stale_parts(self.queue.journal, staging.get_staging_dir())
+        except Exception as e:
+            log(f"Start-up failed: {e}")
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        self.hub = EventHub(loop)
+        self.hub.start()
+        await loop.run_in_executor(None, self.start_up)
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        log(f"Daemon listening on http://{host}:{port}/")
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, query, headers, body = await self.read_request(reader)
+            if self.token and headers.get('authorization') != f'Bearer {self.token}':
+                raise HTTPError(401, 'missing or wrong token')
+            if method == 'GET' and path == '/events':
+                await self.stream_events(writer, query, headers)
+                return
+            status, payload = await self.route(method, path, query, body)
+        except HTTPError as e:
+            status, payload = e.status, {'error': str(e)}
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            log(f"Daemon request failed: {e}")
+            status, payload = 500, {'error': str(e)}
+        try:
+            if isinstance(payload, str):
+                await self.respond(writer, status, payload.encode(), 'text/plain; version=0.0.4')
+            else:
+                await self.respond(writer, status, json.dumps(payload).encode(), 'application/json')
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'bad request line')
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400, 'bad Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, 'request body too large')
+        body = await reader.readexactly(length) if length else b''
+        url = urlparse(target)
+        return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), headers, body
+
+    async def respond(self, writer, status, body, content_type):
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def route(self, method, path, query, body):
+        loop = asyncio.get_running_loop()
+        parts = path.strip('/').split('/')
+
+        if path == '/health':
+            return 200, {'ok': True, 'active': self.queue.active_count()}
+        if path == '/metrics' and method == 'GET':
+            return 200, metrics.prometheus_text()
+        if path == '/formats' and method == 'GET':
+            url = (query.get('url') or [''])[0]
+            if not url:
+                raise HTTPError(400, 'url is required')
+            from downloader import get_available_formats
+            return 200, await loop.run_in_executor(None, get_available_formats, url)
+        if path == '/bandwidth':
+            if method == 'GET':
+                return 200, governor.settings()
+            if method == 'PUT':
+                return 200, await loop.run_in_executor(None, self.set_bandwidth, self.parse_json(body))
+            raise HTTPError(405, f'{method} not allowed on /bandwidth')
+        if path == '/jobs':
+            if method == 'GET':
+                return 200, [job_dict(job) for job in self.queue.jobs()]
+            if method == 'POST':
+                job = await loop.run_in_executor(None, self.submit, self.parse_json(body))
+                return 201, job_dict(job)
+            raise HTTPError(405, f'{method} not allowed on /jobs')
+
+        if parts[0] == 'jobs' and len(parts) in (2, 3):
+            try:
+                job_id = int(parts[1])
+            except ValueError:
+                raise HTTPError(404, 'no such job')
+            job = self.queue.get(job_id)
+            if job is None:
+                raise HTTPError(404, 'no such job')
+            if len(parts) == 2 and method == 'GET':
+                return 200, dict(job_dict(job), metrics=metrics.get(job_id))
+            if len(parts) == 2 and method == 'DELETE':
+                if not self.queue.cancel(job_id):
+                    raise HTTPError(409, f'job is {job.state}')
+                return 200, job_dict(job)
+            actions = {'pause': self.queue.pause, 'resume': self.queue.resume, 'cancel': self.queue.cancel}
+            if len(parts) == 3 and method == 'POST' and parts[2] in actions:
+                if not await loop.run_in_executor(None, actions[parts[2]], job_id):
+                    raise HTTPError(409, f'job is {job.state}')
+                return 200, job_dict(job)
+            raise HTTPError(405, f'{method} not allowed on {path}')
+        raise HTTPError(404, f'no route for {path}')
+
+    @staticmethod
+    def parse_json(body):
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'body is not valid JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'body must be a JSON object')
+        return data
+
+    @staticmethod
+    def set_bandwidth(data):
+        """Change the limit and/or schedule given in data and keep them for the next start"""
+        if isinstance(data.get('limit'), bool):
+            raise HTTPError(400, 'limit must be a rate such as "2M", a number of bytes/s or null')
+        try:
+            limit = parse_rate(data['limit'] or '') if 'limit' in data else governor.limit
+            schedule = parse_schedule(data['schedule'] or '') if 'schedule' in data else governor.schedule
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        governor.set_limit(limit)
+        governor.set_schedule(schedule)
+        governor.save()
+        return governor.settings()
+
+    def submit(self, data):
+        url = (data.get('url') or '').strip()
+        if not url:
+            raise HTTPError(400, 'url is required')
+        mode = data.get('mode') or 'video'
+        if mode not in ('video', 'audio'):
+            raise HTTPError(400, 'mode must be video or audio')
+        if mode == 'audio':
+            resolution = data.get('audio_format') or audio.DEFAULT_AUDIO_FORMAT
+            if resolution not in audio.AUDIO_FORMATS:
+                raise HTTPError(400, f"audio_format must be one of {', '.join(audio.AUDIO_FORMATS)}")
+        else:
+            resolution = data.get('resolution')
+        max_size = data.get('max_size')
+        if max_size is not None and (not is_integer(max_size) or max_size <= 0):
+            raise HTTPError(400, 'max_size must be a positive number of bytes')
+        engine = data.get('engine')
+        if engine is not None:
+            from downloader import ENGINES
+            if engine not in ENGINES:
+                raise HTTPError(400, f"engine must be one of {', '.join(ENGINES)}")
+        return self.queue.submit(url, mode=mode, resolution=resolution, force=bool(data.get('force')),
+                                 max_size=max_size if mode == 'video' else None,
+                                 engine=engine if mode == 'video' else None)
+
+    async def stream_events(self, writer, query, headers):
+        """Server-sent events: 'progress' (bus events) and 'job' (job state), until the client leaves.
+
+        Event ids are bus sequence numbers; a client reconnecting with
+        Last-Event-ID only gets what changed after it.
+        """
+        job_filter = None
+        if query.get('job'):
+            try:
+                job_filter = int(query['job'][0])
+            except ValueError:
+                raise HTTPError(400, 'job must be a number')
+        try:
+            since = int(headers.get('last-event-id') or 0)
+        except ValueError:
+            since = 0
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        job_version = self.hub.job_version
+        try:
+            if since == 0:
+                # A new client starts with the current state of every job
+                jobs = [job for job in self.queue.jobs() if job_filter in (None, job.id)]
+                writer.write(''.join(f"event: job\ndata: {json.dumps(job_dict(job))}\n\n" for job in jobs).encode())
+            while True:
+                waiter = self.hub.changed
+                chunks = []
+                for job_id, version in list(self.hub.job_changes.items()):
+                    if version > job_version and job_filter in (None, job_id):
+                        job = self.queue.get(job_id)
+                        if job:
+                            chunks.append(f"event: job\ndata: {json.dumps(job_dict(job))}\n\n")
+                job_version = self.hub.job_version
+                events, since = bus.poll(since)
+                for event in events:
+                    if job_filter in (None, event.job_id):
+                        chunks.append(f"id: {event.seq}\nevent: progress\ndata: {json.dumps(asdict(event))}\n\n")
+                if chunks:
+                    writer.write(''.join(chunks).encode())
+                    await writer.drain()
+                try:
+                    await asyncio.wait_for(waiter.wait(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless downloader with a local HTTP/JSON API')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='downloads running at the same time')
+    parser.add_argument('--token', help='require "Authorization: Bearer TOKEN" on every request')
+    parser.add_argument('--no-journal', action='store_true', help="don't keep or restore jobs across restarts")
+    parser.add_argument('--prometheus', action='store_true', help='also keep metrics.prom in the app dir')
+    parser.add_argument('--limit', type=parse_rate, metavar='RATE', default=argparse.SUPPRESS,
+                        help='total download rate shared by all jobs, e.g. 2M or 512K (default: as saved, unlimited)')
+    parser.add_argument('--schedule', type=parse_schedule, metavar='START-END:RATE,...', default=argparse.SUPPRESS,
+                        help='limits by hour of day, e.g. 0-7:unlimited,18-23:512K; other hours use --limit')
+    parser.add_argument('--profile', type=parse_profile, nargs='?', const=('cpu',), metavar='cpu,memory',
+                        help="save a cProfile (cpu) and/or tracemalloc (memory) report of every job's "
+                             "network stage in the app dir's profiles/ (default: cpu)")
+    args = parser.parse_args()
+
+    if args.prometheus:
+        metrics.enable_prometheus()
+    if args.profile:
+        metrics.enable_profiling(cpu='cpu' in args.profile, memory='memory' in args.profile)
+    # Saved settings (PUT /bandwidth, the app), overridden by the options for this run
+    governor.load()
+    if 'limit' in args:
+        governor.set_limit(args.limit)
+    if 'schedule' in args:
+        governor.set_schedule(args.schedule)
+    daemon = Daemon(workers=args.workers, token=args.token, journal=not args.no_journal)
+    try:
+        asyncio.run(daemon.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
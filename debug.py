@@ -1,5 +1,10 @@
 
+import atexit
+import gzip
 import os
+import queue
+import shutil
+import threading
 from datetime import datetime
 
 # Try Android imports
@@ -20,82 +25,216 @@ def get_app_dir():
         # Desktop fallback
         return os.path.expanduser('~/.ytdownloader')
 
-# Use app-specific storage for logs and progress
+# Use app-specific storage for logs (created on the first log write)
 APP_DIR = get_app_dir()
 
-# Create app directory if it doesn't exist
-try:
-    os.makedirs(APP_DIR, exist_ok=True)
-except:
-    pass
-
 LOG_FILE = os.path.join(APP_DIR, "download.log")
-PROGRESS_FILE = os.path.join(APP_DIR, "progress.txt")
 
-# Initialize log file on first import
-try:
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"\n{'='*60}\n")
-        f.write(f"App started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"App directory: {APP_DIR}\n")
-        f.write(f"Android mode: {ANDROID}\n")
-        f.write(f"{'='*60}\n\n")
-except Exception as e:
-    print(f"Could not initialize log file: {e}")
-
-def log(message):
-    """Write log message to file and console"""
+# Log levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+# Messages below this level are dropped
+LOG_LEVEL = DEBUG
+# Messages below this level are only written to the file, not printed
+CONSOLE_LEVEL = INFO
+# Rotate download.log once it grows past this size, keeping LOG_BACKUPS gzipped segments
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+# Writer thread settings
+LOG_QUEUE_SIZE = 5000
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 1.0
+
+class _LogWriter(threading.Thread):
+    """Background thread that appends queued log lines to LOG_FILE in batches"""
+
+    def __init__(self):
+        super().__init__(name='log-writer', daemon=True)
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.file_lock = threading.Lock()
+        self.dropped = 0
+        self._file = None
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = [item]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def put(self, line):
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=2.0):
+        """Block until everything queued so far has been written"""
+        if not self.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+            done.wait(timeout)
+        except queue.Full:
+            pass
+
+    def close_file(self):
+        # Called with file_lock held
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch):
+        lines = []
+        waiters = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                lines.append(item)
+        if self.dropped:
+            lines.append(f"[log] {self.dropped} messages dropped (queue full)")
+            self.dropped = 0
+
+        try:
+            with self.file_lock:
+                if lines:
+                    if self._file is None:
+                        os.makedirs(APP_DIR, exist_ok=True)
+                        self._file = open(LOG_FILE, 'a', encoding='utf-8')
+                    self._file.write('\n'.join(lines) + '\n')
+                    self._file.flush()
+                    if self._file.tell() > LOG_MAX_BYTES:
+                        self._rotate()
+        except Exception as e:
+            print(f"Logging error: {e}")
+        finally:
+            for waiter in waiters:
+                waiter.set()
+
+    def _rotate(self):
+        """Gzip download.log into download.log.1.gz, shifting older segments"""
+        self.close_file()
+        for i in range(LOG_BACKUPS - 1, 0, -1):
+            src = f"{LOG_FILE}.{i}.gz"
+            if os.path.exists(src):
+                os.replace(src, f"{LOG_FILE}.{i + 1}.gz")
+        with open(LOG_FILE, 'rb') as src, gzip.open(f"{LOG_FILE}.1.gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(LOG_FILE)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = _LogWriter()
+                # Startup banner, written once the first message is logged
+                writer.put(
+                    f"\n{'='*60}\n"
+                    f"App started at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"App directory: {APP_DIR}\n"
+                    f"Log file: {LOG_FILE}\n"
+                    f"Android mode: {ANDROID}\n"
+                    f"{'='*60}\n"
+                )
+                writer.start()
+                atexit.register(writer.flush)
+                _writer = writer
+    return _writer
+
+def flush_log():
+    """Wait until all queued log messages are on disk"""
+    _get_writer().flush()
+
+def log(message, level=INFO):
+    """Queue a log message for the log file and print it to the console"""
+    if level < LOG_LEVEL:
+        return
     try:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_message = f"[{timestamp}] {message}"
+        _get_writer().put(log_message)
         
-        # Write to file
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_message + "\n")
-        
-        # Also print to console
-        print(log_message)
+        if level >= CONSOLE_LEVEL:
+            print(log_message)
     except Exception as e:
         print(f"Logging error: {e} - Message was: {message}")
 
-def write_progress(message):
-    """Write progress update to file"""
-    try:
-        with open(PROGRESS_FILE, 'w', encoding='utf-8') as f:
-            f.write(message)
-    except Exception as e:
-        print(f"Progress write error: {e}")
-        log(f"Progress write error: {e}")
+def tail_lines(path, lines=50, block_size=8192):
+    """Return the last N lines of a file, reading backwards from the end in blocks"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        blocks = []
+        newlines = 0
+        # One extra newline is needed because the file normally ends with one
+        while pos > 0 and newlines <= lines:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size)
+            newlines += block.count(b'\n')
+            blocks.append(block)
+    data = b''.join(reversed(blocks))
+    tail = data.splitlines(keepends=True)[-lines:] if lines > 0 else []
+    return b''.join(tail).decode('utf-8', errors='replace')
 
-def get_progress():
-    """Read current progress from file"""
-    try:
-        if os.path.exists(PROGRESS_FILE):
-            with open(PROGRESS_FILE, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                return content if content else "Waiting..."
-        return "Waiting..."
-    except Exception as e:
-        log(f"Error reading progress: {e}")
-        return "Error reading progress"
+def follow_log(position=None, max_bytes=64 * 1024):
+    """Read complete log lines written after `position`.
 
-def clear_progress():
-    """Clear the progress file"""
+    Returns (text, new_position). Pass the returned position back in on the
+    next call; with position=None only the current end of the file is
+    returned. The position remembers which file it belongs to (device and
+    inode), so after a rotation or clear reading restarts at the beginning
+    of the new file, however large it has grown in the meantime.
+    """
+    flush_log()
     try:
-        if os.path.exists(PROGRESS_FILE):
-            os.remove(PROGRESS_FILE)
-            log("Progress file cleared")
-    except Exception as e:
-        print(f"Clear progress error: {e}")
-        log(f"Clear progress error: {e}")
+        f = open(LOG_FILE, 'rb')
+    except OSError:
+        # No log yet; whatever file appears next is read from its start
+        return "", (None, None, 0)
+    with f:
+        stat = os.fstat(f.fileno())
+        identity = (stat.st_dev, stat.st_ino)
+        if position is None:
+            return "", (*identity, stat.st_size)
+        offset = position[2]
+        if tuple(position[:2]) != identity or offset > stat.st_size:
+            offset = 0
+        if offset == stat.st_size:
+            return "", (*identity, offset)
+        f.seek(offset)
+        data = f.read(max_bytes)
+    # Only hand out whole lines; the rest is picked up on the next call
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        if len(data) < max_bytes:
+            return "", (*identity, offset)
+        end = len(data)
+    return data[:end].decode('utf-8', errors='replace'), (*identity, offset + end)
 
 def get_log_content(lines=50):
     """Get the last N lines from the log file"""
     try:
+        flush_log()
         if os.path.exists(LOG_FILE):
-            with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                all_lines = f.readlines()
-                return ''.join(all_lines[-lines:])
+            return tail_lines(LOG_FILE, lines)
         return "No log file found"
     except Exception as e:
         return f"Error reading log: {e}"
@@ -103,16 +242,18 @@ def get_log_content(lines=50):
 def clear_logs():
     """Clear all log files"""
     try:
-        for file in [LOG_FILE, PROGRESS_FILE]:
-            if os.path.exists(file):
-                os.remove(file)
+        writer = _get_writer()
+        writer.flush()
+        with writer.file_lock:
+            writer.close_file()
+            for i in range(1, LOG_BACKUPS + 1):
+                backup = f"{LOG_FILE}.{i}.gz"
+                if os.path.exists(backup):
+                    os.remove(backup)
+            if os.path.exists(LOG_FILE):
+                os.remove(LOG_FILE)
         log("All logs cleared")
         return True
     except Exception as e:
         print(f"Error clearing logs: {e}")
         return False
-
-# Log system info on import
-log(f"Debug module initialized")
-log(f"Log file: {LOG_FILE}")
-log(f"Progress file: {PROGRESS_FILE}")
@@ -0,0 +1,84 @@
+import shutil
+import threading
+from debug import log
+
+# Size estimates (filesize_approx, bitrate * duration) can be this much too low
+ESTIMATE_SLACK = 1.1
+# Space always left free on the device
+MIN_FREE_BYTES = 64 * 1024 * 1024
+# How long a job waits for running jobs to release their space before giving up
+WAIT_LIMIT = 600.0
+WAIT_INTERVAL = 5.0
+
+# Preflight verdicts
+OK = 'ok'
+WAIT = 'wait'
+REJECT = 'reject'
+
+class NotEnoughSpace(Exception):
+    pass
+
+def required_bytes(sizes, merge=False):
+    """Bytes a download needs on disk: the streams, plus the output while merging/converting.
+
+    sizes are the estimated sizes of the streams (None when unknown);
+    returns None if any is unknown. The raw streams stay on disk until
+    ffmpeg has written the output, so merging or converting needs about
+    twice the stream size.
+    """
+    if not sizes or None in sizes:
+        return None
+    total = sum(sizes) * ESTIMATE_SLACK
+    if merge:
+        total *= 2
+    return int(total)
+
+def free_bytes(path):
+    try:
+        return shutil.disk_usage(path).free
+    except OSError as e:
+        log(f"Could not read free space of {path}: {e}")
+        return None
+
+def format_size(size):
+    return f"{size / (1024 * 1024):.0f} MB"
+
+class SpaceLedger:
+    """Space promised to running downloads, so parallel jobs don't all count the same free bytes.
+
+    check() compares a job's requirement with what is free minus what other
+    jobs have reserved. A job that would fit once those jobs are done is
+    told to WAIT, one that cannot fit even on an idle device is REJECTed.
+    Reservations are kept until release(), which the JobQueue calls when
+    the job finishes (after post-processing).
+    """
+
+    def __init__(self):
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def reserved(self, exclude=None):
+        with self._lock:
+            return sum(size for job_id, size in self._reserved.items() if job_id != exclude)
+
+    def check(self, job_id, path, needed):
+        """(verdict, free bytes); on OK the space is reserved for job_id"""
+        free = free_bytes(path)
+        if free is None or needed is None:
+            return OK, free
+        with self._lock:
+            others = sum(size for other, size in self._reserved.items() if other != job_id)
+            if needed + MIN_FREE_BYTES <= free - others:
+                if job_id is not None:
+                    self._reserved[job_id] = needed
+                return OK, free
+        if others and needed + MIN_FREE_BYTES <= free:
+            return WAIT, free
+        return REJECT, free
+
+    def release(self, job_id):
+        with self._lock:
+            self._reserved.pop(job_id, None)
+
+# Shared space reservations for all jobs
+ledger = SpaceLedger()
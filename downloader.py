@@ -1,9 +1,28 @@
 import subprocess
+import functools
 import json
 import os
-import re
+import tempfile
+import time
 from ffmpeg import get_ffmpeg_path, ensure_ffmpeg
-from debug import log, write_progress
+from binaries import resolve, get_version
+from debug import log, DEBUG, APP_DIR
+from cache import get_cached_info, get_info_path, store_info, video_id_from_url
+import archive
+from bandwidth import governor
+from pacing import pacer, classify_line, worse, THROTTLED, TRANSIENT, PERMANENT
+from tuning import tuner, format_kind, ThroughputMeter
+import segmented
+import diskspace
+import staging
+import audio
+import formats
+import postprocess
+import procengine
+from watchdog import watchdog, MAX_STALL_RESTARTS
+from metrics import metrics, RESOLVE, FFMPEG, PROBE, DOWNLOAD, POSTPROCESS, FINALIZE
+import jobs
+import progress
 
 # Try Android imports
 try:
@@ -22,17 +41,11 @@ def get_ytdlp_path():
         # System installed
         '/data/data/org.wilddrs.ytdownloader/files/app/binaries/yt-dlp',
         '/data/data/org.wilddrs.ytdownloader/files/binaries/yt-dlp',
-        'yt-dlp'
     ]
     
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                os.chmod(path, 0o755)
-                log(f"Using yt-dlp from: {path}")
-                return path
-            except:
-                pass
+    path = resolve('yt-dlp', possible_paths, use_path=True)
+    if path:
+        return path
     
     # Fallback
     log("Warning: yt-dlp not found in expected locations, using 'yt-dlp'")
@@ -71,41 +84,162 @@ def get_download_dir():
         # Desktop fallback
         return os.path.expanduser('~/Downloads')
 
-YTDLP_PATH = get_ytdlp_path()
-DOWNLOAD_DIR = get_download_dir()
+@functools.lru_cache(maxsize=None)
+def ytdlp_path():
+    """yt-dlp path, resolved on first use instead of at import"""
+    return get_ytdlp_path()
+
+@functools.lru_cache(maxsize=None)
+def download_dir():
+    """Download directory, resolved (and created) on first use instead of at import"""
+    return get_download_dir()
+
+def __getattr__(name):
+    # Keep downloader.YTDLP_PATH / downloader.DOWNLOAD_DIR working without import-time probing
+    if name == 'YTDLP_PATH':
+        return ytdlp_path()
+    if name == 'DOWNLOAD_DIR':
+        return download_dir()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Resolve binaries and storage ahead of the first download (call off the UI thread)"""
+    ytdlp_path()
+    download_dir()
+    get_ffmpeg_path()
+    # Run once per binary update, then read from the manifest
+    log(f"yt-dlp {get_version('yt-dlp') or 'version unknown'}; "
+        f"{get_version('ffmpeg', ('-version',)) or 'ffmpeg version unknown'}")
+
+# Output template of downloads yt-dlp finishes itself (see staging_args); the
+# id keeps two videos with the same title apart, as in output_path_for
+OUTPUT_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+
+# Minimum seconds between two published progress updates of a job
+PROGRESS_INTERVAL = 0.25
+# Output tags of yt-dlp's ffmpeg post-processors, which print nothing while they work
+POSTPROCESSOR_TAGS = ('[Merger]', '[ExtractAudio]', '[VideoRemuxer]', '[VideoConvertor]', '[FixupM3u8]',
+                      '[FixupM4a]', '[FixupStretched]', '[FixupDuplicateMoov]', '[FixupTimestamp]',
+                      '[FixupDuration]', '[Metadata]', '[EmbedThumbnail]', '[EmbedSubtitle]', '[ModifyChapters]')
+# Minimum seconds between two progress lines of a job in the log
+PROGRESS_LOG_INTERVAL = 5.0
+
 YTDLP_USER_AGENT = ("Mozilla/5.0 (Linux; Android 13) "
                     "AppleWebKit/537.36 (KHTML, like Gecko) "
                     "Chrome/118.0.0.0 Mobile Safari/537.36")
 
+# 'yt-dlp' downloads with yt-dlp itself; 'segmented' fetches plain HTTP
+# formats over several connections (see segmented.py) and merges with ffmpeg.
+# Chosen per job (Job.engine); videos without such formats use yt-dlp anyway.
+ENGINES = ('yt-dlp', 'segmented')
+DEFAULT_ENGINE = 'yt-dlp'
+
+def extract_info(url, refresh=False):
+    """Get yt-dlp metadata for a URL, using the on-disk cache when possible"""
+    if not refresh:
+        info = get_cached_info(url)
+        if info is not None:
+            return info
+
+    result = procengine.engine.run([ytdlp_path(), "-j", url], check=True, timeout=30)
+    info = json.loads(result.stdout)
+    store_info(info, raw=result.stdout)
+    return info
+
+def source_args(url):
+    """yt-dlp arguments naming what to download: cached info JSON or the URL"""
+    info_path = get_info_path(url)
+    if info_path:
+        log(f"Reusing cached metadata: {info_path}")
+        return ["--load-info-json", info_path]
+    return [url]
+
+def archived_download(url, mode, resolution=None):
+    """Return (True, path) if the archive says this download already happened"""
+    video_id = video_id_from_url(url)
+    if not video_id:
+        return False, None
+    return archive.lookup(video_id, mode, resolution)
+
+def archive_args(mode, resolution=None, force=False):
+    """Let yt-dlp maintain its --download-archive file too, so batch runs skip the same videos"""
+    if force:
+        return []
+    return ["--download-archive", archive.get_ytdlp_archive_path(mode, resolution)]
+
+def staging_args(job=None):
+    """yt-dlp paths: work (fragments, .part files, merging) and leave the result in the job's staging
+    directory; run_single moves it into the download directory. They only apply to a relative -o template.
+
+    yt-dlp's own move copies across filesystems without fsync and under the
+    final name, so partial files would show up in the download directory.
+    """
+    directory = staging.job_dir(job.id if job else None)
+    return ["-P", f"home:{directory}", "-P", f"temp:{directory}"]
+
+def discard_job_files(job):
+    """Remove the working files a stopped or finished job left in the staging directory"""
+    video_id = video_id_from_url(job.url)
+    # Raw streams are named by raw_stream_template
+    staging.discard(job.id, [f".{video_id}.j{job.id}."] if video_id else [])
+
+def new_output_path_file():
+    """Temporary file that yt-dlp writes the final output path into"""
+    os.makedirs(APP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='filepath-', suffix='.txt', dir=APP_DIR)
+    os.close(fd)
+    return path
+
+def read_output_paths(path_file):
+    """Read (and delete) the file written by --print-to-file after_move:filepath"""
+    try:
+        with open(path_file, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        os.remove(path_file)
+        return lines
+    except OSError as e:
+        log(f"Could not read output path: {e}")
+        return []
+
+def read_output_path(path_file):
+    """Final output path of a single-file download, or None"""
+    paths = read_output_paths(path_file)
+    return paths[-1] if paths else None
+
+def record_download(url, mode, resolution, output_path, job=None, ytdlp_archive=False):
+    """Add a finished download to the archive.
+
+    ytdlp_archive also adds it to yt-dlp's archive file, for downloads that
+    were finished outside yt-dlp (see archive_args).
+    """
+    if job and output_path:
+        job.output_path = output_path
+    video_id = video_id_from_url(url)
+    if video_id and output_path:
+        archive.record(video_id, mode, resolution, output_path)
+        if ytdlp_archive:
+            archive.record_ytdlp(video_id, mode, resolution)
+
+def already_downloaded(url, mode, resolution=None, job=None):
+    """Finish instantly if the archive has this download; returns the result message or None"""
+    done, path = archived_download(url, mode, resolution)
+    if not done:
+        return None
+    log(f"Already downloaded ({mode}, {resolution}): {path or url}")
+    if job:
+        job.returncode = 0
+        if path:
+            job.output_path = path
+    progress.bus.publish(job.id if job else None, phase=progress.FINISHED, percent=100.0,
+                         message="Already downloaded")
+    return f"✓ Already downloaded!\n\nSaved to: {path or download_dir()}"
+
 def get_available_formats(url):
-    """Fetch available video formats/resolutions"""
+    """Fetch available video resolutions: {"WxH": {"id", "fps"}}, highest first"""
     log(f"Fetching formats for: {url}")
     try:
-        result = subprocess.run(
-            [YTDLP_PATH, "-j", url], 
-            capture_output=True, 
-            text=True, 
-            check=True,
-            timeout=30
-        )
-        info = json.loads(result.stdout)
-        formats = info.get("formats", [])
-        available_res = {}
-        target_res = {
-            "7680x4320": "8K", 
-            "3840x2160": "4K",
-            "2560x1440": "2K", 
-            "1920x1080": "1080p",
-            "1280x720": "720p"
-        }
-        
-        for f in formats:
-            if f.get("vcodec") != "none" and f.get("height") and f.get("width"):
-                res_str = f"{f['width']}x{f['height']}"
-                fps = f.get("fps", 0)
-                if res_str in target_res and res_str not in available_res:
-                    available_res[res_str] = {"id": f["format_id"], "fps": fps}
-        
+        info = extract_info(url)
+        available_res = formats.resolution_options(info)
         log(f"Found {len(available_res)} formats")
         return available_res
     except subprocess.CalledProcessError as e:
@@ -121,8 +255,44 @@ def get_available_formats(url):
         log(traceback.format_exc())
         return {}
 
-def run_with_progress(cmd, prefix="Downloading"):
-    """Run subprocess and capture progress in real-time"""
+def handle_output_line(line, job_id, job=None):
+    """Handle a non-progress line of yt-dlp output; returns its error class"""
+    log(line, DEBUG)
+    if line.startswith('ERROR') or line.startswith('WARNING'):
+        return classify_line(line)
+    if line.startswith('[Merger]'):
+        progress.bus.publish(job_id, phase=progress.MERGING, message="Merging video and audio...")
+        if job:
+            job.set_state(jobs.POST_PROCESSING)
+    elif line.startswith('[ExtractAudio]'):
+        progress.bus.publish(job_id, phase=progress.EXTRACTING, message="Extracting audio...")
+        if job:
+            job.set_state(jobs.POST_PROCESSING)
+    elif line.startswith('[download] Destination'):
+        progress.bus.publish(job_id, message="Preparing download...")
+    return None
+
+def run_with_progress(cmd, prefix="Downloading", job=None, progress_interval=PROGRESS_INTERVAL, url=None,
+                      meter=None):
+    """Run yt-dlp and publish its progress in real-time.
+
+    cmd must include --progress-template PROGRESS_TEMPLATE (see progress.py);
+    progress records are throttled to one per progress_interval seconds
+    (one per PROGRESS_LOG_INTERVAL in the log), everything else goes to
+    handle_output_line. Errors are classified and,
+    if url is given, fed back to the request pacer for its host. A
+    ThroughputMeter passed as meter sees every progress record.
+
+    The stall watchdog follows the run: a download crawling far below the
+    job's peak speed, or printing nothing at all, is stopped and the job
+    restarted (yt-dlp resumes from the .part file).
+
+    The output is read on the process engine's event loop (see
+    procengine.py); the calling thread only waits for the exit code.
+
+    The run counts as the job's download phase (post-processing once yt-dlp
+    starts merging or converting) in its metrics.
+    """
     # Set environment for ffmpeg
     env = os.environ.copy()
     ffmpeg_path = get_ffmpeg_path()
@@ -133,41 +303,97 @@ def run_with_progress(cmd, prefix="Downloading"):
     log(f"Running command: {' '.join(cmd)}")
     
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1,
-            env=env
+        process = procengine.engine.spawn(cmd, env=env)
+        job_id = job.id if job else None
+        if job:
+            job.attach_process(process)
+        
+        stalled = []
+        def on_stall(reason):
+            stalled.append(reason)
+            if job:
+                job.stall_restarts += 1
+                if (job.stall_restarts <= MAX_STALL_RESTARTS
+                        and job.request_restart(f"download stalled ({reason})")):
+                    return
+            jobs.kill_process(process)
+        monitor = watchdog.watch(
+            on_stall,
+            peak=job.peak_speed if job else 0.0,
+            restarts_left=MAX_STALL_RESTARTS - job.stall_restarts if job else MAX_STALL_RESTARTS
         )
         
-        for line in process.stdout:
-            line = line.strip()
+        last_published = 0.0
+        last_logged = 0.0
+        error_class = None
+        metrics.enter(job_id, DOWNLOAD)
+        started = time.monotonic()
+        download_ended = None
+        peak_speed = 0.0
+        def on_line(line):
+            # Called on the process engine's loop for every line of output
+            nonlocal last_published, last_logged, error_class, download_ended, peak_speed
+            monitor.activity()
+            if not line.startswith(progress.RECORD_PREFIX):
+                if line.startswith(POSTPROCESSOR_TAGS) and download_ended is None:
+                    # ffmpeg works silently until the next file starts downloading (if any)
+                    monitor.suspend()
+                    download_ended = time.monotonic()
+                    metrics.enter(job_id, POSTPROCESS)
+                error_class = worse(error_class, handle_output_line(line.strip(), job_id, job))
+                return
             
-            # Look for download progress patterns
-            if '[download]' in line:
-                match = re.search(r'(\d+\.?\d*)%', line)
-                if match:
-                    percent = match.group(1)
-                    write_progress(f"{prefix}: {percent}%")
-                    log(line)
-                elif 'ETA' in line:
-                    write_progress(f"{prefix}: {line}")
-                    log(line)
-            elif 'Merging' in line or 'merge' in line.lower():
-                write_progress("Merging video and audio...")
-                log(line)
-            elif 'Extracting' in line:
-                write_progress("Extracting audio...")
-                log(line)
-            elif 'Destination' in line:
-                write_progress("Preparing download...")
-                log(line)
-            else:
-                log(line)
+            fields = progress.parse_progress_record(line)
+            if fields is None:
+                return
+            if download_ended is not None:
+                # Post-processing of the previous file is done; back to downloading
+                monitor.resume()
+                download_ended = None
+                metrics.enter(job_id, DOWNLOAD)
+            monitor.progress(fields['downloaded_bytes'], fields['status'] == 'finished')
+            peak_speed = max(peak_speed, fields['speed'] or 0.0)
+            if meter:
+                meter.update(fields['downloaded_bytes'])
+            now = time.monotonic()
+            if fields['status'] == 'finished' or now - last_logged >= PROGRESS_LOG_INTERVAL:
+                last_logged = now
+                percent = fields['percent']
+                done = f"{percent:.1f}%" if percent is not None else diskspace.format_size(fields['downloaded_bytes'] or 0)
+                speed = f" at {diskspace.format_size(fields['speed'])}/s" if fields['speed'] else ""
+                log(f"{prefix}: {done}{speed}", DEBUG)
+            if fields['status'] != 'finished' and now - last_published < progress_interval:
+                return
+            last_published = now
+            
+            del fields['status']
+            percent = fields['percent']
+            message = f"{prefix}: {percent:.1f}%" if percent is not None else f"{prefix}..."
+            progress.bus.publish(job_id, phase=progress.DOWNLOADING, message=message, **fields)
+            if job:
+                job.set_state(jobs.DOWNLOADING)
+        
+        try:
+            process.stream(on_line)
+        finally:
+            watchdog.unwatch(monitor)
+            if job:
+                job.peak_speed = monitor.peak
+            metrics.transfer(job_id, monitor.downloaded_bytes, (download_ended or time.monotonic()) - started,
+                             peak_speed)
+            metrics.leave(job_id)
         
-        process.wait()
+        if stalled and not (job and job.restart_requested):
+            # Stopped by the watchdog without a restart: let the retry logic have it
+            error_class = worse(error_class, TRANSIENT)
+        if job:
+            job.returncode = process.returncode
+            job.error_class = error_class
+        if url and not (job and job.stop_requested):
+            if error_class == THROTTLED:
+                pacer.report(url, THROTTLED)
+            elif process.returncode == 0 and error_class is None:
+                pacer.report(url, None)
         return process.returncode
     except Exception as e:
         log(f"Error running command: {e}")
@@ -175,135 +401,537 @@ def run_with_progress(cmd, prefix="Downloading"):
         log(traceback.format_exc())
         return 1
 
-def download_video(url, selected_res=None):
-    """Download video with real-time progress tracking"""
-    try:
-        ffmpeg_path = ensure_ffmpeg()
-        log(f"FFmpeg verified at: {ffmpeg_path}")
-    except Exception as e:
-        error_msg = f"ERROR: FFmpeg not found - {str(e)}"
-        log(error_msg)
-        return error_msg
-    
-    if not url.strip():
-        return "ERROR: Invalid URL"
+def safe_filename(name):
+    """Title usable as a file name on Android and desktop filesystems"""
+    name = ''.join('_' if c in '/\\:*?"<>|' or ord(c) < 32 else c for c in name).strip(' .')
+    return name[:200] or 'video'
 
-    log(f"Starting video download for: {url}")
-    log(f"Selected resolution: {selected_res}")
-    
-    height_map = {
-        "7680x4320": "4320",
-        "3840x2160": "2160",
-        "2560x1440": "1440",
-        "1920x1080": "1080",
-        "1280x720": "720"
-    }
-    
-    height = height_map.get(selected_res or "1920x1080", "1080")
-    
-    # Create output filename template
-    output_file = os.path.join(DOWNLOAD_DIR, "%(title)s.%(ext)s")
-    log(f"Output template: {output_file}")
+def output_path_for(info, ext):
+    """Final file name for a download finished by the post-processing stage: "<title> [<id>].<ext>",
+    like OUTPUT_TEMPLATE (staging.finalize still never replaces an existing file)"""
+    title = safe_filename(info.get("title") or info.get("id") or "video")
+    video_id = info.get("id")
+    name = f"{title} [{safe_filename(video_id)}]" if video_id and video_id != title else title
+    return os.path.join(download_dir(), f"{name}.{ext}")
+
+def raw_stream_template(job=None):
+    """yt-dlp output template for raw (not yet merged) formats: in the staging directory, and
+    per job so that two jobs for the same video never share (and delete) each other's streams"""
+    name = f".%(id)s.j{job.id}" if job else ".%(id)s"
+    return os.path.join(staging.staging_dir(), name + ".f%(format_id)s.%(ext)s")
+
+def raw_stream_path(info, f, job=None):
+    """Path raw_stream_template gives one format"""
+    return (raw_stream_template(job).replace("%(id)s", info.get("id", "video"))
+            .replace("%(format_id)s", f["format_id"]).replace("%(ext)s", f["ext"]))
+
+def merge_task(ffmpeg_path, video_path, audio_path, output_path, on_success=None):
+    """Post-processing task that muxes a video and an audio stream into an mp4 without re-encoding"""
+    return postprocess.Task(
+        ffmpeg_path, [video_path, audio_path],
+        ["-map", "0:v:0", "-map", "1:a:0", "-c", "copy", "-movflags", "+faststart"],
+        output_path, "Merging video and audio", on_success
+    )
+
+def hand_off(task, job=None):
+    """Pass a post-processing task on; returns its exit code, or None if it was queued.
+
+    Jobs hand it to the JobQueue (via job.pending_task), which queues it on
+    the post-processing pool so the download worker is free for the next
+    job. Without a job the task runs right away.
+    """
+    if job:
+        job.pending_task = task
+        job.set_state(jobs.POST_PROCESSING, 'Waiting for post-processing')
+        return None
+    return task.run()
+
+def resolve_binaries(job_id=None):
+    """Resolve yt-dlp and return the ffmpeg path (raises if it is missing), timed in the job's metrics"""
+    with metrics.span(job_id, RESOLVE):
+        ytdlp_path()
+    with metrics.span(job_id, FFMPEG):
+        return ensure_ffmpeg()
 
-    cmd = [
-        YTDLP_PATH,
-        "-f", f"bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<={height}]+bestaudio/best[height<={height}]/best",
-        "-o", output_file,
-        "--merge-output-format", "mp4",
-        "--ffmpeg-location", os.path.dirname(ffmpeg_path),
+def check_disk_space(sizes, job=None, merge=False):
+    """Make sure the download fits on the device before anything is fetched.
+
+    sizes are the estimated sizes of the streams to download; merge adds
+    room for ffmpeg's output. If the space is only taken by other running
+    jobs, the job waits (up to diskspace.WAIT_LIMIT) for them to finish.
+    Raises diskspace.NotEnoughSpace, after marking the job failed for good,
+    when the download cannot fit.
+    """
+    job_id = job.id if job else None
+    needed = diskspace.required_bytes(sizes, merge)
+    if needed is None:
+        log("Download size unknown, skipping the disk space check")
+        return
+    if not staging.same_filesystem(staging.staging_dir(), download_dir()):
+        # Only the finished file goes to the download directory
+        output = diskspace.required_bytes(sizes)
+        free = diskspace.free_bytes(download_dir())
+        if free is not None and output + diskspace.MIN_FREE_BYTES > free:
+            _not_enough_space(output, free, job)
+    waited = 0.0
+    while True:
+        verdict, free = diskspace.ledger.check(job_id, staging.staging_dir(), needed)
+        if verdict == diskspace.OK:
+            if free is not None:
+                log(f"Disk space: need about {diskspace.format_size(needed)}, {diskspace.format_size(free)} free")
+            return
+        if verdict != diskspace.WAIT or job is None or waited >= diskspace.WAIT_LIMIT:
+            break
+        if waited == 0.0:
+            log(f"Job {job_id} waits for disk space held by other downloads")
+            job.set_state(jobs.PROBING, 'Waiting for disk space')
+            progress.bus.publish(job_id, phase=progress.PREPARING, message="Waiting for disk space...")
+        if job.wait(diskspace.WAIT_INTERVAL):
+            # Stopped; the download that follows is killed as soon as it starts
+            return
+        waited += diskspace.WAIT_INTERVAL
+
+    _not_enough_space(needed, free, job)
+
+def _not_enough_space(needed, free, job=None):
+    job_id = job.id if job else None
+    message = (f"Not enough storage space: need about {diskspace.format_size(needed)}, "
+               f"{diskspace.format_size(free)} free")
+    log(message)
+    if job:
+        job.returncode = 1
+        job.error_class = PERMANENT
+    progress.bus.publish(job_id, phase=progress.FAILED, message=f"ERROR: {message}")
+    raise diskspace.NotEnoughSpace(message)
+
+FAILED_MSG = ("✗ Download failed (error code: {})\n\nPlease check:\n"
+              "• Internet connection\n• URL is valid\n• Storage permissions")
+
+def ytdlp_args(url, job_id=None):
+    """yt-dlp options shared by every download run: browser-like request headers, request
+    pacing, progress records (see progress.py) and the job's share of the bandwidth budget"""
+    return [
         "--user-agent", YTDLP_USER_AGENT,
         "--referer", url,
         "--add-header", "Accept:text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         "--add-header", "Accept-Language:en-us,en;q=0.5",
-        "--retries", "10",
-        "--fragment-retries", "10",
-        "--extractor-retries", "5",
+        *pacer.yt_dlp_args(url),
         "--no-check-certificates",
         "--geo-bypass",
-        "--sleep-requests", "1",
-        "--http-chunk-size", "10M",
         "--newline",
-        url
+        "--progress-template", progress.PROGRESS_TEMPLATE,
+        *governor.rate_args(job_id),
     ]
-    
-    write_progress("Starting video download...")
-    
-    try:
-        returncode = run_with_progress(cmd, "VIDEO")
-        
-        if returncode == 0:
-            write_progress("SUCCESS: Video download complete")
-            log("Video download successful")
-            return f"✓ Video downloaded successfully!\n\nSaved to: {DOWNLOAD_DIR}\n\nCheck your Downloads folder."
-        else:
-            write_progress("ERROR: Video download failed")
-            log(f"Video download failed with code {returncode}")
-            return f"✗ Download failed (error code: {returncode})\n\nPlease check:\n• Internet connection\n• URL is valid\n• Storage permissions"
-            
-    except Exception as e:
-        log(f"Unexpected error: {e}")
-        import traceback
-        log(traceback.format_exc())
-        write_progress("ERROR: Unexpected error occurred")
-        return f"✗ Error: {str(e)}"
 
-def download_audio(url):
-    """Download audio only and convert to MP3"""
+def ytdlp_command(url, format_spec, output_template, path_file, job_id=None, extra_args=()):
+    """yt-dlp download command; the final output path(s) are written to path_file"""
+    return [
+        ytdlp_path(),
+        "-f", format_spec,
+        "-o", output_template,
+        *extra_args,
+        *ytdlp_args(url, job_id),
+        "--print-to-file", "after_move:filepath", path_file,
+        *source_args(url)
+    ]
+
+def download_failed(kind, returncode, job_id=None):
+    """Report a failed download run; returns the result message"""
+    progress.bus.publish(job_id, phase=progress.FAILED, message=f"ERROR: {kind} download failed")
+    log(f"{kind} download failed with code {returncode}")
+    return FAILED_MSG.format(returncode)
+
+def unexpected_error(e, job_id=None):
+    """Report an exception of a download; returns the result message"""
+    log(f"Unexpected error: {e}")
+    import traceback
+    log(traceback.format_exc())
+    progress.bus.publish(job_id, phase=progress.FAILED, message="ERROR: Unexpected error occurred")
+    return f"✗ Error: {str(e)}"
+
+def start_download(url, mode, archive_key, job=None, force=False):
+    """Checks before a download: the archive, ffmpeg and the URL.
+
+    Returns (ffmpeg_path, None) to go ahead, or (None, result message) if
+    the download was done before or cannot run.
+    """
+    if not force and url.strip():
+        result = already_downloaded(url, mode, archive_key, job)
+        if result:
+            return None, result
     try:
-        ffmpeg_path = ensure_ffmpeg()
+        ffmpeg_path = resolve_binaries(job.id if job else None)
         log(f"FFmpeg verified at: {ffmpeg_path}")
     except Exception as e:
         error_msg = f"ERROR: FFmpeg not found - {str(e)}"
         log(error_msg)
-        return error_msg
-    
+        return None, error_msg
     if not url.strip():
-        return "ERROR: Invalid URL"
+        return None, "ERROR: Invalid URL"
+    return ffmpeg_path, None
 
-    log(f"Starting audio download for: {url}")
-    
-    output_file = os.path.join(DOWNLOAD_DIR, "%(title)s.%(ext)s")
+def probe(url, job_id=None):
+    """Metadata for choosing formats, or None if it can't be fetched (yt-dlp then chooses itself)"""
+    try:
+        with metrics.span(job_id, PROBE):
+            return extract_info(url)
+    except Exception as e:
+        log(f"No metadata, leaving format choice to yt-dlp: {e}")
+        return None
+
+def record_transfer(settings, meter, job_id=None):
+    """Feed a finished download's throughput back to the tuner"""
+    # A rate-limited run says nothing about how good the settings are
+    if governor.rate_for(job_id) is None:
+        tuner.record(settings, meter.throughput())
+
+def download_streams(url, stream_formats, info, prefix, job=None, extra_args=(), meter=None):
+    """Network stage: download each format to its own raw file, without merging or converting.
+
+    Returns (returncode, paths) with one path per format, in order. A run
+    that exits 0 without reporting every file counts as failed.
+    """
+    job_id = job.id if job else None
+    path_file = new_output_path_file()
+    cmd = ytdlp_command(url, ",".join(f["format_id"] for f in stream_formats), raw_stream_template(job),
+                        path_file, job_id, extra_args)
+    returncode = run_with_progress(cmd, prefix, job=job, url=url, meter=meter)
+    written = read_output_paths(path_file)
+    paths = []
+    for f in stream_formats:
+        marker = f".f{f['format_id']}."
+        paths.append(next((p for p in written if marker in os.path.basename(p)), None))
+    if returncode == 0 and None in paths:
+        log(f"yt-dlp did not report all stream files: {paths}")
+        returncode = 1
+        if job:
+            job.returncode = 1
+    return returncode, paths
+
+def run_single(url, format_spec, prefix, job=None, extra_args=(), meter=None):
+    """One yt-dlp run that downloads and post-processes by itself; returns (returncode, output path).
+
+    yt-dlp leaves the file in the job's staging directory (see staging_args);
+    it is moved into the download directory with staging.finalize. A run
+    that exits 0 without reporting its output file (yt-dlp skipped the
+    video, e.g. from its --download-archive) counts as failed.
+    """
+    output_file = os.path.join(download_dir(), OUTPUT_TEMPLATE)
     log(f"Output template: {output_file}")
+    path_file = new_output_path_file()
+    if job:
+        job.format = format_spec
+        job.output_path = output_file
+    job_id = job.id if job else None
+    cmd = ytdlp_command(url, format_spec, OUTPUT_TEMPLATE, path_file, job_id,
+                        [*staging_args(job), *extra_args])
+    returncode = run_with_progress(cmd, prefix, job=job, url=url, meter=meter)
+    output_path = read_output_path(path_file)
+    if returncode == 0 and output_path is None:
+        log("yt-dlp finished without reporting an output file")
+        returncode = 1
+        if job:
+            job.returncode = 1
+    if returncode == 0:
+        with metrics.span(job_id, FINALIZE):
+            output_path = staging.finalize(output_path, os.path.join(download_dir(), os.path.basename(output_path)))
+    return returncode, output_path
 
-    cmd = [
-        YTDLP_PATH,
-        "-f", "bestaudio/best",
-        "-o", output_file,
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",
-        "--ffmpeg-location", os.path.dirname(ffmpeg_path),
-        "--user-agent", YTDLP_USER_AGENT,
-        "--referer", url,
-        "--add-header", "Accept:text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "--add-header", "Accept-Language:en-us,en;q=0.5",
-        "--retries", "10",
-        "--fragment-retries", "10",
-        "--extractor-retries", "5",
-        "--no-check-certificates",
-        "--geo-bypass",
-        "--sleep-requests", "1",
-        "--newline",
-        url
-    ]
+def download_video_segmented(url, max_height, job=None, max_size=None):
+    """Download video and audio with the segmented engine.
+
+    Returns (info, formats.Selection, raw paths), or None if the video has
+    no separate plain HTTP formats (the caller then falls back to yt-dlp).
+    Raises on download errors.
+    """
+    job_id = job.id if job else None
+    # Media URLs expire; only use cached metadata while they are still valid
+    with metrics.span(job_id, PROBE):
+        info = extract_info(url, refresh=get_info_path(url) is None)
+    selection = formats.select(info, max_height, max_size, direct_only=True)
+    if selection is None or selection.audio is None:
+        log("No plain HTTP formats for the segmented engine")
+        return None
+    log(f"Selected formats: {selection}")
+    check_disk_space([selection.size], job, merge=True)
+
+    should_stop = (lambda: job.stop_requested) if job else None
+    # The job's share of the bandwidth budget; the governor updates it while the streams download
+    limiter = segmented.RateLimiter(governor.rate_for(job_id))
+    if job:
+        job.apply_rate = limiter.set_rate
+    try:
+        parts = [_fetch_segmented(info, f, kind, job, should_stop, limiter)
+                 for kind, f in zip(("VIDEO", "AUDIO"), selection.formats)]
+    finally:
+        if job:
+            job.apply_rate = None
+    return info, selection, parts
+
+def _fetch_segmented(info, f, kind, job, should_stop, limiter):
+    """Download one format with the segmented engine unless a verified copy is there; returns its path"""
+    job_id = job.id if job else None
+    part = raw_stream_path(info, f, job)
+    last_published = [0.0]
+
+    def on_progress(downloaded, total):
+        now = time.monotonic()
+        if now - last_published[0] < PROGRESS_INTERVAL and downloaded != total:
+            return
+        last_published[0] = now
+        percent = downloaded * 100.0 / total if total else None
+        message = f"{kind}: {percent:.1f}%" if percent is not None else f"{kind}..."
+        progress.bus.publish(job_id, phase=progress.DOWNLOADING, message=message, percent=percent,
+                             downloaded_bytes=downloaded, total_bytes=total)
+
+    # A finished (length-verified) part survives a failed merge; don't fetch it again
+    if not os.path.exists(part):
+        log(f"Segmented download of format {f['format_id']} to {part}")
+        if job:
+            job.set_state(jobs.DOWNLOADING)
+        fetch = segmented.SegmentedDownload(f["url"], part, f.get("http_headers"), progress_callback=on_progress,
+                                            should_stop=should_stop, limiter=limiter)
+        started = time.monotonic()
+        try:
+            with metrics.span(job_id, DOWNLOAD):
+                fetch.run()
+        finally:
+            metrics.transfer(job_id, fetch.downloaded - fetch.resumed, time.monotonic() - started)
+    return part
+
+def video_success_msg():
+    return f"✓ Video downloaded successfully!\n\nSaved to: {download_dir()}\n\nCheck your Downloads folder."
+
+def video_finished(url, selected_res, job=None, force=False):
+    """on_success callback of a video's merge task: archive the file and report success"""
+    def finished(output_path):
+        record_download(url, 'video', selected_res, output_path, job, ytdlp_archive=not force)
+        if job:
+            job.result = video_success_msg()
+        progress.bus.publish(job.id if job else None, phase=progress.FINISHED, percent=100.0,
+                             message="SUCCESS: Video download complete")
+        log("Video download successful")
+    return finished
+
+def merge_video(ffmpeg_path, info, paths, on_success, job=None):
+    """Hand the merge of downloaded video and audio streams on; returns the result message"""
+    task = merge_task(ffmpeg_path, paths[0], paths[1], output_path_for(info, "mp4"), on_success)
+    returncode = hand_off(task, job)
+    if returncode is None:
+        return "✓ Downloaded, merging video and audio..."
+    if returncode == 0:
+        return video_success_msg()
+    progress.bus.publish(job.id if job else None, phase=progress.FAILED, message="ERROR: Merging failed")
+    return f"✗ Merging failed: {task.error}"
+
+def _video_segmented(url, height, ffmpeg_path, on_success, job=None, max_size=None):
+    """Segmented engine path; returns the result message, or None to fall back to yt-dlp"""
+    try:
+        downloaded = download_video_segmented(url, height, job, max_size)
+    except segmented.DownloadStopped:
+        return "✗ Download stopped"
+    except diskspace.NotEnoughSpace as e:
+        return f"✗ {e}"
+    except Exception as e:
+        log(f"Segmented download failed: {e}")
+        if job:
+            job.returncode = 1
+            job.error_class = TRANSIENT
+        progress.bus.publish(job.id if job else None, phase=progress.FAILED, message="ERROR: Video download failed")
+        return f"✗ Error: {str(e)}"
+    if not downloaded:
+        return None
+    info, selection, parts = downloaded
+    if job:
+        job.returncode = 0
+        job.format = selection.format_ids
+        job.output_path = output_path_for(info, "mp4")
+    return merge_video(ffmpeg_path, info, parts, on_success, job)
+
+def _video_streams(url, info, selection, settings, meter, ffmpeg_path, on_success, job=None):
+    """yt-dlp fetches the selected formats as raw files, the post-processing pool merges them"""
+    job_id = job.id if job else None
+    if job:
+        job.format = selection.format_ids
+        job.output_path = output_path_for(info, "mp4")
+    try:
+        check_disk_space([selection.size], job, merge=True)
+        returncode, paths = download_streams(url, selection.formats, info, "VIDEO", job,
+                                             settings.yt_dlp_args(), meter)
+        if returncode != 0:
+            return download_failed("Video", returncode, job_id)
+        record_transfer(settings, meter, job_id)
+        return merge_video(ffmpeg_path, info, paths, on_success, job)
+    except diskspace.NotEnoughSpace as e:
+        return f"✗ {e}"
+    except Exception as e:
+        return unexpected_error(e, job_id)
+
+def _video_single_run(url, height, selected_res, selection, settings, meter, ffmpeg_path, job=None, force=False,
+                      max_size=None):
+    """yt-dlp downloads and merges in one run (formats unknown, or a single combined format)"""
+    job_id = job.id if job else None
+    if selection:
+        format_spec = selection.format_ids
+    else:
+        if max_size is not None:
+            log(f"No formats chosen for the {max_size / 1e6:.0f} MB budget, leaving it to yt-dlp's size filters")
+        format_spec = formats.fallback_spec(height, max_size)
+    try:
+        if selection:
+            check_disk_space([selection.size], job)
+        returncode, output_path = run_single(url, format_spec, "VIDEO", job, [
+            "--merge-output-format", "mp4",
+            "--ffmpeg-location", os.path.dirname(ffmpeg_path),
+            *settings.yt_dlp_args(),
+            *archive_args('video', selected_res, force),
+        ], meter)
+        if returncode != 0:
+            return download_failed("Video", returncode, job_id)
+        with metrics.span(job_id, FINALIZE):
+            record_download(url, 'video', selected_res, output_path, job)
+        record_transfer(settings, meter, job_id)
+        progress.bus.publish(job_id, phase=progress.FINISHED, percent=100.0,
+                             message="SUCCESS: Video download complete")
+        log("Video download successful")
+        return video_success_msg()
+    except diskspace.NotEnoughSpace as e:
+        return f"✗ {e}"
+    except Exception as e:
+        return unexpected_error(e, job_id)
+
+def download_video(url, selected_res=None, job=None, force=False, engine=None, max_size=None):
+    """Download video with real-time progress tracking.
+
+    When the formats are known, the video and audio streams are downloaded
+    as separate files and merged by the post-processing pool (see hand_off);
+    otherwise yt-dlp downloads and merges in one run. Videos already in the
+    download archive are skipped unless force is set. engine picks the
+    downloader (default DEFAULT_ENGINE). With max_size (bytes) the best
+    formats that fit in that size are picked (see formats.select).
+    """
+    ffmpeg_path, result = start_download(url, 'video', selected_res, job, force)
+    if result:
+        return result
+
+    job_id = job.id if job else None
+    log(f"Starting video download for: {url}")
+    log(f"Selected resolution: {selected_res}")
     
-    write_progress("Starting audio download...")
+    # Resolution class of the choice, so letterboxed sizes like 1920x800 count as 1080p
+    height = formats.target_height(selected_res or "1920x1080")
+    progress.bus.publish(job_id, phase=progress.PREPARING, message="Starting video download...")
+    finished = video_finished(url, selected_res, job, force)
     
+    if (engine or DEFAULT_ENGINE) == 'segmented':
+        result = _video_segmented(url, height, ffmpeg_path, finished, job, max_size)
+        if result is not None:
+            return result
+    
+    # Fragment concurrency and chunk size tuned from earlier downloads
+    info = probe(url, job_id)
+    settings = tuner.choose(format_kind(info, height))
+    meter = ThroughputMeter()
+    log(f"Transfer settings ({settings.network}/{settings.kind}): {settings.key}")
+
+    # Explicit format IDs instead of leaving the choice to yt-dlp
+    selection = formats.select(info, height, max_size) if info else None
+    if selection:
+        log(f"Selected formats: {selection}")
+    if selection and selection.audio:
+        return _video_streams(url, info, selection, settings, meter, ffmpeg_path, finished, job)
+    return _video_single_run(url, height, selected_res, selection, settings, meter, ffmpeg_path, job, force,
+                             max_size)
+
+def audio_success_msg(output_path):
+    kind = os.path.splitext(output_path)[1][1:].upper() if output_path else 'audio'
+    return (f"✓ Audio downloaded successfully!\n\nSaved to: {download_dir()}\n\n"
+            f"Check your Downloads folder for the {kind} file.")
+
+def audio_finished(url, archive_key, job=None, force=False):
+    """on_success callback of an audio conversion task: archive the file and report success"""
+    def finished(output_path):
+        record_download(url, 'audio', archive_key, output_path, job, ytdlp_archive=not force)
+        if job:
+            job.result = audio_success_msg(output_path)
+        progress.bus.publish(job.id if job else None, phase=progress.FINISHED, percent=100.0,
+                             message="SUCCESS: Audio download complete")
+        log("Audio download successful")
+    return finished
+
+def _audio_stream(url, info, plan, source, ffmpeg_path, on_success, job=None):
+    """yt-dlp fetches the source stream, the post-processing pool copies or converts it"""
+    job_id = job.id if job else None
+    output_path = output_path_for(info, plan.ext)
+    if job:
+        job.format = plan.format_spec
+        job.output_path = output_path
     try:
-        returncode = run_with_progress(cmd, "AUDIO")
-        
+        returncode, paths = download_streams(url, [source], info, "AUDIO", job)
+        if returncode != 0:
+            return download_failed("Audio", returncode, job_id)
+        description = "Converting audio" if plan.transcode else "Extracting audio"
+        task = postprocess.Task(ffmpeg_path, paths, plan.ffmpeg_args, output_path, description, on_success)
+        returncode = hand_off(task, job)
+        if returncode is None:
+            return f"✓ Downloaded, {description.lower()}..."
         if returncode == 0:
-            write_progress("SUCCESS: Audio download complete")
-            log("Audio download successful")
-            return f"✓ Audio downloaded successfully!\n\nSaved to: {DOWNLOAD_DIR}\n\nCheck your Downloads folder for the MP3 file."
-        else:
-            write_progress("ERROR: Audio download failed")
-            log(f"Audio download failed with code {returncode}")
-            return f"✗ Download failed (error code: {returncode})\n\nPlease check:\n• Internet connection\n• URL is valid\n• Storage permissions"
-            
+            return audio_success_msg(task.output_path)
+        progress.bus.publish(job_id, phase=progress.FAILED, message=f"ERROR: {description} failed")
+        return f"✗ {description} failed: {task.error}"
     except Exception as e:
-        log(f"Unexpected error: {e}")
-        import traceback
-        log(traceback.format_exc())
-        write_progress("ERROR: Unexpected error occurred")
-        return f"✗ Error: {str(e)}"
+        return unexpected_error(e, job_id)
+
+def _audio_single_run(url, plan, archive_key, ffmpeg_path, job=None, force=False):
+    """yt-dlp downloads and extracts or converts in one run (source format unknown)"""
+    job_id = job.id if job else None
+    try:
+        returncode, output_path = run_single(url, plan.format_spec, "AUDIO", job, [
+            *plan.args,
+            "--ffmpeg-location", os.path.dirname(ffmpeg_path),
+            *archive_args('audio', archive_key, force),
+        ])
+        if returncode != 0:
+            return download_failed("Audio", returncode, job_id)
+        with metrics.span(job_id, FINALIZE):
+            record_download(url, 'audio', archive_key, output_path, job)
+        progress.bus.publish(job_id, phase=progress.FINISHED, percent=100.0,
+                             message="SUCCESS: Audio download complete")
+        log("Audio download successful")
+        return audio_success_msg(output_path)
+    except Exception as e:
+        return unexpected_error(e, job_id)
+
+def download_audio(url, job=None, force=False, audio_format=None):
+    """Download audio only, as MP3 or (without re-encoding) in the source's own codec.
+
+    audio_format is one of audio.AUDIO_FORMATS (default MP3); see audio.plan
+    for when the stream is copied and when it is transcoded. When the source
+    format is known the raw stream is downloaded and converted by the
+    post-processing pool, otherwise yt-dlp converts it in the same run.
+    Tracks already in the download archive are skipped unless force is set.
+    """
+    audio_format = audio_format or audio.DEFAULT_AUDIO_FORMAT
+    # MP3 downloads keep their original archive key
+    archive_key = None if audio_format == audio.MP3 else audio_format
+    ffmpeg_path, result = start_download(url, 'audio', archive_key, job, force)
+    if result:
+        return result
+
+    job_id = job.id if job else None
+    log(f"Starting audio download for: {url}")
+    
+    info = probe(url, job_id)
+    plan = audio.plan(info, audio_format)
+    log(f"Audio plan: {plan}")
+    source = next((f for f in info["formats"] if f["format_id"] == plan.format_spec), None) if info else None
+    try:
+        # Extracting or converting writes a second file next to the stream
+        check_disk_space([formats.estimated_size(source, info.get("duration")) if source else None], job, merge=True)
+    except diskspace.NotEnoughSpace as e:
+        return f"✗ {e}"
+    progress.bus.publish(job_id, phase=progress.PREPARING, message="Starting audio download...")
+
+    if plan.ffmpeg_args is not None:
+        return _audio_stream(url, info, plan, source, ffmpeg_path, audio_finished(url, archive_key, job, force), job)
+    return _audio_single_run(url, plan, archive_key, ffmpeg_path, job, force)
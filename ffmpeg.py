@@ -1,6 +1,6 @@
 import os
-import shutil
 import stat
+from binaries import resolve
 
 # Try Android imports
 try:
@@ -18,12 +18,10 @@ def get_app_dir():
             return '/data/data/org.wilddrs.ytdownloader/files'
     return os.path.expanduser('~')
 
-def get_ffmpeg_path():
-    """Get the path to ffmpeg binary, checking bundled location first"""
-    
-    # Define all possible paths in priority order
+def get_ffmpeg_candidates():
+    """All bundled ffmpeg locations, in priority order"""
     app_dir = get_app_dir()
-    bundled_paths = [
+    return [
         # Installed in app storage
         os.path.join(app_dir, 'binaries', 'ffmpeg'),
         # Architecture-specific binaries
@@ -39,25 +37,14 @@ def get_ffmpeg_path():
         '/data/data/org.wilddrs.ytdownloader/files/app/binaries/ffmpeg-arm64',
         '/data/data/org.wilddrs.ytdownloader/files/binaries/ffmpeg-arm64',
     ]
-    
-    for path in bundled_paths:
-        if os.path.exists(path):
-            try:
-                # Make sure it's executable
-                os.chmod(path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
-                print(f"✓ Found FFmpeg at: {path}")
-                return path
-            except Exception as e:
-                print(f"✗ Found FFmpeg at {path} but couldn't make it executable: {e}")
-    
-    # Check system PATH as last resort
-    system_ffmpeg = shutil.which("ffmpeg")
-    if system_ffmpeg:
-        print(f"✓ Using system FFmpeg: {system_ffmpeg}")
-        return system_ffmpeg
-    
-    print("✗ FFmpeg not found in any location")
-    return None
+
+def get_ffmpeg_path():
+    """Get the path to ffmpeg binary, checking bundled location first.
+
+    The system PATH is the last resort. Resolved paths are cached by the
+    binaries module and only searched again when the cached file changes.
+    """
+    return resolve('ffmpeg', get_ffmpeg_candidates(), use_path=True)
 
 def ensure_ffmpeg():
     """Ensure ffmpeg is available, raise error if not"""
@@ -86,11 +73,8 @@ def test_ffmpeg():
     """Test if FFmpeg is working"""
     try:
         ffmpeg = ensure_ffmpeg()
-        import subprocess
-        result = subprocess.run([ffmpeg, '-version'], 
-                              capture_output=True, 
-                              text=True, 
-                              timeout=5)
+        from procengine import engine
+        result = engine.run([ffmpeg, '-version'], timeout=5)
         if result.returncode == 0:
             version = result.stdout.split('\n')[0]
             print(f"✓ FFmpeg is working: {version}")
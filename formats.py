@@ -0,0 +1,214 @@
+from debug import log
+
+# Bits a codec needs for the same picture/sound quality, relative to H.264/AAC
+VIDEO_CODEC_EFFICIENCY = {'av01': 0.55, 'vp9': 0.7, 'vp09': 0.7, 'hev1': 0.6, 'hvc1': 0.6, 'avc1': 1.0}
+AUDIO_CODEC_EFFICIENCY = {'opus': 0.6, 'vorbis': 0.8, 'mp4a': 1.0, 'aac': 1.0, 'mp3': 1.2}
+# Within the best resolution/fps tier, the smallest format whose codec-adjusted
+# bitrate is at least this fraction of the best one is taken
+QUALITY_TOLERANCE = 0.85
+# Part of a size budget left to the audio stream when yt-dlp chooses the formats (fallback_spec)
+AUDIO_BUDGET_SHARE = 0.1
+
+RESOLUTION_LABELS = {
+    4320: "8K", 2160: "4K", 1440: "2K", 1080: "Full HD", 720: "HD",
+}
+
+def _codec_key(codec):
+    return (codec or '').split('.')[0].lower()
+
+def has_video(f):
+    return f.get("vcodec") not in (None, "none") and bool(f.get("height"))
+
+def has_audio(f):
+    return f.get("acodec") not in (None, "none")
+
+def quality_height(width, height):
+    """Resolution class of a frame size: letterboxed 1920x800 is 1080p, portrait 1080x1920 too"""
+    if not height:
+        return 0
+    if not width:
+        return height
+    if height > width:
+        return width
+    return max(height, round(width * 9 / 16))
+
+def format_height(f):
+    return quality_height(f.get("width"), f.get("height"))
+
+def fps_class(f):
+    """30 or 60: small fps differences (24/25/30) don't matter"""
+    return 60 if (f.get("fps") or 0) > 40 else 30
+
+def estimated_size(f, duration=None):
+    """Size in bytes from filesize, filesize_approx or bitrate * duration; None if unknown"""
+    size = f.get("filesize") or f.get("filesize_approx")
+    if size:
+        return size
+    if f.get("tbr") and duration:
+        return int(f["tbr"] * 1000 / 8 * duration)
+    return None
+
+def effective_bitrate(f):
+    """Bitrate scaled to H.264/AAC equivalent, a rough measure of quality within a tier"""
+    if has_video(f):
+        efficiency = VIDEO_CODEC_EFFICIENCY.get(_codec_key(f.get("vcodec")), 1.0)
+        rate = f.get("vbr") or f.get("tbr") or 0
+    else:
+        efficiency = AUDIO_CODEC_EFFICIENCY.get(_codec_key(f.get("acodec")), 1.0)
+        rate = f.get("abr") or f.get("tbr") or 0
+    return rate / efficiency
+
+class Selection:
+    """A chosen video format plus audio format (None for a format carrying both)"""
+
+    def __init__(self, video, audio=None, duration=None):
+        self.video = video
+        self.audio = audio
+        self.duration = duration
+
+    @property
+    def formats(self):
+        return [f for f in (self.video, self.audio) if f is not None]
+
+    @property
+    def format_ids(self):
+        """Explicit yt-dlp format selector"""
+        return "+".join(f["format_id"] for f in self.formats)
+
+    @property
+    def height(self):
+        return format_height(self.video)
+
+    @property
+    def size(self):
+        sizes = [estimated_size(f, self.duration) for f in self.formats]
+        return None if None in sizes else sum(sizes)
+
+    def __repr__(self):
+        size = f"{self.size / 1e6:.1f} MB" if self.size else "size unknown"
+        return f"<Selection {self.format_ids} {self.height}p {size}>"
+
+def _smallest_good_enough(candidates, duration):
+    """Of candidates in one quality tier, the smallest one close to the best bitrate"""
+    best_rate = max(effective_bitrate(f) for f in candidates)
+    good = [f for f in candidates if effective_bitrate(f) >= best_rate * QUALITY_TOLERANCE]
+    return min(good, key=lambda f: (estimated_size(f, duration) or float('inf'), -effective_bitrate(f)))
+
+def _rank(f):
+    return (format_height(f), fps_class(f))
+
+def best_video(formats, max_height, duration=None):
+    """Best tier (resolution class, fps) up to max_height, smallest format within it"""
+    candidates = [f for f in formats if format_height(f) <= max_height]
+    if not candidates:
+        return None
+    top = max(_rank(f) for f in candidates)
+    return _smallest_good_enough([f for f in candidates if _rank(f) == top], duration)
+
+def best_audio(formats, duration=None):
+    candidates = [f for f in formats if not has_video(f) and has_audio(f)]
+    if not candidates:
+        return None
+    return _smallest_good_enough(candidates, duration)
+
+def _usable(info, direct_only):
+    formats = info.get("formats") or []
+    if direct_only:
+        formats = [f for f in formats if f.get("protocol") in ("http", "https") and f.get("url")]
+    return [f for f in formats if f.get("format_id")]
+
+def select(info, max_height, max_bytes=None, direct_only=False):
+    """Pick explicit formats for a video download up to max_height, or None.
+
+    Separate video and audio streams are preferred; formats carrying both
+    are used when there are no separate ones. With max_bytes the best
+    quality pair whose estimated size fits the budget is taken (the
+    smallest pair if nothing fits). direct_only limits the choice to plain
+    HTTP formats (for the segmented engine).
+    """
+    formats = _usable(info, direct_only)
+    duration = info.get("duration")
+    video_only = [f for f in formats if has_video(f) and not has_audio(f)]
+    combined = [f for f in formats if has_video(f) and has_audio(f)]
+
+    if max_bytes is not None:
+        return _select_within(formats, video_only, combined, max_height, max_bytes, duration)
+
+    audio = best_audio(formats, duration)
+    if video_only and audio:
+        video = best_video(video_only, max_height, duration)
+        if video:
+            return Selection(video, audio, duration)
+    if direct_only:
+        return None
+    video = best_video(combined, max_height, duration)
+    return Selection(video, None, duration) if video else None
+
+def _select_within(formats, video_only, combined, max_height, max_bytes, duration):
+    audios = [f for f in formats if not has_video(f) and has_audio(f)]
+    pairs = [Selection(v, a, duration) for v in video_only if format_height(v) <= max_height for a in audios]
+    pairs += [Selection(v, None, duration) for v in combined if format_height(v) <= max_height]
+    pairs = [p for p in pairs if p.size is not None]
+    if not pairs:
+        return None
+
+    def quality(p):
+        audio_rate = effective_bitrate(p.audio) if p.audio else 0
+        return (_rank(p.video), effective_bitrate(p.video) + audio_rate, -p.size)
+
+    fitting = [p for p in pairs if p.size <= max_bytes]
+    if fitting:
+        return max(fitting, key=quality)
+    smallest = min(pairs, key=lambda p: p.size)
+    log(f"No formats fit in {max_bytes / 1e6:.0f} MB, using the smallest ({smallest})")
+    return smallest
+
+def fallback_spec(max_height, max_bytes=None):
+    """yt-dlp format selector for when the formats are not known up front (no metadata).
+
+    With max_bytes, formats whose size yt-dlp knows have to fit: the video
+    in all but AUDIO_BUDGET_SHARE of the budget, the audio in the rest.
+    Formats of unknown size pass; 'worst' is the last resort, like the
+    smallest pair select() falls back to.
+    """
+    if max_bytes is None:
+        return (f"bestvideo[height<={max_height}][ext=mp4]+bestaudio[ext=m4a]/"
+                f"bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]/best")
+    audio_bytes = int(max_bytes * AUDIO_BUDGET_SHARE)
+
+    def fits(limit):
+        return f"[filesize<?{limit}][filesize_approx<?{limit}]"
+    video, audio = f"[height<={max_height}]{fits(max_bytes - audio_bytes)}", fits(audio_bytes)
+    return (f"bestvideo{video}[ext=mp4]+bestaudio{audio}[ext=m4a]/bestvideo{video}+bestaudio{audio}/"
+            f"best[height<={max_height}]{fits(max_bytes)}/worst")
+
+def resolution_options(info):
+    """Every resolution class on offer: {"WxH": {"id", "fps"}}, highest first.
+
+    Keys are the real frame size of the best format in each class, so odd
+    sizes like 1920x800 show up as they are.
+    """
+    formats = [f for f in _usable(info, False) if has_video(f)]
+    options = {}
+    for height in sorted({format_height(f) for f in formats}, reverse=True):
+        tier = [f for f in formats if format_height(f) == height]
+        top = max(fps_class(f) for f in tier)
+        f = _smallest_good_enough([f for f in tier if fps_class(f) == top], info.get("duration"))
+        options[f"{f.get('width') or height}x{f['height']}"] = {"id": f["format_id"], "fps": f.get("fps", 0)}
+    return options
+
+def target_height(res_str, default=1080):
+    """Resolution class of a "WxH" string from resolution_options"""
+    try:
+        width, height = (int(v) for v in res_str.split('x'))
+    except (AttributeError, ValueError):
+        return default
+    return quality_height(width, height)
+
+def resolution_label(res_str):
+    """Spinner text for a "WxH" string: 1080p (Full HD), or 1080p (1920x800) for odd sizes"""
+    height = target_height(res_str)
+    width, _, frame_height = res_str.partition('x')
+    if RESOLUTION_LABELS.get(height) and quality_height(int(width), int(frame_height)) == int(frame_height):
+        return f"{height}p ({RESOLUTION_LABELS[height]})"
+    return f"{height}p ({res_str})"
@@ -0,0 +1,418 @@
+import itertools
+import os
+import signal
+import threading
+import time
+from collections import deque
+from debug import log
+from bandwidth import governor
+from pacing import THROTTLED, TRANSIENT
+import postprocess
+import diskspace
+from metrics import metrics
+
+# Job states
+QUEUED = 'queued'
+PROBING = 'probing'
+DOWNLOADING = 'downloading'
+POST_PROCESSING = 'post-processing'
+DONE = 'done'
+FAILED = 'failed'
+PAUSED = 'paused'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (PROBING, DOWNLOADING, POST_PROCESSING)
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_WORKERS = 3
+
+# Failed downloads are retried when the failure looks temporary (throttling,
+# network errors); the wait doubles after every attempt
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5.0
+RETRYABLE_ERRORS = (THROTTLED, TRANSIENT)
+
+_job_ids = itertools.count(1)
+
+def kill_process(process):
+    """Terminate a child process together with anything it spawned (ffmpeg)"""
+    if process is None or process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except Exception:
+        try:
+            process.terminate()
+        except Exception:
+            pass
+
+class Job:
+    """A single queued download"""
+
+    def __init__(self, url, mode='video', resolution=None, job_id=None, force=False, max_size=None,
+                 engine=None):
+        self.id = job_id if job_id is not None else next(_job_ids)
+        self.url = url
+        self.mode = mode
+        # Video resolution, or the output format (audio.AUDIO_FORMATS) of audio jobs
+        self.resolution = resolution
+        # Size budget in bytes for video jobs (None = best quality at the resolution)
+        self.max_size = max_size
+        # Download engine of video jobs (downloader.ENGINES, None = downloader.DEFAULT_ENGINE)
+        self.engine = engine
+        self.force = force
+        # Relative share of the global bandwidth budget, and a callback set
+        # while the running engine can take a new rate without a restart
+        self.weight = 1.0
+        self.apply_rate = None
+        self.format = None
+        self.output_path = None
+        self.state = QUEUED
+        self.status = 'Queued'
+        self.result = None
+        self.returncode = None
+        self.error_class = None
+        self.created = time.time()
+        self.process = None
+        # postprocess.Task left by the network stage for the post-processing pool
+        self.pending_task = None
+        self.cancel_requested = False
+        self.pause_requested = False
+        self.restart_requested = False
+        # Peak download speed seen so far and restarts by the stall watchdog
+        self.peak_speed = 0.0
+        self.stall_restarts = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._listener = None
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.mode} {self.state} {self.url}>"
+
+    @property
+    def stop_requested(self):
+        return self.cancel_requested or self.pause_requested
+
+    def set_state(self, state, status=None):
+        """Move the job to a new state and notify the queue"""
+        changed = state != self.state or (status is not None and status != self.status)
+        self.state = state
+        if status is not None:
+            self.status = status
+        if changed and self._listener:
+            self._listener(self)
+
+    def attach_process(self, process):
+        """Remember the running yt-dlp process so it can be stopped"""
+        with self._lock:
+            self.process = process
+            stop = self.stop_requested
+        if stop:
+            kill_process(process)
+
+    def request_restart(self, reason=''):
+        """Stop the running download so the worker starts it again.
+
+        Only done while bytes are being fetched; yt-dlp continues from the
+        .part file, so this is cheap compared to a real retry.
+        """
+        if self.state != DOWNLOADING or self.stop_requested:
+            return False
+        log(f"Restarting job {self.id}: {reason}")
+        self.restart_requested = True
+        self._stop()
+        return True
+
+    def change_rate(self, rate):
+        """The job's bandwidth share changed: hand it to the running engine, or restart with it"""
+        apply_rate = self.apply_rate
+        if apply_rate is None:
+            self.request_restart('bandwidth share changed')
+            return
+        log(f"Job {self.id} now limited to {rate or 'unlimited'} B/s")
+        apply_rate(rate)
+
+    def detach_process(self):
+        with self._lock:
+            self.process = None
+
+    def wait(self, seconds):
+        """Sleep between attempts; returns True if the job was stopped meanwhile"""
+        self._wake.clear()
+        if self.stop_requested:
+            return True
+        self._wake.wait(seconds)
+        return self.stop_requested
+
+    def _stop(self):
+        self._wake.set()
+        with self._lock:
+            process = self.process
+        kill_process(process)
+
+class JobQueue:
+    """Runs download jobs on a bounded number of worker threads"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, on_update=None, journal=None):
+        self.max_workers = max(1, workers)
+        self.on_update = on_update
+        # A JobJournal, or a factory (such as the JobJournal class) that opens it on first use
+        self._journal = journal
+        self._journal_lock = threading.Lock()
+        self._jobs = {}
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._running = 0
+
+    @property
+    def journal(self):
+        with self._journal_lock:
+            if callable(self._journal):
+                self._journal = self._journal()
+            return self._journal
+
+    def submit(self, url, mode='video', resolution=None, force=False, max_size=None, engine=None):
+        """Queue a download and return its Job; force re-downloads archived videos"""
+        job = Job(url, mode=mode, resolution=resolution, force=force, max_size=max_size, engine=engine)
+        if self.journal:
+            job.id = self.journal.add(job)
+        self._enqueue(job)
+        log(f"Queued job {job.id}: {mode} {url}")
+        self._notify(job)
+        return job
+
+    def restore(self):
+        """Re-queue jobs the journal recorded as unfinished (app was killed).
+
+        yt-dlp picks up the existing .part files, so these continue where
+        they stopped. Paused jobs come back paused.
+        """
+        if not self.journal:
+            return []
+        restored = []
+        for row in self.journal.unfinished():
+            with self._lock:
+                if row['id'] in self._jobs:
+                    continue
+            job = Job(row['url'], mode=row['mode'], resolution=row['resolution'], job_id=row['id'],
+                      max_size=row.get('max_size'), engine=row.get('engine'))
+            job.format = row['format']
+            job.output_path = row['output_path']
+            if row['state'] == PAUSED:
+                job.state = PAUSED
+                job.status = 'Paused'
+                job.pause_requested = True
+                job._listener = self._notify
+                with self._lock:
+                    self._jobs[job.id] = job
+            else:
+                job.status = 'Resuming'
+                self._enqueue(job)
+            restored.append(job)
+            self._notify(job)
+        if restored:
+            log(f"Restored {len(restored)} unfinished jobs from the journal")
+        return restored
+
+    def _enqueue(self, job):
+        job._listener = self._notify
+        with self._lock:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._spawn_workers()
+
+    def jobs(self):
+        """All known jobs in submission order"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.id)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.state in ACTIVE_STATES)
+
+    def set_workers(self, workers):
+        """Change how many downloads may run at the same time"""
+        with self._lock:
+            self.max_workers = max(1, workers)
+            self._spawn_workers()
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.state in FINISHED_STATES:
+            return False
+        job.cancel_requested = True
+        with self._lock:
+            queued = job in self._pending
+            if queued:
+                self._pending.remove(job)
+        if queued or job.state == PAUSED:
+            job.set_state(CANCELLED, 'Cancelled')
+            self._discard_files(job)
+            metrics.finish(job)
+        else:
+            job._stop()
+        log(f"Cancel requested for job {job_id}")
+        return True
+
+    def pause(self, job_id):
+        """Stop a job; yt-dlp continues from the .part file on resume"""
+        job = self.get(job_id)
+        if job is None or job.state in FINISHED_STATES or job.state == PAUSED:
+            return False
+        job.pause_requested = True
+        with self._lock:
+            queued = job in self._pending
+            if queued:
+                self._pending.remove(job)
+        if queued:
+            job.set_state(PAUSED, 'Paused')
+        else:
+            job._stop()
+        log(f"Pause requested for job {job_id}")
+        return True
+
+    def resume(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.state != PAUSED:
+            return False
+        job.pause_requested = False
+        job.set_state(QUEUED, 'Queued')
+        with self._lock:
+            self._pending.append(job)
+            self._spawn_workers()
+        log(f"Resumed job {job_id}")
+        return True
+
+    def clear_finished(self):
+        """Forget jobs that are done, failed or cancelled"""
+        with self._lock:
+            for job_id in [i for i, j in self._jobs.items() if j.state in FINISHED_STATES]:
+                del self._jobs[job_id]
+
+    def _notify(self, job):
+        if self.journal:
+            try:
+                self.journal.update(job)
+            except Exception as e:
+                log(f"Could not journal job {job.id}: {e}")
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                log(f"Job update callback failed: {e}")
+
+    def _spawn_workers(self):
+        # Called with self._lock held
+        while (self._workers < self.max_workers
+               and self._workers - self._running < len(self._pending)):
+            self._workers += 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._workers > self.max_workers:
+                    self._workers -= 1
+                    return
+                job = self._pending.popleft()
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _run(self, job):
+        # Imported here to avoid a circular import with downloader
+        from downloader import download_video, download_audio
+
+        job.set_state(PROBING, 'Starting...')
+        metrics.begin(job)
+        governor.register(
+            job.id,
+            weight=job.weight,
+            on_change=job.change_rate
+        )
+        try:
+            with metrics.profiled(job):
+                # Only failed runs use up attempts; restarts (bandwidth, stalls) don't
+                attempt = 1
+                while True:
+                    job.returncode = None
+                    job.error_class = None
+                    job.restart_requested = False
+                    job.pending_task = None
+                    try:
+                        if job.mode == 'audio':
+                            job.result = download_audio(job.url, job=job, force=job.force,
+                                                        audio_format=job.resolution)
+                        else:
+                            job.result = download_video(job.url, selected_res=job.resolution, job=job, force=job.force,
+                                                        engine=job.engine, max_size=job.max_size)
+                    except Exception as e:
+                        log(f"Job {job.id} crashed: {e}")
+                        job.result = f"✗ Error: {str(e)}"
+                    finally:
+                        job.detach_process()
+                    if job.stop_requested:
+                        break
+                    if job.restart_requested:
+                        continue
+                    if (job.returncode not in (0, None) and job.error_class in RETRYABLE_ERRORS
+                            and attempt < MAX_ATTEMPTS):
+                        delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                        log(f"Job {job.id} failed ({job.error_class}), retrying in {delay:g}s")
+                        metrics.retry(job.id)
+                        job.set_state(PROBING, f'Retrying in {delay:g}s ({job.error_class})')
+                        if job.wait(delay):
+                            break
+                        attempt += 1
+                        continue
+                    break
+        finally:
+            governor.unregister(job.id)
+
+        # Merging/converting runs on the post-processing pool; this worker moves on
+        task, job.pending_task = job.pending_task, None
+        if task is not None and job.returncode == 0 and not job.stop_requested:
+            postprocess.pool.submit(task, job, on_done=lambda task: self._post_processed(job, task))
+            return
+        self._finish(job)
+
+    def _post_processed(self, job, task):
+        if task.returncode not in (0, None):
+            job.returncode = task.returncode
+            job.result = f"✗ {task.description} failed: {task.error}"
+        self._finish(job)
+
+    @staticmethod
+    def _discard_files(job):
+        """Remove what the job left in staging; paused jobs keep theirs for the resume"""
+        from downloader import discard_job_files
+        try:
+            discard_job_files(job)
+        except Exception as e:
+            log(f"Could not remove the files of job {job.id}: {e}")
+
+    def _finish(self, job):
+        if job.cancel_requested:
+            job.set_state(CANCELLED, 'Cancelled')
+        elif job.pause_requested:
+            job.set_state(PAUSED, 'Paused')
+        elif job.returncode == 0:
+            job.set_state(DONE, 'Complete')
+        else:
+            job.set_state(FAILED, job.result or 'Failed')
+        diskspace.ledger.release(job.id)
+        if job.state == PAUSED:
+            # A resumed job continues the same metrics record
+            metrics.leave(job.id)
+        else:
+            self._discard_files(job)
+            metrics.finish(job)
+        log(f"Job {job.id} finished: {job.state}")
@@ -0,0 +1,223 @@
+import atexit
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from debug import get_app_dir, log
+from cache import video_id_from_url
+from jobs import FINISHED_STATES, FAILED
+import staging
+
+# Partial downloads of finished jobs untouched for this long are deleted on startup
+PART_FILE_MAX_AGE = 7 * 24 * 60 * 60
+# Finished jobs are kept in the journal for this long
+FINISHED_JOB_MAX_AGE = 30 * 24 * 60 * 60
+
+PART_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    resolution TEXT,
+    max_size INTEGER,
+    engine TEXT,
+    format TEXT,
+    output_path TEXT,
+    state TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+# Columns added after the first release, for journals created before them
+MIGRATIONS = {
+    'max_size': "ALTER TABLE jobs ADD COLUMN max_size INTEGER",
+    'engine': "ALTER TABLE jobs ADD COLUMN engine TEXT",
+}
+
+def get_journal_path():
+    return os.path.join(get_app_dir(), 'jobs.db')
+
+def is_partial_file(name):
+    """True for yt-dlp's temporary files (.part, .part-Frag12, .ytdl, .temp)"""
+    return name.endswith(PART_SUFFIXES) or '.part-Frag' in name
+
+class JobJournal:
+    """SQLite record of every job, so downloads survive the app being killed.
+
+    State updates arrive from wherever a job changes (download workers,
+    the process engine's loop), so update() only queues them; a writer
+    thread commits them in batches, keeping only the latest row per job.
+    Reads flush() first.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_journal_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        # job id -> row values waiting for the writer, and the values last queued per job
+        self._pending = {}
+        self._queued = {}
+        self._writing = False
+        self._changed = threading.Condition()
+        self._writer = None
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+
+    def add(self, job):
+        """Insert a new job and return its id"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, mode, resolution, max_size, engine, format, output_path, state, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.url, job.mode, job.resolution, job.max_size, job.engine, job.format, job.output_path,
+                 job.state, job.created, now)
+            )
+            return cursor.lastrowid
+
+    def update(self, job):
+        """Queue the job's current state for the writer thread; unchanged states are skipped"""
+        error = job.result if job.state == FAILED else None
+        values = (job.state, job.format, job.output_path, error)
+        with self._changed:
+            if self._queued.get(job.id) == values:
+                return
+            self._queued[job.id] = values
+            self._pending[job.id] = values + (time.time(),)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write, name='journal-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            self._changed.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued update is committed"""
+        with self._changed:
+            self._changed.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def _write(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending)
+                batch, self._pending = self._pending, {}
+                self._writing = True
+            try:
+                with self._lock:
+                    # One transaction (one commit) for the whole batch
+                    self._conn.execute("BEGIN")
+                    try:
+                        self._conn.executemany(
+                            "UPDATE jobs SET state = ?, format = ?, output_path = ?, error = ?, updated = ? "
+                            "WHERE id = ?",
+                            [values + (job_id,) for job_id, values in batch.items()]
+                        )
+                    except BaseException:
+                        self._conn.execute("ROLLBACK")
+                        raise
+                    self._conn.execute("COMMIT")
+            except Exception as e:
+                log(f"Could not journal {len(batch)} job updates: {e}")
+            finally:
+                with self._changed:
+                    self._writing = False
+                    self._changed.notify_all()
+
+    def unfinished(self):
+        """Jobs that were queued, running or paused when the app last stopped"""
+        self.flush()
+        placeholders = ','.join('?' * len(FINISHED_STATES))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE state NOT IN ({placeholders}) ORDER BY id",
+                FINISHED_STATES
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def finished(self):
+        """Jobs that are done, failed or cancelled"""
+        self.flush()
+        placeholders = ','.join('?' * len(FINISHED_STATES))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY id",
+                FINISHED_STATES
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, max_age=FINISHED_JOB_MAX_AGE):
+        """Forget finished jobs older than max_age seconds"""
+        self.flush()
+        placeholders = ','.join('?' * len(FINISHED_STATES))
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE state IN ({placeholders}) AND updated < ?",
+                (*FINISHED_STATES, time.time() - max_age)
+            )
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+def job_file_prefixes(row):
+    """Name prefixes of the working files a journaled job leaves in the staging directory:
+    its raw streams (downloader.raw_stream_template) and files named after its output"""
+    prefixes = []
+    video_id = video_id_from_url(row['url'])
+    if video_id:
+        prefixes.append(f".{video_id}.j{row['id']}.")
+    output_path = row.get('output_path')
+    # Single yt-dlp runs that never finished only know the output template
+    if output_path and '%(' not in output_path:
+        stem = os.path.splitext(os.path.basename(output_path))[0]
+        prefixes += [stem + '.', f".{stem}."]
+    return tuple(prefixes)
+
+def collect_stale_parts(journal, directory, max_age=PART_FILE_MAX_AGE):
+    """Delete partial files and job directories of finished jobs in directory
+    (the staging directory) that were not modified for max_age seconds.
+
+    Only what belongs to a job in the journal is touched; jobs that may
+    still be resumed (paused, unfinished) keep theirs however old they are.
+    """
+    finished = journal.finished()
+    prefixes = tuple(p for row in finished for p in job_file_prefixes(row))
+    job_dirs = {staging.job_dir_name(row['id']) for row in finished}
+    if not prefixes and not job_dirs:
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(directory))
+    except OSError as e:
+        log(f"Could not scan {directory} for partial files: {e}")
+        return 0
+
+    for entry in entries:
+        if entry.name in job_dirs and entry.is_dir(follow_symlinks=False):
+            remove = shutil.rmtree
+        elif entry.is_file() and is_partial_file(entry.name) and prefixes and entry.name.startswith(prefixes):
+            remove = os.remove
+        else:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                remove(entry.path)
+                removed += 1
+        except OSError as e:
+            log(f"Could not remove stale partial file {entry.path}: {e}")
+
+    if removed:
+        log(f"Removed {removed} stale partial files from {directory}")
+    return removed
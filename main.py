@@ -7,12 +7,15 @@ from kivy.uix.spinner import Spinner
 from kivy.uix.progressbar import ProgressBar
 from kivy.clock import Clock
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty
+from kivy.metrics import dp
 from kivy.core.window import Window
-from kivy.uix.popup import Popup
 from kivy.graphics import Color, Rectangle
 import threading
 import os
-import re
 
 # Handle Android imports gracefully
 try:
@@ -23,25 +26,179 @@ except ImportError:
     ANDROID = False
     print("Not running on Android - permissions skipped")
 
-from downloader import download_video, download_audio, get_available_formats
-from debug import get_progress, clear_progress
+from debug import log, get_log_content, follow_log
+from jobs import JobQueue, ACTIVE_STATES, FINISHED_STATES, PAUSED, FAILED, DONE
+from journal import JobJournal, collect_stale_parts
+import archive
+import staging
+from progress import bus, DOWNLOADING
+import audio
+from formats import resolution_label
+from bandwidth import governor, format_rate
+
+# How many downloads may run at the same time
+MAX_PARALLEL_DOWNLOADS = 3
+
+# Audio choices in the type spinner; only MP3 re-encodes the track
+AUDIO_TYPES = {
+    'Audio Only (MP3)': audio.MP3,
+    'Audio (Original, no re-encode)': audio.BEST,
+    'Audio (M4A)': audio.M4A,
+    'Audio (Opus)': audio.OPUS,
+    'Audio (OGG)': audio.OGG,
+}
+
+# Global download limit shared by all running jobs (see bandwidth.py)
+SPEED_LIMITS = {
+    'No limit': None,
+    '256 KB/s': 256 * 1024,
+    '512 KB/s': 512 * 1024,
+    '1 MB/s': 1024 * 1024,
+    '2 MB/s': 2 * 1024 * 1024,
+    '5 MB/s': 5 * 1024 * 1024,
+}
+
+# Height of one row in the job list (dp)
+JOB_ROW_HEIGHT = 72
+
+# Lines kept in the log viewer, and how often it checks for new ones (seconds)
+LOG_VIEW_LINES = 200
+LOG_VIEW_INTERVAL = 1.0
+
+def format_speed(speed):
+    if not speed:
+        return ''
+    if speed >= 1024 * 1024:
+        return f'{speed / (1024 * 1024):.1f} MB/s'
+    return f'{speed / 1024:.0f} KB/s'
+
+def format_eta(eta):
+    if eta is None:
+        return ''
+    eta = int(eta)
+    if eta >= 3600:
+        return f'{eta // 3600}:{eta // 60 % 60:02d}:{eta % 60:02d}'
+    return f'{eta // 60}:{eta % 60:02d}'
+
+def job_title(job):
+    """File name once it is known, the URL before that"""
+    if job.output_path and '%(' not in job.output_path:
+        return os.path.basename(job.output_path)
+    return job.url
+
+class JobRow(RecycleDataViewBehavior, BoxLayout):
+    """One row of the job list; the RecycleView reuses a few of these for all jobs"""
+    job_id = NumericProperty(0)
+    title = StringProperty('')
+    status = StringProperty('')
+    percent = NumericProperty(0)
+    paused = BooleanProperty(False)
+    finished = BooleanProperty(False)
+
+    def __init__(self, **kwargs):
+        super().__init__(spacing=4, **kwargs)
+        info = BoxLayout(orientation='vertical', size_hint=(0.6, 1))
+        self.title_label = Label(
+            font_size='12sp',
+            color=(0.1, 0.1, 0.1, 1),
+            halign='left',
+            valign='middle',
+            shorten=True
+        )
+        self.title_label.bind(size=self.title_label.setter('text_size'))
+        self.bar = ProgressBar(max=100)
+        self.status_label = Label(
+            font_size='11sp',
+            color=(0.3, 0.3, 0.3, 1),
+            halign='left',
+            valign='middle',
+            shorten=True
+        )
+        self.status_label.bind(size=self.status_label.setter('text_size'))
+        info.add_widget(self.title_label)
+        info.add_widget(self.bar)
+        info.add_widget(self.status_label)
+        
+        self.pause_btn = Button(text='Pause', size_hint=(0.2, 1), font_size='12sp')
+        self.pause_btn.bind(on_press=lambda btn: App.get_running_app().toggle_pause(self.job_id))
+        self.cancel_btn = Button(
+            text='Cancel',
+            size_hint=(0.2, 1),
+            font_size='12sp',
+            background_color=(0.8, 0.3, 0.3, 1)
+        )
+        self.cancel_btn.bind(on_press=lambda btn: App.get_running_app().queue.cancel(self.job_id))
+        self.add_widget(info)
+        self.add_widget(self.pause_btn)
+        self.add_widget(self.cancel_btn)
+        
+        self.bind(
+            title=self.title_label.setter('text'),
+            status=self.status_label.setter('text'),
+            percent=self.bar.setter('value'),
+            paused=lambda row, paused: setattr(self.pause_btn, 'text', 'Resume' if paused else 'Pause'),
+            finished=self._set_finished
+        )
+    
+    def _set_finished(self, row, finished):
+        self.pause_btn.disabled = finished
+        self.cancel_btn.disabled = finished
+
+class JobList(RecycleView):
+    """Job list that only creates widgets for the rows on screen.
+
+    Rows are plain dicts in self.data (see DownloaderApp.job_row); update()
+    applies a batch of changed rows with a single refresh.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            default_size=(None, dp(JOB_ROW_HEIGHT)),
+            default_size_hint=(1, None),
+            spacing=dp(4)
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        # Goes to the layout manager, so only once there is one
+        self.viewclass = JobRow
+        # job id -> index in self.data
+        self._index = {}
+    
+    def update(self, rows):
+        added = []
+        for row in rows:
+            index = self._index.get(row['job_id'])
+            if index is None:
+                self._index[row['job_id']] = len(self.data) + len(added)
+                added.append(row)
+            else:
+                self.data[index].update(row)
+        if added:
+            self.data.extend(added)
+        self.refresh_from_data()
 
 class DownloaderApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.download_thread = None
-        self.is_downloading = False
+        self.queue = JobQueue(
+            workers=MAX_PARALLEL_DOWNLOADS,
+            on_update=self.on_job_update,
+            # Opened on first use (normally the warm-up thread), not before the first frame
+            journal=JobJournal
+        )
+        # Jobs changed since the last frame; flush_updates applies them together
+        self.changed_jobs = set()
+        self.changed_lock = threading.Lock()
+        self.flush_trigger = Clock.create_trigger(self.flush_updates)
+        self.job_states = {}
+        # Spinner label -> "WxH" for resolutions found by Fetch Available Formats
+        self.res_labels = {}
         self.current_url = ""
         
     def build(self):
-        # Request Android permissions if on Android
-        if ANDROID:
-            request_permissions([
-                Permission.WRITE_EXTERNAL_STORAGE,
-                Permission.READ_EXTERNAL_STORAGE,
-                Permission.INTERNET
-            ])
-        
         # Set window background color
         Window.clearcolor = (0.95, 0.95, 0.95, 1)
         
@@ -63,6 +220,14 @@ class DownloaderApp(App):
             color=(1, 1, 1, 1)
         )
         header_layout.add_widget(title)
+        log_btn = Button(
+            text='Log',
+            size_hint=(0.15, 1),
+            background_color=(0.15, 0.3, 0.6, 1),
+            font_size='14sp'
+        )
+        log_btn.bind(on_press=self.show_log)
+        header_layout.add_widget(log_btn)
         layout.add_widget(header_layout)
         
         # Spacer
@@ -102,15 +267,28 @@ class DownloaderApp(App):
         type_label.bind(size=type_label.setter('text_size'))
         layout.add_widget(type_label)
         
+        type_row = BoxLayout(size_hint=(1, 0.09), spacing=8)
         self.type_spinner = Spinner(
             text='Video (MP4)',
-            values=('Video (MP4)', 'Audio Only (MP3)'),
-            size_hint=(1, 0.09),
+            values=('Video (MP4)', *AUDIO_TYPES),
+            size_hint=(0.65, 1),
             font_size='15sp',
             background_color=(1, 1, 1, 1)
         )
         self.type_spinner.bind(text=self.on_type_change)
-        layout.add_widget(self.type_spinner)
+        type_row.add_widget(self.type_spinner)
+        
+        # Total download speed of all jobs together
+        self.speed_spinner = Spinner(
+            text='No limit',
+            values=tuple(SPEED_LIMITS),
+            size_hint=(0.35, 1),
+            font_size='14sp',
+            background_color=(1, 1, 1, 1)
+        )
+        self.speed_spinner.bind(text=self.on_speed_change)
+        type_row.add_widget(self.speed_spinner)
+        layout.add_widget(type_row)
         
         # Resolution selector (initially visible)
         self.res_label = Label(
@@ -123,14 +301,27 @@ class DownloaderApp(App):
         self.res_label.bind(size=self.res_label.setter('text_size'))
         layout.add_widget(self.res_label)
         
+        res_row = BoxLayout(size_hint=(1, 0.09), spacing=8)
         self.res_spinner = Spinner(
             text='1080p (Full HD)',
             values=('4320p (8K)', '2160p (4K)', '1440p (2K)', '1080p (Full HD)', '720p (HD)'),
-            size_hint=(1, 0.09),
+            size_hint=(0.65, 1),
             font_size='15sp',
             background_color=(1, 1, 1, 1)
         )
-        layout.add_widget(self.res_spinner)
+        res_row.add_widget(self.res_spinner)
+        
+        # Optional size budget: best quality that fits in this many MB
+        self.size_input = TextInput(
+            hint_text='Max MB',
+            multiline=False,
+            input_filter='int',
+            size_hint=(0.35, 1),
+            font_size='14sp',
+            padding=[10, 10]
+        )
+        res_row.add_widget(self.size_input)
+        layout.add_widget(res_row)
         
         # Fetch formats button
         self.fetch_btn = Button(
@@ -156,32 +347,6 @@ class DownloaderApp(App):
         self.download_btn.bind(on_press=self.start_download)
         layout.add_widget(self.download_btn)
         
-        # Progress section
-        progress_label = Label(
-            text='Download Progress:',
-            size_hint=(1, 0.05),
-            font_size='14sp',
-            color=(0.2, 0.2, 0.2, 1),
-            halign='left'
-        )
-        progress_label.bind(size=progress_label.setter('text_size'))
-        layout.add_widget(progress_label)
-        
-        self.progress_bar = ProgressBar(
-            max=100,
-            size_hint=(1, 0.06),
-            value=0
-        )
-        layout.add_widget(self.progress_bar)
-        
-        self.progress_label = Label(
-            text='0%',
-            size_hint=(1, 0.05),
-            font_size='14sp',
-            color=(0.3, 0.3, 0.3, 1)
-        )
-        layout.add_widget(self.progress_label)
-        
         # Status label (scrollable)
         status_container_label = Label(
             text='Status:',
@@ -193,7 +358,7 @@ class DownloaderApp(App):
         status_container_label.bind(size=status_container_label.setter('text_size'))
         layout.add_widget(status_container_label)
         
-        scroll = ScrollView(size_hint=(1, 0.2))
+        scroll = ScrollView(size_hint=(1, 0.12))
         self.status_label = Label(
             text='Ready to download. Enter a YouTube URL above.',
             size_hint_y=None,
@@ -208,11 +373,55 @@ class DownloaderApp(App):
         scroll.add_widget(self.status_label)
         layout.add_widget(scroll)
         
-        # Schedule progress updates
-        Clock.schedule_interval(self.update_progress, 0.3)
+        # Job list (one row per download, only visible rows are built)
+        jobs_label = Label(
+            text='Downloads:',
+            size_hint=(1, 0.04),
+            font_size='14sp',
+            color=(0.2, 0.2, 0.2, 1),
+            halign='left'
+        )
+        jobs_label.bind(size=jobs_label.setter('text_size'))
+        layout.add_widget(jobs_label)
+        
+        self.job_list = JobList(size_hint=(1, 0.36))
+        layout.add_widget(self.job_list)
+        
+        # Progress arrives from the bus as it is published, applied once per frame
+        bus.subscribe(self.on_progress)
         
         return layout
     
+    def on_stop(self):
+        bus.unsubscribe(self.on_progress)
+    
+    def on_start(self):
+        """Runs after the first frame; do the slow setup here"""
+        # Request Android permissions if on Android
+        if ANDROID:
+            request_permissions([
+                Permission.WRITE_EXTERNAL_STORAGE,
+                Permission.READ_EXTERNAL_STORAGE,
+                Permission.INTERNET
+            ])
+        
+        # Probe binaries and storage off the UI thread
+        threading.Thread(target=self.warm_up, daemon=True).start()
+    
+    def warm_up(self):
+        try:
+            import downloader
+            downloader.warm_up()
+            archive.load()
+            governor.load()
+            Clock.schedule_once(lambda dt: self.show_speed_limit(governor.limit), 0)
+            # Continue downloads interrupted when the app was last killed
+            self.queue.restore()
+            self.queue.journal.prune()
+            collect_stale_parts(self.queue.journal, staging.get_staging_dir())
+        except Exception as e:
+            log(f"Warm-up failed: {e}")
+    
     def _update_rect(self, instance, value):
         """Update rectangle size for header background"""
         self.header_rect.pos = instance.pos
@@ -224,11 +433,13 @@ class DownloaderApp(App):
     
     def on_type_change(self, spinner, text):
         """Show/hide resolution selector based on download type"""
-        if text == 'Audio Only (MP3)':
+        if text in AUDIO_TYPES:
             self.res_label.opacity = 0
             self.res_label.disabled = True
             self.res_spinner.opacity = 0
             self.res_spinner.disabled = True
+            self.size_input.opacity = 0
+            self.size_input.disabled = True
             self.fetch_btn.opacity = 0
             self.fetch_btn.disabled = True
         else:
@@ -236,11 +447,31 @@ class DownloaderApp(App):
             self.res_label.disabled = False
             self.res_spinner.opacity = 1
             self.res_spinner.disabled = False
+            self.size_input.opacity = 1
+            self.size_input.disabled = False
             self.fetch_btn.opacity = 1
             self.fetch_btn.disabled = False
     
+    def show_speed_limit(self, limit):
+        """Show the saved limit in the speed spinner without applying it again"""
+        text = next((label for label, rate in SPEED_LIMITS.items() if rate == limit), format_rate(limit) + '/s')
+        self.speed_spinner.unbind(text=self.on_speed_change)
+        self.speed_spinner.text = text
+        self.speed_spinner.bind(text=self.on_speed_change)
+    
+    def on_speed_change(self, spinner, text):
+        """Apply and save the global speed limit; running jobs restart with their new share"""
+        if text not in SPEED_LIMITS:
+            return
+        def apply(limit=SPEED_LIMITS[text]):
+            governor.set_limit(limit)
+            governor.save()
+        threading.Thread(target=apply, daemon=True).start()
+    
     def show_popup(self, title, message):
         """Show a popup message"""
+        from kivy.uix.popup import Popup
+        
         content = BoxLayout(orientation='vertical', padding=10, spacing=10)
         content.add_widget(Label(text=message, size_hint=(1, 0.8)))
         close_btn = Button(text='OK', size_hint=(1, 0.2))
@@ -250,6 +481,50 @@ class DownloaderApp(App):
         close_btn.bind(on_press=popup.dismiss)
         popup.open()
     
+    def show_log(self, instance):
+        """Show the end of the log and append new lines while the popup is open"""
+        from kivy.uix.popup import Popup
+        
+        content = BoxLayout(orientation='vertical', padding=10, spacing=10)
+        scroll = ScrollView(size_hint=(1, 0.9))
+        log_label = Label(
+            text='',
+            size_hint_y=None,
+            halign='left',
+            valign='top',
+            font_size='11sp'
+        )
+        log_label.bind(width=lambda label, width: setattr(label, 'text_size', (width, None)))
+        log_label.bind(texture_size=lambda label, size: setattr(label, 'height', size[1]))
+        scroll.add_widget(log_label)
+        content.add_widget(scroll)
+        close_btn = Button(text='Close', size_hint=(1, 0.1))
+        content.add_widget(close_btn)
+        
+        popup = Popup(title='Log', content=content, size_hint=(0.95, 0.9))
+        close_btn.bind(on_press=popup.dismiss)
+        closed = threading.Event()
+        popup.bind(on_dismiss=lambda popup: closed.set())
+        
+        def show(text):
+            lines = (log_label.text + text).splitlines()[-LOG_VIEW_LINES:]
+            log_label.text = '\n'.join(lines) + '\n'
+            scroll.scroll_y = 0
+        
+        def follow():
+            # Reading flushes the log writer, so stay off the UI thread
+            _, position = follow_log()
+            text = get_log_content(LOG_VIEW_LINES)
+            while True:
+                if text:
+                    Clock.schedule_once(lambda dt, text=text: show(text), 0)
+                if closed.wait(LOG_VIEW_INTERVAL):
+                    return
+                text, position = follow_log(position)
+        
+        popup.open()
+        threading.Thread(target=follow, daemon=True).start()
+    
     def fetch_formats(self, instance):
         """Fetch available formats for the video"""
         url = self.current_url
@@ -263,17 +538,11 @@ class DownloaderApp(App):
         
         def fetch_thread():
             try:
+                from downloader import get_available_formats
                 formats = get_available_formats(url)
                 if formats:
-                    res_map = {
-                        "7680x4320": "4320p (8K)",
-                        "3840x2160": "2160p (4K)",
-                        "2560x1440": "1440p (2K)",
-                        "1920x1080": "1080p (Full HD)",
-                        "1280x720": "720p (HD)"
-                    }
-                    values = [res_map.get(res, res) for res in formats.keys()]
-                    Clock.schedule_once(lambda dt: self.update_resolutions(values), 0)
+                    labels = {resolution_label(res): res for res in formats}
+                    Clock.schedule_once(lambda dt: self.update_resolutions(labels), 0)
                     Clock.schedule_once(
                         lambda dt: setattr(self.status_label, 'text', 
                                          f'✓ Found {len(formats)} available quality options'), 0
@@ -294,18 +563,15 @@ class DownloaderApp(App):
         
         threading.Thread(target=fetch_thread, daemon=True).start()
     
-    def update_resolutions(self, values):
-        """Update resolution spinner values"""
-        if values:
-            self.res_spinner.values = values
-            self.res_spinner.text = values[0] if values else '1080p (Full HD)'
+    def update_resolutions(self, labels):
+        """Update resolution spinner values from {label: "WxH"}"""
+        if labels:
+            self.res_labels = labels
+            self.res_spinner.values = list(labels)
+            self.res_spinner.text = next(iter(labels))
     
     def start_download(self, instance):
-        """Start the download in a background thread"""
-        if self.is_downloading:
-            self.show_popup('Download in Progress', 'A download is already running. Please wait.')
-            return
-        
+        """Queue a download; up to MAX_PARALLEL_DOWNLOADS run at once"""
         url = self.current_url
         if not url:
             self.show_popup('Error', 'Please enter a YouTube URL')
@@ -316,14 +582,6 @@ class DownloaderApp(App):
             self.show_popup('Invalid URL', 'Please enter a valid YouTube URL')
             return
         
-        clear_progress()
-        self.progress_bar.value = 0
-        self.progress_label.text = '0%'
-        self.download_btn.disabled = True
-        self.download_btn.text = '⏳ Downloading...'
-        self.download_btn.background_color = (0.6, 0.6, 0.6, 1)
-        self.is_downloading = True
-        
         download_type = self.type_spinner.text
         
         # Extract resolution from spinner text (e.g., "1080p (Full HD)" -> "1920x1080")
@@ -334,58 +592,81 @@ class DownloaderApp(App):
             "1080p (Full HD)": "1920x1080",
             "720p (HD)": "1280x720"
         }
-        selected_res = res_map.get(self.res_spinner.text, "1920x1080")
+        selected_res = self.res_labels.get(self.res_spinner.text) or res_map.get(self.res_spinner.text, "1920x1080")
+        max_mb = self.size_input.text.strip()
+        max_size = int(max_mb) * 1024 * 1024 if max_mb.isdigit() and int(max_mb) > 0 else None
         
-        def download_thread():
-            try:
-                if download_type == 'Audio Only (MP3)':
-                    result = download_audio(url)
-                else:
-                    result = download_video(url, selected_res=selected_res)
-                
-                Clock.schedule_once(lambda dt: self.download_complete(result), 0)
-            except Exception as e:
-                Clock.schedule_once(
-                    lambda dt: self.download_complete(f'Error: {str(e)}'), 0
-                )
+        if download_type in AUDIO_TYPES:
+            job = self.queue.submit(url, mode='audio', resolution=AUDIO_TYPES[download_type])
+        else:
+            job = self.queue.submit(url, mode='video', resolution=selected_res, max_size=max_size)
         
-        self.download_thread = threading.Thread(target=download_thread, daemon=True)
-        self.download_thread.start()
-        self.status_label.text = 'Download started... Please wait.'
+        self.url_input.text = ''
+        self.status_label.text = f'Download #{job.id} queued.'
     
-    def download_complete(self, result):
-        """Handle download completion"""
-        self.status_label.text = result
-        self.download_btn.disabled = False
-        self.download_btn.text = '⬇ Start Download'
-        self.download_btn.background_color = (0.2, 0.7, 0.3, 1)
-        self.is_downloading = False
-        
-        if 'complete' in result.lower() or 'success' in result.lower():
-            self.progress_bar.value = 100
-            self.progress_label.text = '100%'
-            self.show_popup('Success! 🎉', result)
+    def toggle_pause(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            return
+        if job.state == PAUSED:
+            self.queue.resume(job_id)
         else:
-            self.show_popup('Download Failed', result)
+            self.queue.pause(job_id)
     
-    def update_progress(self, dt):
-        """Update progress bar and status from progress file"""
-        if not self.is_downloading:
-            return
-        
-        progress_text = get_progress()
-        if progress_text and progress_text != 'Waiting...':
-            self.status_label.text = progress_text
-            
-            # Extract percentage if present
-            match = re.search(r'(\d+\.?\d*)%', progress_text)
-            if match:
-                try:
-                    percent = float(match.group(1))
-                    self.progress_bar.value = min(percent, 100)
-                    self.progress_label.text = f'{percent:.1f}%'
-                except ValueError:
-                    pass
+    def on_job_update(self, job):
+        """Called from worker threads whenever a job changes state"""
+        self.mark_changed(job.id)
+    
+    def on_progress(self, event):
+        """Called from the publishing thread for every progress event"""
+        self.mark_changed(event.job_id)
+    
+    def mark_changed(self, job_id):
+        """Note a changed job and make sure the next frame applies it"""
+        with self.changed_lock:
+            first = not self.changed_jobs
+            self.changed_jobs.add(job_id)
+        if first:
+            self.flush_trigger()
+    
+    def flush_updates(self, dt):
+        """Apply all job and progress changes since the last frame in one pass"""
+        with self.changed_lock:
+            job_ids, self.changed_jobs = self.changed_jobs, set()
+        rows = []
+        for job_id in sorted(i for i in job_ids if i is not None):
+            job = self.queue.get(job_id)
+            if job is None:
+                continue
+            rows.append(self.job_row(job))
+            previous, self.job_states[job.id] = self.job_states.get(job.id), job.state
+            if job.state != previous and job.state in FINISHED_STATES and job.result:
+                self.status_label.text = f'#{job.id}: {job.result}'
+                if job.state == FAILED:
+                    self.show_popup('Download Failed', job.result)
+        if rows:
+            self.job_list.update(rows)
+    
+    def job_row(self, job):
+        """The job's row in the job list"""
+        event = bus.latest(job.id)
+        active = job.state in ACTIVE_STATES
+        status = event.message if event and event.message and active else job.status
+        details = [f'[{job.state}] {status}']
+        if active and event and event.phase == DOWNLOADING:
+            details += [text for text in (format_speed(event.speed), format_eta(event.eta)) if text]
+        if job.state == DONE:
+            percent = 100
+        else:
+            percent = min(event.percent or 0, 100) if event else 0
+        return {
+            'job_id': job.id,
+            'title': f'#{job.id} {job_title(job)}',
+            'status': '  ·  '.join(details),
+            'percent': percent,
+            'paused': job.state == PAUSED,
+            'finished': job.state in FINISHED_STATES,
+        }
 
 if __name__ == '__main__':
     DownloaderApp().run()
@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from debug import get_app_dir, log
+
+# Job phases, in the order a job normally goes through them
+QUEUED = 'queued'
+RESOLVE = 'resolve'          # finding the yt-dlp binary
+FFMPEG = 'ffmpeg'            # ensure_ffmpeg
+PROBE = 'probe'              # metadata extraction
+DOWNLOAD = 'download'
+POSTPROCESS = 'postprocess'  # merging or audio extraction/conversion
+FINALIZE = 'finalize'        # moving the file into place, archive bookkeeping
+PHASES = (QUEUED, RESOLVE, FFMPEG, PROBE, DOWNLOAD, POSTPROCESS, FINALIZE)
+
+# Finished jobs kept in memory for metrics.recent()
+RECENT_JOBS = 200
+# metrics.jsonl is rolled over to metrics.jsonl.1 past this size
+METRICS_MAX_BYTES = 1024 * 1024
+# Allocation sites listed in a job's tracemalloc report
+TRACEMALLOC_TOP = 25
+# What enable_profiling can capture ('cpu': cProfile, 'memory': tracemalloc)
+PROFILE_KINDS = ('cpu', 'memory')
+
+def get_metrics_path():
+    return os.path.join(get_app_dir(), 'metrics.jsonl')
+
+def get_prometheus_path():
+    return os.path.join(get_app_dir(), 'metrics.prom')
+
+def get_profile_dir():
+    return os.path.join(get_app_dir(), 'profiles')
+
+def parse_profile(text):
+    """'cpu', 'memory' or 'cpu,memory' -> tuple of PROFILE_KINDS; raises ValueError"""
+    kinds = tuple(filter(None, (part.strip().lower() for part in str(text).split(','))))
+    unknown = [kind for kind in kinds if kind not in PROFILE_KINDS]
+    if unknown or not kinds:
+        raise ValueError(f"not a profile kind: {text!r}")
+    return kinds
+
+class JobMetrics:
+    """Timing spans and transfer figures of one job"""
+
+    def __init__(self, job_id, mode=None, url=None, created=None):
+        self.job_id = job_id
+        self.mode = mode
+        self.url = url
+        self.created = created or time.time()
+        self.finished = None
+        # phase -> [seconds, number of spans]; a phase repeats on retries
+        self.phases = {}
+        self.current = None
+        self.current_since = None
+        self.bytes = 0
+        self.download_seconds = 0.0
+        self.peak_speed = 0.0
+        self.retries = 0
+        self.restarts = 0
+        self.state = None
+        self.returncode = None
+        self.error_class = None
+
+    def enter(self, phase, now):
+        self.leave(now)
+        self.current = phase
+        self.current_since = now
+
+    def leave(self, now):
+        if self.current is None:
+            return
+        entry = self.phases.setdefault(self.current, [0.0, 0])
+        entry[0] += now - self.current_since
+        entry[1] += 1
+        self.current = None
+
+    @property
+    def mean_speed(self):
+        return self.bytes / self.download_seconds if self.download_seconds else None
+
+    def to_dict(self):
+        total = (self.finished or time.time()) - self.created
+        return {
+            'job_id': self.job_id,
+            'mode': self.mode,
+            'url': self.url,
+            'created': round(self.created, 3),
+            'total_seconds': round(total, 3),
+            'phases': {phase: round(seconds, 3) for phase, (seconds, _) in self.phases.items()},
+            'current_phase': self.current,
+            'bytes': self.bytes,
+            'mean_speed': round(self.mean_speed, 1) if self.mean_speed else None,
+            'peak_speed': round(self.peak_speed, 1) if self.peak_speed else None,
+            'retries': self.retries,
+            'restarts': self.restarts,
+            'state': self.state,
+            'returncode': self.returncode,
+            'error_class': self.error_class,
+        }
+
+class Metrics:
+    """Per-job phase spans and transfer figures.
+
+    The downloader marks phases with span()/enter() and reports transfers
+    with transfer(); the JobQueue opens a job's record with begin() and
+    closes it with finish(), which appends it to metrics.jsonl (and
+    rewrites the Prometheus text file if enabled). Calls for job_id None
+    (downloads outside the queue) are ignored.
+
+    cProfile and tracemalloc capture per job are off by default; see
+    enable_profiling().
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_metrics_path()
+        self.prometheus_path = None
+        self.profile_cpu = False
+        self.profile_memory = False
+        self._jobs = {}
+        self._recent = deque(maxlen=RECENT_JOBS)
+        # Totals since start, for the Prometheus file
+        self._counts = {}
+        self._phase_totals = {}
+        self._bytes_total = 0
+        self._retries_total = 0
+        self._tracing = 0
+        self._lock = threading.Lock()
+
+    def enable_prometheus(self, path=None):
+        """Keep a Prometheus text-format file (node_exporter textfile style) up to date"""
+        self.prometheus_path = path or get_prometheus_path()
+
+    def enable_profiling(self, cpu=True, memory=False):
+        """Profile each job's network stage: cProfile stats and/or a tracemalloc report in profiles/"""
+        self.profile_cpu = cpu
+        self.profile_memory = memory
+
+    def begin(self, job):
+        """A worker picked the job up; a resumed job continues its earlier record"""
+        now = time.time()
+        with self._lock:
+            record = self._jobs.get(job.id)
+            if record is None:
+                record = self._jobs[job.id] = JobMetrics(job.id, job.mode, job.url, job.created)
+                record.phases[QUEUED] = [now - job.created, 1]
+
+    def retry(self, job_id):
+        """The job failed and is tried again"""
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record:
+                record.retries += 1
+
+    def enter(self, job_id, phase):
+        """End the job's current phase and start `phase`"""
+        if job_id is None:
+            return
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record:
+                record.enter(phase, time.time())
+
+    def leave(self, job_id):
+        if job_id is None:
+            return
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record:
+                record.leave(time.time())
+
+    @contextmanager
+    def span(self, job_id, phase):
+        self.enter(job_id, phase)
+        try:
+            yield
+        finally:
+            self.leave(job_id)
+
+    def transfer(self, job_id, downloaded_bytes, seconds, peak_speed=None):
+        """Bytes fetched by one download run, how long it took and its peak speed"""
+        if job_id is None:
+            return
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            record.bytes += downloaded_bytes or 0
+            record.download_seconds += seconds
+            record.peak_speed = max(record.peak_speed, peak_speed or 0.0)
+
+    def finish(self, job):
+        """Close the job's record and write it out, once it is done, failed or cancelled"""
+        now = time.time()
+        with self._lock:
+            record = self._jobs.pop(job.id, None)
+            if record is None:
+                return None
+            record.leave(now)
+            record.finished = now
+            record.state = job.state
+            record.returncode = job.returncode
+            record.error_class = job.error_class
+            record.restarts = job.stall_restarts
+            entry = record.to_dict()
+            self._recent.append(entry)
+            key = (record.mode, record.state)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            for phase, (seconds, count) in record.phases.items():
+                total = self._phase_totals.setdefault(phase, [0.0, 0])
+                total[0] += seconds
+                total[1] += count
+            self._bytes_total += record.bytes
+            self._retries_total += record.retries
+        self._append(entry)
+        if self.prometheus_path:
+            self._write_prometheus()
+        return entry
+
+    def get(self, job_id):
+        """Metrics of a running job, or of a finished one still in the recent list"""
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record:
+                return record.to_dict()
+            return next((e for e in reversed(self._recent) if e['job_id'] == job_id), None)
+
+    def active(self):
+        with self._lock:
+            return [record.to_dict() for record in self._jobs.values()]
+
+    def recent(self):
+        """Finished jobs, oldest first"""
+        with self._lock:
+            return list(self._recent)
+
+    def _append(self, entry):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > METRICS_MAX_BYTES:
+                os.replace(self.path, self.path + '.1')
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        except Exception as e:
+            log(f"Could not write metrics: {e}")
+
+    def prometheus_text(self):
+        with self._lock:
+            counts = dict(self._counts)
+            phases = {phase: list(total) for phase, total in self._phase_totals.items()}
+            bytes_total = self._bytes_total
+            retries_total = self._retries_total
+            active = len(self._jobs)
+        lines = [
+            '# HELP ytd_jobs_total Jobs finished, by mode and final state.',
+            '# TYPE ytd_jobs_total counter',
+        ]
+        lines += [f'ytd_jobs_total{{mode="{mode}",state="{state}"}} {count}'
+                  for (mode, state), count in sorted(counts.items(), key=str)]
+        lines += [
+            '# HELP ytd_phase_seconds Time jobs spent in each phase.',
+            '# TYPE ytd_phase_seconds summary',
+        ]
+        for phase in PHASES:
+            if phase in phases:
+                seconds, count = phases[phase]
+                lines.append(f'ytd_phase_seconds_sum{{phase="{phase}"}} {seconds:.3f}')
+                lines.append(f'ytd_phase_seconds_count{{phase="{phase}"}} {count}')
+        lines += [
+            '# HELP ytd_downloaded_bytes_total Bytes downloaded by finished jobs.',
+            '# TYPE ytd_downloaded_bytes_total counter',
+            f'ytd_downloaded_bytes_total {bytes_total}',
+            '# HELP ytd_retries_total Retried attempts of finished jobs.',
+            '# TYPE ytd_retries_total counter',
+            f'ytd_retries_total {retries_total}',
+            '# HELP ytd_active_jobs Jobs currently being worked on.',
+            '# TYPE ytd_active_jobs gauge',
+            f'ytd_active_jobs {active}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def _write_prometheus(self):
+        tmp_path = self.prometheus_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.prometheus_path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.prometheus_path)
+        except Exception as e:
+            log(f"Could not write Prometheus metrics: {e}")
+
+    @contextmanager
+    def profiled(self, job):
+        """Profile the calling thread (the job's worker) while the block runs, if enabled.
+
+        Post-processing runs on the pool's threads and in ffmpeg, so it shows
+        up in the spans, not in the profile.
+        """
+        if not (self.profile_cpu or self.profile_memory):
+            yield
+            return
+        profiler = self._start_cpu_profile() if self.profile_cpu else None
+        snapshot = self._start_tracemalloc() if self.profile_memory else None
+        try:
+            yield
+        finally:
+            base = os.path.join(get_profile_dir(), f"job-{job.id}")
+            if snapshot is not None:
+                self._stop_tracemalloc(snapshot, base + '-alloc.txt')
+            if profiler:
+                try:
+                    profiler.disable()
+                    os.makedirs(get_profile_dir(), exist_ok=True)
+                    profiler.dump_stats(base + '.prof')
+                    log(f"CPU profile of job {job.id}: {base}.prof")
+                except Exception as e:
+                    log(f"Could not save CPU profile: {e}")
+
+    def _start_cpu_profile(self):
+        try:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        except Exception as e:
+            # Only one profiler can be active at a time on newer Pythons
+            log(f"Could not start CPU profile: {e}")
+            return None
+
+    def _start_tracemalloc(self):
+        import tracemalloc
+        with self._lock:
+            self._tracing += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        return tracemalloc.take_snapshot()
+
+    def _stop_tracemalloc(self, before, path):
+        import tracemalloc
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            stats = snapshot.compare_to(before, 'lineno')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"Peak traced memory: {tracemalloc.get_traced_memory()[1] / 1024:.0f} KiB\n")
+                f.writelines(f"{stat}\n" for stat in stats[:TRACEMALLOC_TOP])
+            log(f"Allocation report: {path}")
+        except Exception as e:
+            log(f"Could not save allocation report: {e}")
+        finally:
+            with self._lock:
+                self._tracing -= 1
+                if self._tracing == 0:
+                    tracemalloc.stop()
+
+# Shared metrics for all jobs
+metrics = Metrics()
@@ -0,0 +1,128 @@
+import threading
+import time
+from urllib.parse import urlparse
+from debug import log
+
+# Error classes
+THROTTLED = 'throttled'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Worst class wins when a run prints several errors
+SEVERITY = {None: 0, TRANSIENT: 1, THROTTLED: 2, PERMANENT: 3}
+
+THROTTLE_MARKERS = (
+    'HTTP Error 429', 'Too Many Requests', 'HTTP Error 403', 'rate-limit', 'rate limit',
+    "confirm you're not a bot", 'confirm you’re not a bot',
+)
+PERMANENT_MARKERS = (
+    'Video unavailable', 'Private video', 'This video has been removed', 'This video is not available',
+    'Unsupported URL', 'HTTP Error 404', 'HTTP Error 410', 'is not a valid URL', 'members-only',
+    'Join this channel', 'copyright', 'Requested format is not available', 'account associated',
+    'This live event will begin',
+)
+TRANSIENT_MARKERS = (
+    'timed out', 'Connection reset', 'Connection refused', 'Temporary failure in name resolution',
+    'Network is unreachable', 'HTTP Error 500', 'HTTP Error 502', 'HTTP Error 503', 'HTTP Error 504',
+    'IncompleteRead', 'Unable to download', 'giving up after',
+)
+
+# Request sleep grows from 0 up to MAX_SLEEP while a host pushes back,
+# and halves after every successful run
+INITIAL_SLEEP = 1.0
+MAX_SLEEP = 30.0
+MIN_SLEEP = 0.25
+
+HOST_ALIASES = {
+    'youtu.be': 'youtube.com',
+    'www.youtube.com': 'youtube.com',
+    'm.youtube.com': 'youtube.com',
+    'music.youtube.com': 'youtube.com',
+    'youtube-nocookie.com': 'youtube.com',
+    'www.youtube-nocookie.com': 'youtube.com',
+}
+
+def classify_line(line):
+    """Classify a line of yt-dlp error output, or None if it is not an error we know"""
+    if not (line.startswith('ERROR') or line.startswith('WARNING')):
+        return None
+    for marker in PERMANENT_MARKERS:
+        if marker in line:
+            return PERMANENT
+    for marker in THROTTLE_MARKERS:
+        if marker in line:
+            return THROTTLED
+    if line.startswith('ERROR'):
+        for marker in TRANSIENT_MARKERS:
+            if marker in line:
+                return TRANSIENT
+    return None
+
+def worse(a, b):
+    """The more severe of two error classes"""
+    return a if SEVERITY[a] >= SEVERITY[b] else b
+
+def host_key(url):
+    host = (urlparse(url).hostname or '').lower()
+    return HOST_ALIASES.get(host, host)
+
+class _HostState:
+    def __init__(self):
+        self.sleep = 0.0
+        self.throttled_at = None
+
+class Pacer:
+    """Per-host request pacing shared by all jobs.
+
+    Requests start without any delay. When yt-dlp reports rate limiting the
+    host's --sleep-requests delay is introduced and doubled, and yt-dlp's own
+    retries back off exponentially; successful runs halve it again.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, url):
+        key = host_key(url)
+        if key not in self._hosts:
+            self._hosts[key] = _HostState()
+        return self._hosts[key]
+
+    def sleep_for(self, url):
+        with self._lock:
+            return self._state(url).sleep
+
+    def yt_dlp_args(self, url):
+        """Retry and pacing arguments for a yt-dlp run against url's host"""
+        args = [
+            "--retries", "10",
+            "--fragment-retries", "10",
+            "--extractor-retries", "5",
+        ]
+        sleep = self.sleep_for(url)
+        if sleep > 0:
+            args += [
+                "--sleep-requests", f"{sleep:g}",
+                "--retry-sleep", f"exp=1:{MAX_SLEEP:g}",
+                "--retry-sleep", f"fragment:exp=1:{MAX_SLEEP:g}",
+            ]
+        return args
+
+    def report(self, url, error_class):
+        """Feed back the outcome of a run (None = succeeded / nothing learned)"""
+        with self._lock:
+            state = self._state(url)
+            if error_class == THROTTLED:
+                state.sleep = min(max(state.sleep * 2, INITIAL_SLEEP), MAX_SLEEP)
+                state.throttled_at = time.time()
+                sleep = state.sleep
+            elif error_class is None and state.sleep > 0:
+                state.sleep = state.sleep / 2 if state.sleep / 2 >= MIN_SLEEP else 0.0
+                sleep = state.sleep
+            else:
+                return
+        log(f"Request sleep for {host_key(url)} is now {sleep:g}s")
+
+# Shared pacing state for all jobs
+pacer = Pacer()
@@ -0,0 +1,172 @@
+import os
+import tempfile
+import threading
+from collections import deque
+from debug import log
+import progress
+import procengine
+import staging
+from metrics import metrics, POSTPROCESS, FINALIZE
+
+# ffmpeg merges and transcodes are CPU bound; one per core, leaving the
+# network stage some headroom on small phones
+DEFAULT_WORKERS = max(1, min((os.cpu_count() or 2) - 1, 4))
+
+class Task:
+    """One ffmpeg run that turns downloaded raw streams into the final file.
+
+    ffmpeg writes to a temporary file in the job's staging directory, which is
+    moved to output_path only when ffmpeg succeeded; if a file of that name
+    exists already, output_path becomes a free "name (n)" instead (see
+    staging.finalize). The inputs are removed afterwards (or when the job
+    was cancelled). on_success is called with the output path once the
+    file is in place.
+    """
+
+    def __init__(self, ffmpeg_path, inputs, args, output_path, description="Post-processing",
+                 on_success=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.inputs = list(inputs)
+        self.args = list(args)
+        self.output_path = output_path
+        self.description = description
+        self.on_success = on_success
+        self.returncode = None
+        self.error = None
+
+    def temp_path(self, job_id=None):
+        """A new file for ffmpeg's output in the job's staging directory, where it stays until it is complete.
+
+        The name is unique, so tasks with the same output name (same title,
+        same video) never write to each other's file.
+        """
+        stem, ext = os.path.splitext(os.path.basename(self.output_path))
+        fd, path = tempfile.mkstemp(prefix=f".{stem}.", suffix=f".tmp{ext}", dir=staging.job_dir(job_id))
+        os.close(fd)
+        return path
+
+    def command(self, temp_path):
+        cmd = [self.ffmpeg_path, "-y", "-loglevel", "error", "-nostdin"]
+        for path in self.inputs:
+            cmd += ["-i", path]
+        return cmd + self.args + [temp_path]
+
+    def run(self, job=None):
+        """Run ffmpeg (attached to job, so pause/cancel can stop it); returns the exit code"""
+        job_id = job.id if job else None
+        progress.bus.publish(job_id, phase=progress.MERGING if len(self.inputs) > 1 else progress.EXTRACTING,
+                             message=f"{self.description}...")
+        metrics.enter(job_id, POSTPROCESS)
+        temp_path = None
+        try:
+            temp_path = self.temp_path(job_id)
+            cmd = self.command(temp_path)
+            log(f"Running command: {' '.join(cmd)}")
+            process = procengine.engine.spawn(cmd, stdout=procengine.DEVNULL, stderr=procengine.PIPE)
+            if job:
+                job.attach_process(process)
+            _, stderr = process.communicate()
+            self.returncode = process.returncode
+            if self.returncode != 0:
+                lines = (stderr or '').strip().splitlines()
+                self.error = lines[-1] if lines else 'ffmpeg failed'
+                log(f"{self.description} failed ({self.returncode}): {stderr.strip()}")
+            else:
+                metrics.enter(job_id, FINALIZE)
+                self.output_path = staging.finalize(temp_path, self.output_path)
+        except Exception as e:
+            log(f"{self.description} failed: {e}")
+            self.returncode = 1
+            self.error = str(e)
+        finally:
+            if job:
+                job.detach_process()
+
+        if self.returncode != 0:
+            if temp_path:
+                self._remove(temp_path)
+            if job and job.cancel_requested:
+                self.discard()
+            metrics.leave(job_id)
+            return self.returncode
+
+        self.discard()
+        if self.on_success:
+            try:
+                self.on_success(self.output_path)
+            except Exception as e:
+                log(f"Post-processing callback failed: {e}")
+        metrics.leave(job_id)
+        return 0
+
+    def discard(self):
+        """Remove the raw input streams"""
+        for path in self.inputs:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log(f"Could not remove {path}: {e}")
+
+class PostProcessPool:
+    """A bounded pool of threads running post-processing Tasks in FIFO order.
+
+    Download workers hand finished raw streams over with submit() and move
+    on to the next job, so network transfers and ffmpeg work overlap.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.max_workers = max(1, workers)
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._running = 0
+
+    def submit(self, task, job=None, on_done=None):
+        """Queue task; on_done(task) is called when it finished, failed or was skipped"""
+        with self._lock:
+            self._pending.append((task, job, on_done))
+            while (self._workers < self.max_workers
+                   and self._workers - self._running < len(self._pending)):
+                self._workers += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + self._running
+
+    def set_workers(self, workers):
+        with self._lock:
+            self.max_workers = max(1, workers)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._workers > self.max_workers:
+                    self._workers -= 1
+                    return
+                task, job, on_done = self._pending.popleft()
+                self._running += 1
+            try:
+                if job and job.stop_requested:
+                    # Paused or cancelled while waiting; the raw streams stay for a resume
+                    if job.cancel_requested:
+                        task.discard()
+                else:
+                    task.run(job)
+            finally:
+                with self._lock:
+                    self._running -= 1
+            if on_done:
+                try:
+                    on_done(task)
+                except Exception as e:
+                    log(f"Post-processing done callback failed: {e}")
+
+# Shared post-processing pool for all jobs
+pool = PostProcessPool()
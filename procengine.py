@@ -0,0 +1,200 @@
+import asyncio
+import concurrent.futures
+import os
+import signal
+import subprocess
+import threading
+from debug import log
+
+# Child processes (yt-dlp, ffmpeg) running at once; further spawns wait for a slot
+MAX_PROCESSES = 32
+# Longest output line accepted (yt-dlp -j prints the whole info JSON on one line)
+LINE_LIMIT = 16 * 1024 * 1024
+# Seconds between SIGTERM and SIGKILL when a process group is stopped
+KILL_GRACE = 5.0
+
+PIPE = subprocess.PIPE
+STDOUT = subprocess.STDOUT
+DEVNULL = subprocess.DEVNULL
+
+def _signal_group(pid, sig):
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+    except Exception:
+        try:
+            os.kill(pid, sig)
+        except Exception:
+            pass
+
+class ProcessHandle:
+    """A child process started by the engine, used like a Popen from any thread.
+
+    Each process runs in its own session, so terminate() and kill() reach
+    everything it spawned (yt-dlp's ffmpeg). Output is read on the engine's
+    event loop; the blocking methods only wait for it.
+    """
+
+    def __init__(self, engine, process, cmd):
+        self.engine = engine
+        self.cmd = cmd
+        self._process = process
+        self.pid = process.pid
+        self._exited = None
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+    def poll(self):
+        return self._process.returncode
+
+    def terminate(self):
+        """SIGTERM the process group, then SIGKILL it if it is still there after KILL_GRACE"""
+        if self.poll() is not None:
+            return
+        _signal_group(self.pid, signal.SIGTERM)
+        self.engine.loop.call_soon_threadsafe(self._schedule_kill)
+
+    def kill(self):
+        if self.poll() is None:
+            _signal_group(self.pid, signal.SIGKILL)
+
+    def _schedule_kill(self):
+        self.engine.loop.call_later(KILL_GRACE, self.kill)
+
+    def wait(self, timeout=None):
+        """Exit code; raises subprocess.TimeoutExpired (process left running) on timeout"""
+        future = self.engine.submit(self._wait())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise subprocess.TimeoutExpired(self.cmd, timeout)
+
+    def stream(self, on_line, timeout=None):
+        """Call on_line(line) for every line of stdout, then return the exit code.
+
+        on_line runs on the engine's loop thread, so it must not block.
+        After timeout seconds the process group is killed and
+        subprocess.TimeoutExpired raised.
+        """
+        return self.engine.call(self._stream(on_line), timeout, self)
+
+    def communicate(self, timeout=None):
+        """(stdout, stderr) as text, like Popen.communicate"""
+        return self.engine.call(self._communicate(), timeout, self)
+
+    async def _wait(self):
+        return await asyncio.shield(self._exited)
+
+    async def _stream(self, on_line):
+        reader = self._process.stdout
+        while True:
+            try:
+                data = await reader.readline()
+            except ValueError:
+                # Line over LINE_LIMIT; skip the rest of it
+                data = await reader.read(LINE_LIMIT)
+                continue
+            if not data:
+                break
+            try:
+                on_line(data.decode('utf-8', errors='replace').replace('\r\n', '\n'))
+            except Exception as e:
+                log(f"Output handler failed: {e}")
+        return await self._exited
+
+    async def _communicate(self):
+        stdout, stderr = await self._process.communicate()
+        await self._exited
+        decode = lambda data: data.decode('utf-8', errors='replace') if data is not None else None
+        return decode(stdout), decode(stderr)
+
+class ProcessEngine:
+    """Runs child processes from one asyncio event loop on a background thread.
+
+    Many processes can run without a reader thread each: their output is
+    read by the loop, and callers block only on a future. At most
+    max_processes run at once; spawn() waits for a free slot
+    (back-pressure). On Python before 3.12 asyncio still reaps children
+    with a small waiter thread each; 3.12 and later use pidfds.
+    """
+
+    def __init__(self, max_processes=MAX_PROCESSES):
+        self.max_processes = max_processes
+        self.loop = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._slots = asyncio.Semaphore(self.max_processes)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name='procengine', daemon=True).start()
+                ready.wait()
+                self.loop = loop
+        return self.loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def call(self, coro, timeout=None, handle=None):
+        """Run a coroutine on the engine loop and wait for its result.
+
+        On timeout the coroutine is cancelled, handle's process group is
+        killed and subprocess.TimeoutExpired is raised.
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            if handle is not None:
+                handle.kill()
+                log(f"Process {handle.pid} timed out after {timeout}s")
+            raise subprocess.TimeoutExpired(handle.cmd if handle else None, timeout)
+
+    async def _spawn(self, cmd, stdin, stdout, stderr, env, cwd):
+        await self._slots.acquire()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=stdin, stdout=stdout, stderr=stderr, env=env, cwd=cwd,
+                limit=LINE_LIMIT, start_new_session=True
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        handle = ProcessHandle(self, process, cmd)
+        handle._exited = asyncio.ensure_future(self._reap(process))
+        return handle
+
+    async def _reap(self, process):
+        try:
+            return await process.wait()
+        finally:
+            self._slots.release()
+
+    def spawn(self, cmd, stdout=PIPE, stderr=STDOUT, env=None, cwd=None, stdin=DEVNULL):
+        """Start cmd and return its ProcessHandle; blocks while MAX_PROCESSES are running"""
+        return self.submit(self._spawn(list(cmd), stdin, stdout, stderr, env, cwd)).result()
+
+    def run(self, cmd, timeout=None, check=False, env=None, cwd=None):
+        """Like subprocess.run(cmd, capture_output=True, text=True, timeout=..., check=...)"""
+        handle = self.spawn(cmd, stdout=PIPE, stderr=PIPE, env=env, cwd=cwd)
+        stdout, stderr = handle.communicate(timeout)
+        if check and handle.returncode != 0:
+            raise subprocess.CalledProcessError(handle.returncode, cmd, stdout, stderr)
+        return subprocess.CompletedProcess(cmd, handle.returncode, stdout, stderr)
+
+# Shared engine for all child processes
+engine = ProcessEngine()
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from dataclasses import dataclass, replace
+
+# Progress phases
+PREPARING = 'preparing'
+DOWNLOADING = 'downloading'
+MERGING = 'merging'
+EXTRACTING = 'extracting'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+# yt-dlp prints one JSON record per progress update with this prefix
+RECORD_PREFIX = '[progress] '
+RECORD_FIELDS = (
+    'status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+    'speed', 'eta', 'fragment_index', 'fragment_count',
+)
+# Value for yt-dlp's --progress-template; missing fields come out as null
+PROGRESS_TEMPLATE = 'download:' + RECORD_PREFIX + '{' + ','.join(
+    f'"{field}":%(progress.{field}|null)j' for field in RECORD_FIELDS
+) + '}'
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Latest known progress of one job"""
+    job_id: object = None
+    phase: str = PREPARING
+    message: str = ''
+    percent: float = None
+    downloaded_bytes: int = None
+    total_bytes: int = None
+    speed: float = None
+    eta: int = None
+    fragment_index: int = None
+    fragment_count: int = None
+    timestamp: float = 0.0
+    seq: int = 0
+
+def parse_progress_record(line):
+    """Parse a PROGRESS_TEMPLATE line into progress fields, or None"""
+    try:
+        record = json.loads(line[len(RECORD_PREFIX):])
+    except ValueError:
+        return None
+
+    total = record.get('total_bytes') or record.get('total_bytes_estimate')
+    downloaded = record.get('downloaded_bytes')
+    fields = {
+        'status': record.get('status'),
+        'downloaded_bytes': downloaded,
+        'total_bytes': int(total) if total else None,
+        'speed': record.get('speed'),
+        'eta': record.get('eta'),
+        'fragment_index': record.get('fragment_index'),
+        'fragment_count': record.get('fragment_count'),
+        'percent': None,
+    }
+    if total and downloaded is not None:
+        fields['percent'] = min(downloaded * 100.0 / total, 100.0)
+    elif record.get('status') == 'finished':
+        fields['percent'] = 100.0
+    return fields
+
+class ProgressBus:
+    """Thread-safe, in-memory progress channel.
+
+    Publishers merge updates into the latest event of their job, so readers
+    only ever see one (coalesced) event per job no matter how often it is
+    updated between polls.
+    """
+
+    def __init__(self):
+        self._latest = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._subscribers = []
+
+    def publish(self, job_id, **fields):
+        """Merge new fields into the job's latest event"""
+        with self._cond:
+            self._seq += 1
+            previous = self._latest.get(job_id) or ProgressEvent(job_id=job_id)
+            event = replace(previous, timestamp=time.time(), seq=self._seq, **fields)
+            self._latest[job_id] = event
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Progress subscriber error: {e}")
+        return event
+
+    def latest(self, job_id):
+        with self._cond:
+            return self._latest.get(job_id)
+
+    def poll(self, since=0):
+        """Return (events changed after sequence number `since`, current sequence)"""
+        with self._cond:
+            events = [e for e in self._latest.values() if e.seq > since]
+            return sorted(events, key=lambda e: e.seq), self._seq
+
+    def wait(self, since=0, timeout=None):
+        """Like poll(), but block until something changes or timeout expires"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > since, timeout)
+        return self.poll(since)
+
+    def clear(self, job_id):
+        with self._cond:
+            self._latest.pop(job_id, None)
+
+    def subscribe(self, callback):
+        """Call callback(event) for every update (from the publishing thread)"""
+        with self._cond:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+# Shared bus used by the downloader and the UI
+bus = ProgressBus()
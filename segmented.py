@@ -0,0 +1,355 @@
+import errno
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
+from debug import log
+
+DEFAULT_SEGMENTS = 4
+# Files smaller than this per connection are not worth splitting further
+MIN_SEGMENT_SIZE = 1024 * 1024
+READ_SIZE = 256 * 1024
+# Segment state is saved at most this often (seconds) for resuming
+STATE_SAVE_INTERVAL = 2.0
+SEGMENT_RETRIES = 5
+CONNECT_TIMEOUT = 20
+MAX_REDIRECTS = 5
+# A throttled read waits in steps of at most this long (seconds), so a stop is noticed
+THROTTLE_STEP = 0.5
+
+class SegmentedDownloadError(Exception):
+    pass
+
+class DownloadStopped(SegmentedDownloadError):
+    pass
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per (thread, host)"""
+
+    def __init__(self, timeout=CONNECT_TIMEOUT):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def get(self, scheme, netloc):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = cls(netloc, timeout=self.timeout)
+            conns[(scheme, netloc)] = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def discard(self, scheme, netloc):
+        conn = getattr(self._local, 'conns', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+
+class RateLimiter:
+    """Caps the combined read rate of all connections of a download.
+
+    rate is in bytes/s (None = unlimited) and can be changed at any time
+    with set_rate; the new rate applies from the next read on.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+
+    def reserve(self, size):
+        """Account for size bytes just read; returns the monotonic time the reader may go on at"""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                self._next = now
+                return now
+            self._next = max(self._next, now) + size / self.rate
+            return self._next
+
+def _request(pool, url, headers, byte_range=None):
+    """GET url (following redirects) on a pooled connection; returns (response, final url)"""
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = dict(headers or {})
+        if byte_range is not None:
+            request_headers['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        conn = pool.get(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', path, headers=request_headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            pool.discard(parts.scheme, parts.netloc)
+            raise
+        if response.status in (301, 302, 303, 307, 308):
+            location = response.getheader('Location')
+            response.read()
+            if not location:
+                raise SegmentedDownloadError(f"Redirect without Location from {url}")
+            url = urljoin(url, location)
+            continue
+        return response, url
+    raise SegmentedDownloadError(f"Too many redirects for {url}")
+
+def probe(url, headers=None, pool=None):
+    """Return (total length or None, whether byte ranges work, final URL)"""
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    try:
+        response, final_url = _request(pool, url, headers, byte_range=(0, 0))
+        response.read()
+        if response.status == 206:
+            content_range = response.getheader('Content-Range') or ''
+            total = content_range.rpartition('/')[2]
+            return (int(total) if total.isdigit() else None), True, final_url
+        if response.status == 200:
+            length = response.getheader('Content-Length')
+            return (int(length) if length and length.isdigit() else None), False, final_url
+        raise SegmentedDownloadError(f"HTTP {response.status} probing {url}")
+    finally:
+        if own_pool:
+            pool.close()
+
+def preallocate(fd, length):
+    """Reserve length bytes for the file behind fd; raises SegmentedDownloadError if they don't fit"""
+    try:
+        os.posix_fallocate(fd, 0, length)
+    except OSError as e:
+        if e.errno in (errno.ENOSPC, errno.EDQUOT):
+            raise SegmentedDownloadError(f"No space for {length} bytes: {e}")
+        # Not supported by this filesystem; at least set the size
+        os.ftruncate(fd, length)
+    except AttributeError:
+        os.ftruncate(fd, length)
+
+def split_ranges(length, segments):
+    """Split [0, length) into at most `segments` inclusive (start, end) ranges"""
+    segments = max(1, min(segments, length // MIN_SEGMENT_SIZE or 1))
+    size = -(-length // segments)
+    return [[start, min(start + size, length) - 1] for start in range(0, length, size)]
+
+class SegmentedDownload:
+    """Download one HTTP resource over several parallel byte-range connections.
+
+    Data goes straight into a preallocated `<dest>.part` file at each
+    segment's offset. Progress per segment is kept in `<dest>.segments.json`,
+    so an interrupted download continues each segment where it stopped.
+    With a RateLimiter, all segments together stay within its rate.
+    """
+
+    def __init__(self, url, dest, headers=None, segments=DEFAULT_SEGMENTS,
+                 progress_callback=None, should_stop=None, limiter=None):
+        self.url = url
+        self.dest = dest
+        self.headers = headers or {}
+        self.segments = segments
+        self.progress_callback = progress_callback
+        self.should_stop = should_stop or (lambda: False)
+        self.limiter = limiter
+        self.part_path = dest + '.part'
+        self.state_path = dest + '.segments.json'
+        self.length = None
+        # Bytes already present from an earlier, interrupted run
+        self.resumed = 0
+        self._done = []
+        self._ranges = []
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+    @property
+    def downloaded(self):
+        with self._lock:
+            return sum(self._done)
+
+    def run(self):
+        pool = ConnectionPool()
+        try:
+            self.length, ranges_ok, url = probe(self.url, self.headers, pool)
+            if not ranges_ok or not self.length:
+                log(f"No range support for {self.dest}, using one connection")
+                self._single_stream(pool, url)
+            else:
+                self._segmented(pool, url)
+        finally:
+            pool.close()
+        return self.dest
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('length') == self.length and os.path.getsize(self.part_path) == self.length:
+                return state['ranges'], state['done']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None, None
+
+    def _save_state(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_save < STATE_SAVE_INTERVAL:
+                return
+            self._last_save = now
+            state = {'length': self.length, 'ranges': self._ranges, 'done': list(self._done)}
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _segmented(self, pool, url):
+        ranges, done = self._load_state()
+        if ranges:
+            log(f"Resuming {self.dest}: {sum(done)}/{self.length} bytes present")
+            self.resumed = sum(done)
+            flags = os.O_WRONLY
+        else:
+            ranges = split_ranges(self.length, self.segments)
+            done = [0] * len(ranges)
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        self._ranges, self._done = ranges, done
+
+        fd = os.open(self.part_path, flags, 0o644)
+        try:
+            if flags & os.O_CREAT:
+                preallocate(fd, self.length)
+            self._save_state(force=True)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [executor.submit(self._fetch_segment, pool, url, fd, i)
+                           for i in range(len(ranges))]
+                errors = [f.exception() for f in futures]
+            self._save_state(force=True)
+            for error in errors:
+                if error:
+                    raise error
+
+            # Verify every byte arrived before publishing the file
+            if self.downloaded != self.length or os.fstat(fd).st_size != self.length:
+                raise SegmentedDownloadError(
+                    f"Length mismatch for {self.dest}: got {self.downloaded}, expected {self.length}")
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        os.replace(self.part_path, self.dest)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+    def _fetch_segment(self, pool, url, fd, index):
+        start, end = self._ranges[index]
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            offset = start + self._done[index]
+            if offset > end:
+                return
+            if self.should_stop():
+                raise DownloadStopped()
+            try:
+                response, _ = _request(pool, url, self.headers, byte_range=(offset, end))
+                if response.status != 206:
+                    response.read()
+                    raise SegmentedDownloadError(f"HTTP {response.status} for range {offset}-{end}")
+                while offset <= end:
+                    if self.should_stop():
+                        response.close()
+                        raise DownloadStopped()
+                    chunk = response.read(min(READ_SIZE, end - offset + 1))
+                    if not chunk:
+                        break
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    with self._lock:
+                        self._done[index] += len(chunk)
+                    self._report()
+                    self._throttle(len(chunk))
+                if offset > end:
+                    return
+                raise SegmentedDownloadError(f"Connection closed early in range {start}-{end}")
+            except DownloadStopped:
+                raise
+            except (SegmentedDownloadError, http.client.HTTPException, OSError) as e:
+                if isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.EDQUOT):
+                    # Retrying won't make room
+                    raise SegmentedDownloadError(f"Segment {index} failed: {e}")
+                parts = urlsplit(url)
+                pool.discard(parts.scheme, parts.netloc)
+                if attempt == SEGMENT_RETRIES:
+                    raise SegmentedDownloadError(f"Segment {index} failed: {e}")
+                log(f"Segment {index} of {self.dest} failed ({e}), retrying")
+                time.sleep(min(2 ** attempt, 10))
+
+    def _single_stream(self, pool, url):
+        response, _ = _request(pool, url, self.headers)
+        if response.status != 200:
+            response.read()
+            raise SegmentedDownloadError(f"HTTP {response.status} for {url}")
+        self._ranges, self._done = [[0, (self.length or 0) - 1]], [0]
+        with open(self.part_path, 'wb') as f:
+            if self.length:
+                preallocate(f.fileno(), self.length)
+            while True:
+                if self.should_stop():
+                    raise DownloadStopped()
+                chunk = response.read(READ_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                with self._lock:
+                    self._done[0] += len(chunk)
+                self._report()
+                self._throttle(len(chunk))
+            f.flush()
+            os.fsync(f.fileno())
+        if self.length is not None and self.downloaded != self.length:
+            raise SegmentedDownloadError(
+                f"Length mismatch for {self.dest}: got {self.downloaded}, expected {self.length}")
+        os.replace(self.part_path, self.dest)
+
+    def _throttle(self, size):
+        """Wait until the limiter allows the next read; raises DownloadStopped if stopped meanwhile"""
+        if self.limiter is None:
+            return
+        resume_at = self.limiter.reserve(size)
+        while True:
+            delay = resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            if self.should_stop():
+                raise DownloadStopped()
+            time.sleep(min(delay, THROTTLE_STEP))
+
+    def _report(self):
+        self._save_state()
+        if self.progress_callback:
+            self.progress_callback(self.downloaded, self.length)
+
+def download(url, dest, headers=None, segments=DEFAULT_SEGMENTS, progress_callback=None, should_stop=None,
+             limiter=None):
+    """Download url to dest over several connections; returns dest.
+
+    progress_callback(downloaded, total) is called as data arrives, and the
+    download raises DownloadStopped as soon as should_stop() returns True.
+    limiter (a RateLimiter) caps the download rate.
+    """
+    return SegmentedDownload(url, dest, headers, segments, progress_callback, should_stop, limiter).run()
@@ -0,0 +1,154 @@
+import errno
+import os
+import shutil
+import tempfile
+import time
+from debug import get_app_dir, log
+
+# Block size of the copy into the download directory when a rename is not possible
+COPY_BUFFER = 4 * 1024 * 1024
+
+def get_staging_dir():
+    """Directory on app-private storage where downloads and post-processing work.
+
+    On Android the download directory is shared storage, which is slow for
+    the small rewrites of fragment merging and remuxing; files only move
+    there once they are finished (see finalize).
+    """
+    return os.path.join(get_app_dir(), 'staging')
+
+def staging_dir():
+    path = get_staging_dir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def job_dir_name(job_id):
+    return f"job-{job_id}"
+
+def job_dir(job_id=None):
+    """Working directory of one job's single yt-dlp runs (the staging directory itself without a job)"""
+    path = staging_dir() if job_id is None else os.path.join(staging_dir(), job_dir_name(job_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def discard(job_id, prefixes=()):
+    """Remove what a job left in staging: its job_dir and the files starting with one of prefixes"""
+    shutil.rmtree(os.path.join(get_staging_dir(), job_dir_name(job_id)), ignore_errors=True)
+    if not prefixes:
+        return
+    try:
+        entries = list(os.scandir(get_staging_dir()))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith(tuple(prefixes)):
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                log(f"Could not remove {entry.path}: {e}")
+
+def same_filesystem(path, other):
+    try:
+        return os.stat(path).st_dev == os.stat(other).st_dev
+    except OSError:
+        return False
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def copy_file(src, dest):
+    """Copy src to dest with sendfile (large buffered reads where unavailable), then fsync"""
+    with open(src, 'rb') as fin, open(dest, 'wb') as fout:
+        size = os.fstat(fin.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                sent = os.sendfile(fout.fileno(), fin.fileno(), offset, min(COPY_BUFFER, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+        except (AttributeError, OSError) as e:
+            if offset or not (isinstance(e, AttributeError) or e.errno in (errno.EINVAL, errno.ENOSYS)):
+                raise
+            # No file-to-file sendfile here
+            while True:
+                block = fin.read(COPY_BUFFER)
+                if not block:
+                    break
+                fout.write(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+def unique_path(path):
+    """path, or "name (n).ext" with the first n for which no file exists yet"""
+    base, ext = os.path.splitext(path)
+    candidate = path
+    n = 1
+    while os.path.lexists(candidate):
+        candidate = f"{base} ({n}){ext}"
+        n += 1
+    return candidate
+
+def _move_new(src, dest):
+    """Rename src to dest, or to a free "dest (n)" name if dest exists; returns the name used.
+
+    A hard link claims the name atomically, so a file that appears in the
+    meantime is never replaced. Raises OSError(EXDEV) across filesystems.
+    """
+    while True:
+        target = unique_path(dest)
+        try:
+            os.link(src, target)
+        except FileExistsError:
+            continue
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                raise
+            # No hard links here (FAT, Android shared storage)
+            os.rename(src, target)
+            return target
+        os.remove(src)
+        return target
+
+def finalize(src, dest):
+    """Move a finished file from staging to dest; returns the path it ended up at.
+
+    An existing file is never replaced: if dest is taken (another video
+    with the same title), the file is saved as "dest (n)" instead. A rename
+    when both are on the same filesystem. Otherwise the file is copied to a
+    hidden temporary name of its own next to dest and renamed into place, so the user
+    never sees a partial file under dest's name.
+    """
+    directory = os.path.dirname(dest)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        return _move_new(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(dest)}.", suffix='.part', dir=directory)
+    os.close(fd)
+    started = time.monotonic()
+    try:
+        copy_file(src, temp_path)
+        dest = _move_new(temp_path, dest)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+    os.remove(src)
+    log(f"Copied {os.path.getsize(dest) / (1024 * 1024):.1f} MB into {directory} "
+        f"in {time.monotonic() - started:.2f}s")
+    return dest
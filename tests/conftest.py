@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep download.log and other app files out of the real home directory
+os.environ['HOME'] = tempfile.mkdtemp(prefix='ytd-test-home-')
@@ -0,0 +1,41 @@
+import sys
+
+import binaries
+
+def fake_binary(path, version):
+    path.write_text(f"#!{sys.executable}\nprint({version!r})\n")
+    path.chmod(0o755)
+    return str(path)
+
+def test_version_is_read_once_and_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(binaries, '_manifest', None)
+    monkeypatch.setattr(binaries, 'get_manifest_path', lambda: str(tmp_path / 'binaries.json'))
+    path = fake_binary(tmp_path / 'tool', 'tool 1.0')
+    assert binaries.resolve('tool', [path], use_path=False) == path
+    assert binaries.get_version('tool') == 'tool 1.0'
+
+    runs = []
+    monkeypatch.setattr(binaries.procengine.engine, 'run', lambda *args, **kwargs: runs.append(args))
+    assert binaries.get_version('tool') == 'tool 1.0'
+    assert runs == []
+
+def test_entry_of_a_binary_that_stopped_working_is_forgotten(tmp_path, monkeypatch):
+    monkeypatch.setattr(binaries, '_manifest', None)
+    monkeypatch.setattr(binaries, 'get_manifest_path', lambda: str(tmp_path / 'binaries.json'))
+    path = tmp_path / 'tool'
+    path.write_text("#!/bin/sh\nexit 1\n")
+    path.chmod(0o755)
+    binaries.resolve('tool', [str(path)], use_path=False)
+
+    assert binaries.get_version('tool') is None
+    assert 'tool' not in binaries._load_manifest()
+
+def test_entry_of_a_changed_binary_is_forgotten(tmp_path, monkeypatch):
+    monkeypatch.setattr(binaries, '_manifest', None)
+    monkeypatch.setattr(binaries, 'get_manifest_path', lambda: str(tmp_path / 'binaries.json'))
+    path = fake_binary(tmp_path / 'tool', 'tool 1.0')
+    binaries.resolve('tool', [path], use_path=False)
+    fake_binary(tmp_path / 'tool', 'tool 2.0 (replaced)')
+
+    assert binaries.get_version('tool') is None
+    assert 'tool' not in binaries._load_manifest()
@@ -0,0 +1,19 @@
+import pytest
+
+from daemon import Daemon, HTTPError
+
+URL = 'https://www.youtube.com/watch?v=aaaaaaaaaaa'
+
+@pytest.mark.parametrize('max_size', [True, False, 0, -1, 1.5, '100'])
+def test_submit_rejects_a_max_size_that_is_not_a_positive_integer(max_size):
+    daemon = Daemon(journal=False)
+    with pytest.raises(HTTPError) as error:
+        daemon.submit({'url': URL, 'max_size': max_size})
+    assert error.value.status == 400
+    assert daemon.queue.jobs() == []
+
+@pytest.mark.parametrize('limit', [True, False])
+def test_set_bandwidth_rejects_a_boolean_limit(limit):
+    with pytest.raises(HTTPError) as error:
+        Daemon.set_bandwidth({'limit': limit})
+    assert error.value.status == 400
@@ -0,0 +1,27 @@
+import debug
+
+def test_follow_log_returns_new_lines_only():
+    debug.log("before following", debug.DEBUG)
+    text, position = debug.follow_log()
+    assert text == ""
+
+    debug.log("first line", debug.DEBUG)
+    debug.log("second line", debug.DEBUG)
+    text, position = debug.follow_log(position)
+    assert "first line" in text and "second line" in text
+    assert "before following" not in text
+
+    text, position = debug.follow_log(position)
+    assert text == ""
+
+def test_follow_log_restarts_on_a_new_file_larger_than_the_old_offset():
+    debug.log("old file", debug.DEBUG)
+    _, position = debug.follow_log()
+    # Keep the old file open so the new one cannot reuse its inode
+    with open(debug.LOG_FILE, 'rb'):
+        debug.clear_logs()
+        for i in range(200):
+            debug.log(f"new file line {i}", debug.DEBUG)
+        text, position = debug.follow_log(position)
+    assert text.splitlines()[0].endswith("All logs cleared")
+    assert "new file line 0" in text and "new file line 199" in text
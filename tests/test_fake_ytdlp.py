@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import audio
+
+FAKE_YTDLP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fake_ytdlp.py')
+URL = 'https://www.youtube.com/watch?v=aaaaaaaaaaa'
+
+def run_stub(*args):
+    return subprocess.run([sys.executable, FAKE_YTDLP, *args], capture_output=True, text=True, check=True,
+                          env={**os.environ, 'BENCH_YTDLP_DURATION': '2', 'BENCH_YTDLP_LINES': '2'})
+
+@pytest.mark.parametrize('audio_format', audio.AUDIO_FORMATS)
+def test_audio_output_has_the_requested_extension(tmp_path, audio_format):
+    """The benchmarks only measure the app's audio path if the stub writes what the app asked for"""
+    info_path = tmp_path / 'info.json'
+    info_path.write_text(run_stub('-j', URL).stdout)
+    plan = audio.plan(json.loads(info_path.read_text()), audio_format)
+
+    run_stub('-f', plan.format_spec, *plan.args, '-o', str(tmp_path / 'out' / '%(title)s [%(id)s].%(ext)s'),
+             '--load-info-json', str(info_path))
+
+    [output] = os.listdir(tmp_path / 'out')
+    assert os.path.splitext(output)[1] == '.' + plan.ext
@@ -0,0 +1,60 @@
+import formats
+
+MB = 1000 * 1000
+
+def video(format_id, height, vcodec, tbr, size, fps=30):
+    return {'format_id': format_id, 'width': height * 16 // 9, 'height': height, 'fps': fps,
+            'vcodec': vcodec, 'acodec': 'none', 'tbr': tbr, 'filesize': size}
+
+def audio(format_id, acodec, abr, size):
+    return {'format_id': format_id, 'vcodec': 'none', 'acodec': acodec, 'abr': abr, 'filesize': size}
+
+INFO = {
+    'duration': 60,
+    'formats': [
+        video('137', 1080, 'avc1.640028', 4000, 40 * MB),
+        video('248', 1080, 'vp9', 2500, 25 * MB),
+        video('136', 720, 'avc1.4d401f', 2000, 20 * MB),
+        video('134', 360, 'avc1.4d401e', 500, 5 * MB),
+        audio('140', 'mp4a.40.2', 128, 2 * MB),
+        audio('251', 'opus', 120, int(1.8 * MB)),
+        {'format_id': '18', 'width': 640, 'height': 360, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2',
+         'tbr': 600, 'filesize': 6 * MB},
+    ],
+}
+
+def test_prefers_the_smaller_codec_of_the_same_quality():
+    selection = formats.select(INFO, 1080)
+    # VP9 at 2500 kbit/s is as good as H.264 at 4000, Opus at 120 better than AAC at 128
+    assert selection.format_ids == '248+251'
+
+def test_height_cap():
+    assert formats.select(INFO, 720).video['format_id'] == '136'
+    assert formats.select(INFO, 480).video['format_id'] == '134'
+
+def test_budget_picks_the_best_pair_that_fits():
+    selection = formats.select(INFO, 1080, max_bytes=24 * MB)
+    assert selection.height == 720
+    assert selection.size <= 24 * MB
+    assert formats.select(INFO, 1080, max_bytes=30 * MB).format_ids == '248+251'
+
+def test_budget_nothing_fits_takes_the_smallest():
+    selection = formats.select(INFO, 1080, max_bytes=1 * MB)
+    assert selection.format_ids == '18'
+
+def test_no_match():
+    assert formats.select(INFO, 144) is None
+    assert formats.select({'formats': [audio('140', 'mp4a.40.2', 128, 2 * MB)]}, 1080) is None
+    # Nothing is plain HTTP
+    assert formats.select(INFO, 1080, direct_only=True) is None
+
+def test_combined_format_without_separate_streams():
+    info = {'formats': [INFO['formats'][-1]]}
+    selection = formats.select(info, 1080)
+    assert selection.format_ids == '18' and selection.audio is None
+
+def test_fallback_spec_keeps_the_budget():
+    assert 'filesize' not in formats.fallback_spec(1080)
+    spec = formats.fallback_spec(1080, max_bytes=50 * MB)
+    assert '[filesize<?45000000]' in spec and '[filesize<?5000000]' in spec
+    assert spec.endswith('/worst')
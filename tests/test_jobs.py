@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+import downloader
+import jobs
+from pacing import TRANSIENT
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(jobs, 'RETRY_BACKOFF', 0.01)
+
+def run_job(fake_download):
+    """Run one video job through a JobQueue with download_video replaced; returns the finished Job"""
+    finished = threading.Event()
+    queue = jobs.JobQueue(workers=1, on_update=lambda job: job.state in jobs.FINISHED_STATES and finished.set())
+    original = downloader.download_video
+    downloader.download_video = fake_download
+    try:
+        job = queue.submit('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+        assert finished.wait(10)
+    finally:
+        downloader.download_video = original
+    return job
+
+def test_restarts_do_not_use_up_attempts(fast_retries):
+    calls = []
+
+    def fake_download(url, job=None, **kwargs):
+        calls.append(len(calls))
+        if len(calls) <= 3:
+            # Restarted by the bandwidth governor or the stall watchdog
+            job.restart_requested = True
+            return 'restarting'
+        job.returncode = 1
+        job.error_class = TRANSIENT
+        return 'failed'
+
+    job = run_job(fake_download)
+    assert job.state == jobs.FAILED
+    assert len(calls) == 3 + jobs.MAX_ATTEMPTS
+
+def test_transient_failure_is_retried(fast_retries):
+    calls = []
+
+    def fake_download(url, job=None, **kwargs):
+        calls.append(len(calls))
+        job.returncode = 0 if len(calls) == jobs.MAX_ATTEMPTS else 1
+        job.error_class = None if job.returncode == 0 else TRANSIENT
+        return 'done'
+
+    job = run_job(fake_download)
+    assert job.state == jobs.DONE
+    assert len(calls) == jobs.MAX_ATTEMPTS
+
+def test_rate_change_goes_to_the_running_engine_instead_of_a_restart():
+    job = jobs.Job('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+    job.state = jobs.DOWNLOADING
+    rates = []
+    job.apply_rate = rates.append
+    job.change_rate(256 * 1024)
+    assert rates == [256 * 1024] and not job.restart_requested
+
+    job.apply_rate = None
+    job.change_rate(512 * 1024)
+    assert job.restart_requested
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+import jobs
+import staging
+from journal import JobJournal, collect_stale_parts
+
+def old_entry(path, is_dir=False):
+    if is_dir:
+        os.makedirs(path)
+        with open(os.path.join(path, 'video.f137.mp4.part'), 'wb') as f:
+            f.write(b'x')
+    else:
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    long_ago = time.time() - 30 * 24 * 3600
+    os.utime(path, (long_ago, long_ago))
+
+def test_stale_parts_of_unfinished_jobs_are_kept(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    paused = jobs.Job('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+    paused.id = journal.add(paused)
+    paused.state = jobs.PAUSED
+    journal.update(paused)
+    done = jobs.Job('https://www.youtube.com/watch?v=bbbbbbbbbbb')
+    done.id = journal.add(done)
+    done.state = jobs.DONE
+    journal.update(done)
+
+    directory = tmp_path / 'staging'
+    directory.mkdir()
+    for job in (paused, done):
+        old_entry(str(directory / staging.job_dir_name(job.id)), is_dir=True)
+    old_entry(str(directory / f'.aaaaaaaaaaa.j{paused.id}.f137.mp4.part'))
+    old_entry(str(directory / f'.bbbbbbbbbbb.j{done.id}.f137.mp4.part'))
+    # Not in the journal at all
+    old_entry(str(directory / 'job-999'), is_dir=True)
+
+    assert collect_stale_parts(journal, str(directory)) == 2
+    assert sorted(os.listdir(directory)) == sorted([
+        staging.job_dir_name(paused.id), f'.aaaaaaaaaaa.j{paused.id}.f137.mp4.part', 'job-999',
+    ])
+    journal.close()
+
+def test_update_does_not_wait_for_sqlite(tmp_path):
+    journal = JobJournal(str(tmp_path / 'jobs.db'))
+    job = jobs.Job('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+    job.id = journal.add(job)
+
+    # Another thread holds the connection for a second, as a slow commit would
+    held = threading.Event()
+
+    def slow_commit():
+        with journal._lock:
+            held.set()
+            time.sleep(1)
+    threading.Thread(target=slow_commit).start()
+    assert held.wait(5)
+
+    started = time.monotonic()
+    for state in (jobs.PROBING, jobs.DOWNLOADING, jobs.DOWNLOADING, jobs.PAUSED):
+        job.state = state
+        journal.update(job)
+    assert time.monotonic() - started < 0.5
+
+    [row] = journal.unfinished()
+    assert row['state'] == jobs.PAUSED
+    journal.close()
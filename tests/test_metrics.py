@@ -0,0 +1,34 @@
+import os
+import pstats
+
+import pytest
+
+import jobs
+from metrics import Metrics, get_profile_dir, parse_profile
+
+def test_profiled_job_leaves_cpu_and_memory_reports(tmp_path):
+    metrics = Metrics(path=str(tmp_path / 'metrics.jsonl'))
+    metrics.enable_profiling(cpu=True, memory=True)
+    job = jobs.Job('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+
+    with metrics.profiled(job):
+        blocks = [bytearray(64 * 1024) for _ in range(16)]
+    del blocks
+
+    base = os.path.join(get_profile_dir(), f"job-{job.id}")
+    assert pstats.Stats(base + '.prof').total_calls > 0
+    with open(base + '-alloc.txt', encoding='utf-8') as f:
+        assert f.readline().startswith("Peak traced memory:")
+
+def test_profiling_is_off_by_default(tmp_path):
+    metrics = Metrics(path=str(tmp_path / 'metrics.jsonl'))
+    job = jobs.Job('https://www.youtube.com/watch?v=aaaaaaaaaaa')
+    with metrics.profiled(job):
+        pass
+    assert not os.path.exists(os.path.join(get_profile_dir(), f"job-{job.id}.prof"))
+
+def test_parse_profile():
+    assert parse_profile('cpu') == ('cpu',)
+    assert parse_profile('cpu, memory') == ('cpu', 'memory')
+    with pytest.raises(ValueError):
+        parse_profile('disk')
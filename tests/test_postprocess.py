@@ -0,0 +1,44 @@
+import os
+import stat
+import sys
+import threading
+
+import jobs
+import postprocess
+
+# Stands in for ffmpeg: copies its -i input to the output path in slow steps
+FAKE_FFMPEG = f"""#!{sys.executable}
+import sys, time
+source, output = sys.argv[sys.argv.index('-i') + 1], sys.argv[-1]
+data = open(source, 'rb').read()
+with open(output, 'wb') as f:
+    for i in range(0, len(data), 1024):
+        f.write(data[i:i + 1024])
+        f.flush()
+        time.sleep(0.01)
+"""
+
+def test_same_name_tasks_run_at_once_keep_their_own_output(tmp_path):
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(FAKE_FFMPEG)
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    output_path = str(tmp_path / 'out' / 'Same title [abc].mp4')
+
+    pool = postprocess.PostProcessPool(workers=2)
+    done = threading.Semaphore(0)
+    tasks = []
+    for n in range(2):
+        source = tmp_path / f'stream{n}.mp4'
+        source.write_bytes(bytes([n]) * 16 * 1024)
+        task = postprocess.Task(str(ffmpeg), [str(source)], ['-c', 'copy'], output_path)
+        tasks.append(task)
+        pool.submit(task, jobs.Job('https://www.youtube.com/watch?v=abc'), on_done=lambda task: done.release())
+    for _ in tasks:
+        assert done.acquire(timeout=30)
+
+    assert [task.returncode for task in tasks] == [0, 0]
+    assert len({task.output_path for task in tasks}) == 2
+    for n, task in enumerate(tasks):
+        with open(task.output_path, 'rb') as f:
+            assert f.read() == bytes([n]) * 16 * 1024
+    assert sorted(os.listdir(tmp_path / 'out')) == ['Same title [abc] (1).mp4', 'Same title [abc].mp4']
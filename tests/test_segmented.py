@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import segmented
+
+PAYLOAD = os.urandom(512 * 1024)
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD, honouring (or, with server.ignore_range, ignoring) Range headers"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        header = self.headers.get('Range')
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', header or '')
+        if match and not self.server.ignore_range:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(PAYLOAD) - 1)
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+        else:
+            start, body = 0, PAYLOAD
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        with self.server.lock:
+            self.server.requests.append((header, len(body)))
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.daemon_threads = True
+    httpd.ignore_range = False
+    httpd.requests = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(segmented, 'MIN_SEGMENT_SIZE', 64 * 1024)
+    monkeypatch.setattr(segmented, 'READ_SIZE', 16 * 1024)
+
+def url_of(server):
+    return f'http://127.0.0.1:{server.server_address[1]}/media'
+
+def served_bytes(server):
+    # Minus the one-byte range probe
+    return sum(size for header, size in server.requests if header != 'bytes=0-0')
+
+def test_split_ranges_cover_the_file():
+    ranges = segmented.split_ranges(1000 * 1024, 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0 and ranges[-1][1] == 1000 * 1024 - 1
+    assert all(a[1] + 1 == b[0] for a, b in zip(ranges, ranges[1:]))
+
+def test_split_ranges_small_file_uses_one_segment():
+    assert segmented.split_ranges(1000, 4) == [[0, 999]]
+
+def test_segmented_download(server, tmp_path):
+    dest = str(tmp_path / 'video.mp4')
+    assert segmented.download(url_of(server), dest, segments=4) == dest
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+    ranges = [header for header, _ in server.requests if header != 'bytes=0-0']
+    assert len(ranges) == 4
+    assert served_bytes(server) == len(PAYLOAD)
+    assert not os.path.exists(dest + '.part') and not os.path.exists(dest + '.segments.json')
+
+def test_resume_fetches_only_missing_bytes(server, tmp_path):
+    dest = str(tmp_path / 'video.mp4')
+    progress = []
+
+    def stop_halfway():
+        return bool(progress) and progress[-1] >= len(PAYLOAD) // 2
+
+    with pytest.raises(segmented.DownloadStopped):
+        segmented.download(url_of(server), dest, segments=4,
+                           progress_callback=lambda done, total: progress.append(done), should_stop=stop_halfway)
+    assert os.path.exists(dest + '.part') and os.path.exists(dest + '.segments.json')
+    first_run = served_bytes(server)
+    del server.requests[:]
+
+    fetch = segmented.SegmentedDownload(url_of(server), dest, segments=4)
+    fetch.run()
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert fetch.resumed > 0
+    assert served_bytes(server) == len(PAYLOAD) - fetch.resumed
+    assert first_run >= fetch.resumed
+
+def test_server_without_range_support(server, tmp_path):
+    server.ignore_range = True
+    dest = str(tmp_path / 'video.mp4')
+    segmented.download(url_of(server), dest, segments=4)
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+    # The probe and one plain GET
+    assert len(server.requests) == 2
+    assert all(size == len(PAYLOAD) for _, size in server.requests)
+
+def test_limiter_caps_the_rate_of_all_segments(server, tmp_path):
+    dest = str(tmp_path / 'video.mp4')
+    limiter = segmented.RateLimiter(1024 * 1024)
+    started = time.monotonic()
+    segmented.download(url_of(server), dest, segments=4, limiter=limiter)
+    # 512 KiB at 1 MiB/s, less the first read of each segment
+    assert time.monotonic() - started >= 0.4
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+
+def test_limiter_takes_a_new_rate_while_downloading(server, tmp_path):
+    dest = str(tmp_path / 'video.mp4')
+    limiter = segmented.RateLimiter(64 * 1024)
+
+    def on_progress(done, total):
+        if done >= len(PAYLOAD) // 8:
+            limiter.set_rate(None)
+
+    started = time.monotonic()
+    segmented.download(url_of(server), dest, segments=4, limiter=limiter, progress_callback=on_progress)
+    # All of it at 64 KiB/s would take 8 s
+    assert time.monotonic() - started < 4
@@ -0,0 +1,38 @@
+import sys
+
+import pytest
+
+import downloader
+import progress
+import watchdog
+
+# Downloads a little, then goes quiet in one of yt-dlp's ffmpeg post-processors
+YTDLP_RUN = f"""
+import json, sys, time
+for n in range(1, 4):
+    print({progress.RECORD_PREFIX!r} + json.dumps({{'status': 'downloading', 'downloaded_bytes': n * 1024,
+                                                    'total_bytes': 4096, 'speed': 1024.0}}), flush=True)
+print({progress.RECORD_PREFIX!r} + json.dumps({{'status': 'finished', 'downloaded_bytes': 4096,
+                                                'total_bytes': 4096}}), flush=True)
+print(sys.argv[1] + ' Destination: video.mp4', flush=True)
+time.sleep(1.5)
+"""
+
+@pytest.fixture
+def impatient_watchdog(monkeypatch):
+    monkeypatch.setattr(watchdog, 'INACTIVITY_TIMEOUT', 0.5)
+    monkeypatch.setattr(watchdog, 'CHECK_INTERVAL', 0.1)
+
+@pytest.mark.parametrize('tag', ['[VideoRemuxer]', '[FixupM4a]', '[Merger]'])
+def test_silent_post_processing_is_not_a_stall(impatient_watchdog, tag):
+    assert downloader.run_with_progress([sys.executable, '-c', YTDLP_RUN, tag], "VIDEO") == 0
+
+def test_silent_download_is_a_stall(impatient_watchdog):
+    assert downloader.run_with_progress([sys.executable, '-c', YTDLP_RUN, '[download]'], "VIDEO") != 0
+
+def test_resumed_monitor_judges_the_next_file_afresh():
+    monitor = watchdog.Monitor(on_stall=None)
+    monitor.suspend()
+    assert monitor.check(monitor.last_activity + watchdog.INACTIVITY_TIMEOUT * 2) is None
+    monitor.resume()
+    assert monitor.check(monitor.last_activity + watchdog.INACTIVITY_TIMEOUT * 2) == watchdog.INACTIVE
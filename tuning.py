@@ -0,0 +1,181 @@
+import json
+import os
+import random
+import threading
+import time
+from debug import get_app_dir, log
+
+# Candidate settings per kind of format. Plain HTTP downloads are one
+# connection, so only the chunk size matters; fragmented (DASH/HLS) formats
+# benefit from fetching several fragments at once.
+FRAGMENT_LEVELS = (1, 2, 4, 8)
+CHUNK_SIZES = ('5M', '10M', '20M')
+DEFAULT_FRAGMENTS = 1
+DEFAULT_CHUNK_SIZE = '10M'
+
+# Weight of a new measurement in the running throughput average
+EWMA_ALPHA = 0.3
+# Chance to try a neighbour of the best known setting
+EXPLORE_RATE = 0.2
+# Ignore downloads shorter than this; their throughput is mostly latency
+MIN_SAMPLE_SECONDS = 3.0
+
+def get_tuning_path():
+    return os.path.join(get_app_dir(), 'tuning.json')
+
+def get_network_type():
+    """'wifi', 'mobile', 'ethernet' on Android, 'default' elsewhere"""
+    try:
+        from jnius import autoclass
+        PythonActivity = autoclass('org.kivy.android.PythonActivity')
+        Context = autoclass('android.content.Context')
+        ConnectivityManager = autoclass('android.net.ConnectivityManager')
+        manager = PythonActivity.mActivity.getSystemService(Context.CONNECTIVITY_SERVICE)
+        info = manager.getActiveNetworkInfo()
+        if info is None:
+            return 'default'
+        return {
+            ConnectivityManager.TYPE_WIFI: 'wifi',
+            ConnectivityManager.TYPE_MOBILE: 'mobile',
+            ConnectivityManager.TYPE_ETHERNET: 'ethernet',
+        }.get(info.getType(), 'default')
+    except Exception:
+        return 'default'
+
+def format_kind(info, max_height=None):
+    """'hls', 'dash' or 'http' for the video format yt-dlp is likely to pick"""
+    if not info:
+        return 'http'
+    best = None
+    for f in info.get("formats") or []:
+        height = f.get("height")
+        if f.get("vcodec") in (None, "none") or not height:
+            continue
+        if max_height and height > max_height:
+            continue
+        if best is None or height > best.get("height", 0):
+            best = f
+    protocol = (best or {}).get("protocol") or ''
+    if 'm3u8' in protocol:
+        return 'hls'
+    if 'dash' in protocol or (best or {}).get("fragments"):
+        return 'dash'
+    return 'http'
+
+class Settings:
+    """One combination of yt-dlp transfer settings"""
+
+    def __init__(self, network, kind, fragments=DEFAULT_FRAGMENTS, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.network = network
+        self.kind = kind
+        self.fragments = fragments
+        self.chunk_size = chunk_size
+
+    @property
+    def key(self):
+        return f"{self.fragments}x{self.chunk_size}"
+
+    def yt_dlp_args(self):
+        args = ["--http-chunk-size", self.chunk_size]
+        if self.fragments > 1:
+            args += ["--concurrent-fragments", str(self.fragments)]
+        return args
+
+class ThroughputMeter:
+    """Measures achieved bytes/s from the progress records of one download.
+
+    downloaded_bytes restarts from zero for every file (video, then audio),
+    so only increases are counted.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.started = None
+        self.last_time = None
+        self._last_bytes = 0
+
+    def update(self, downloaded_bytes):
+        if downloaded_bytes is None:
+            return
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        if downloaded_bytes >= self._last_bytes:
+            self.total += downloaded_bytes - self._last_bytes
+        self._last_bytes = downloaded_bytes
+        self.last_time = now
+
+    def throughput(self):
+        """Mean bytes/s, or None if the download was too short to judge"""
+        if self.started is None or self.last_time - self.started < MIN_SAMPLE_SECONDS:
+            return None
+        return self.total / (self.last_time - self.started)
+
+class Tuner:
+    """Picks transfer settings per (network type, format kind) from past throughput"""
+
+    def __init__(self, path=None):
+        self.path = path or get_tuning_path()
+        self._lock = threading.Lock()
+        self._stats = None
+
+    def _load(self):
+        if self._stats is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._stats = json.load(f)
+            except Exception:
+                self._stats = {}
+        return self._stats
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stats, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log(f"Could not save tuning data: {e}")
+
+    def candidates(self, network, kind):
+        if kind == 'http':
+            return [Settings(network, kind, 1, size) for size in CHUNK_SIZES]
+        return [Settings(network, kind, level, DEFAULT_CHUNK_SIZE) for level in FRAGMENT_LEVELS]
+
+    def choose(self, kind, network=None):
+        """Settings for the next download: the best known, sometimes a neighbour of it"""
+        network = network or get_network_type()
+        options = self.candidates(network, kind)
+        with self._lock:
+            stats = self._load().get(f"{network}:{kind}", {})
+        scored = [(stats[o.key]["speed"], i) for i, o in enumerate(options) if o.key in stats]
+        if not scored:
+            return Settings(network, kind)
+
+        best = max(scored)[1]
+        neighbours = [i for i in (best - 1, best + 1) if 0 <= i < len(options)]
+        untried = [i for i in neighbours if options[i].key not in stats]
+        if untried:
+            return options[untried[0]]
+        if neighbours and random.random() < EXPLORE_RATE:
+            return options[random.choice(neighbours)]
+        return options[best]
+
+    def record(self, settings, throughput):
+        """Remember the throughput achieved with settings"""
+        if not throughput:
+            return
+        with self._lock:
+            group = self._load().setdefault(f"{settings.network}:{settings.kind}", {})
+            entry = group.get(settings.key)
+            if entry is None:
+                group[settings.key] = {"speed": throughput, "samples": 1}
+            else:
+                entry["speed"] = (1 - EWMA_ALPHA) * entry["speed"] + EWMA_ALPHA * throughput
+                entry["samples"] += 1
+            self._save()
+        log(f"Tuning {settings.network}/{settings.kind} {settings.key}: {throughput / 1024:.0f} KiB/s")
+
+# Shared tuner for all downloads
+tuner = Tuner()
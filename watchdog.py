@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+from debug import log
+
+# A download is restarted when its speed stays below SLOW_FRACTION of the
+# job's peak speed for SLOW_WINDOW seconds
+SLOW_FRACTION = 0.15
+SLOW_WINDOW = 30.0
+# Speed is measured over this many seconds of progress records
+RATE_WINDOW = 5.0
+# Speed is not judged during the first seconds of a run (connection setup)
+WARMUP = 10.0
+# A run that prints nothing at all for this long is killed
+INACTIVITY_TIMEOUT = 120.0
+# Stall restarts per job; after that slow runs are left alone and an
+# inactive run fails (and goes through the normal retry logic)
+MAX_STALL_RESTARTS = 5
+CHECK_INTERVAL = 2.0
+
+# Why a run was stopped
+SLOW = 'slow'
+INACTIVE = 'inactive'
+
+class Monitor:
+    """Speed and activity of one running download, fed from its output"""
+
+    def __init__(self, on_stall, peak=0.0, restarts_left=MAX_STALL_RESTARTS):
+        self.on_stall = on_stall
+        self.peak = peak
+        self.restarts_left = restarts_left
+        self.started = time.monotonic()
+        self.last_activity = self.started
+        self.last_progress = self.started
+        self.slow_since = None
+        self.suspended = False
+        self.fired = None
+        self._samples = deque()
+        self._total = 0
+        self._last_bytes = 0
+
+    def activity(self):
+        """Any output from the process"""
+        self.last_activity = time.monotonic()
+
+    def progress(self, downloaded_bytes, finished=False):
+        """A progress record; downloaded_bytes restarts from zero for every file"""
+        now = time.monotonic()
+        self.last_activity = now
+        self.last_progress = now
+        if finished:
+            # The next file starts with a new connection; judge it afresh
+            self._samples.clear()
+            self._last_bytes = 0
+            self.slow_since = None
+            return
+        if downloaded_bytes is None:
+            return
+        if downloaded_bytes >= self._last_bytes:
+            self._total += downloaded_bytes - self._last_bytes
+        self._last_bytes = downloaded_bytes
+        self._samples.append((now, self._total))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= RATE_WINDOW:
+            self._samples.popleft()
+
+    @property
+    def downloaded_bytes(self):
+        """Bytes received over all files of the run"""
+        return self._total
+
+    def rate(self):
+        """Bytes/s over the last RATE_WINDOW seconds, or None before there is enough data"""
+        if len(self._samples) < 2:
+            return None
+        (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        if t1 - t0 < RATE_WINDOW / 2:
+            return None
+        return (b1 - b0) / (t1 - t0)
+
+    def suspend(self):
+        """Stop judging this run (yt-dlp moved on to merging, remuxing or a fixup)"""
+        self.suspended = True
+
+    def resume(self):
+        """Judge the run again, afresh (yt-dlp started downloading the next file)"""
+        now = time.monotonic()
+        self.suspended = False
+        self.started = now
+        self.last_progress = now
+        self.slow_since = None
+        self._samples.clear()
+        self._last_bytes = 0
+
+    def check(self, now):
+        """Return SLOW or INACTIVE if the run should be stopped, else None"""
+        if self.suspended or self.fired:
+            return None
+        if now - self.last_activity >= INACTIVITY_TIMEOUT:
+            return INACTIVE
+        rate = self.rate()
+        if rate is None or now - self.started < WARMUP:
+            return None
+        if now - self.last_progress >= RATE_WINDOW:
+            # No progress records lately: nothing is arriving at all
+            rate = 0.0
+        self.peak = max(self.peak, rate)
+        if rate >= self.peak * SLOW_FRACTION or self.restarts_left <= 0:
+            self.slow_since = None
+            return None
+        if self.slow_since is None:
+            self.slow_since = now
+        if now - self.slow_since >= SLOW_WINDOW:
+            return SLOW
+        return None
+
+class StallWatchdog:
+    """Watches all running downloads from one thread and stops the ones that stall.
+
+    Each run gets a Monitor fed from its progress stream. When a run is
+    stuck far below the job's peak speed, or prints nothing for
+    INACTIVITY_TIMEOUT, its on_stall(reason) callback is called; the
+    caller kills the process and restarts it from the partial file.
+    """
+
+    def __init__(self):
+        self._monitors = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, on_stall, peak=0.0, restarts_left=MAX_STALL_RESTARTS):
+        monitor = Monitor(on_stall, peak, restarts_left)
+        with self._lock:
+            self._monitors.add(monitor)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, daemon=True)
+                self._thread.start()
+        return monitor
+
+    def unwatch(self, monitor):
+        with self._lock:
+            self._monitors.discard(monitor)
+
+    def _watch(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            with self._lock:
+                if not self._monitors:
+                    self._thread = None
+                    return
+                monitors = list(self._monitors)
+            now = time.monotonic()
+            for monitor in monitors:
+                reason = monitor.check(now)
+                if reason is None:
+                    continue
+                monitor.fired = reason
+                rate = monitor.rate() or 0.0
+                log(f"Download stalled ({reason}): {rate / 1024:.0f} KiB/s, peak {monitor.peak / 1024:.0f} KiB/s")
+                try:
+                    monitor.on_stall(reason)
+                except Exception as e:
+                    log(f"Stall callback failed: {e}")
+
+# Shared watchdog for all downloads
+watchdog = StallWatchdog()